@@ -0,0 +1,10 @@
+"""Performance tooling for pharmacy_core.
+
+    python -m benchmarks.run --scales 10000 100000        # time backend operations
+    python -m benchmarks.run --compare baseline.json      # ...and compare to an earlier run
+    python -m benchmarks.load --terminals 16 --duration 30  # concurrent POS terminals
+
+Data comes from benchmarks.datagen, a deterministic synthetic data generator.
+By default everything runs on the embedded SQLite engine, so no SQL Server is
+needed; pass --config to benchmark against the server a pharmacy.ini points at.
+"""
@@ -0,0 +1,184 @@
+"""Deterministic synthetic pharmacy data.
+
+populate() bulk-loads suppliers, medicines, customers, cashiers, `scale` sales
+spread over several years (with their items), returns, stock adjustments and
+activity log rows into an EMPTY database created from pharmacy.sql or by the
+SQLite engine. The same (scale, seed, as_of) always produces the same rows.
+Identity columns are left to the database, which numbers them 1, 2, 3, ...
+in an empty database, so the generator can refer to the rows it has written.
+"""
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+BATCH_SIZE = 10000
+
+CATEGORIES = ('Analgesic', 'Antibiotic', 'Antihistamine', 'Antacid', 'Antiseptic', 'Cardio',
+              'Dermatology', 'Diabetes', 'Respiratory', 'Supplement', 'Vitamin', 'Ophthalmic')
+NAME_PARTS = ('Amoxi', 'Cetiri', 'Parace', 'Ibupro', 'Metfor', 'Atorva', 'Omepra', 'Lorata',
+              'Azithro', 'Cipro', 'Doxy', 'Losar', 'Amlo', 'Simva', 'Panto', 'Salbu')
+NAME_SUFFIXES = ('cillin', 'zine', 'tamol', 'fen', 'min', 'statin', 'zole', 'dine', 'mycin',
+                 'floxacin', 'cycline', 'tan', 'dipine', 'prazole', 'tamol', 'mol')
+RETURN_REASONS = ('Damaged packaging', 'Wrong item', 'Expired', 'Customer changed mind', '')
+CASHIERS = ('cashier1', 'cashier2', 'cashier3', 'cashier4', 'cashier5')
+BENCH_MEDICINES = 10            # medicines 1..10 get effectively unlimited stock for write benchmarks
+TAX_RATE = 8.5                  # the default in both schemas
+
+
+def sizes(scale):
+    """Row counts for a given number of sales."""
+    return {
+        'sales': scale,
+        'suppliers': max(20, scale // 2000),
+        'medicines': max(200, scale // 50),
+        'customers': max(100, scale // 10),
+        'adjustments': scale // 5,
+        'activity': scale // 10,
+    }
+
+
+class _Writer:
+    # Buffers rows per statement and flushes them with executemany
+    def __init__(self, conn, sqlite):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        if not sqlite:
+            self.cursor.fast_executemany = True
+        self.sqlite = sqlite
+        self.pending = {}
+
+    def timestamp(self, value):
+        # SQLite stores the engine's text format; pyodbc binds datetime objects
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if self.sqlite else value
+
+    def add(self, sql, row):
+        rows = self.pending.setdefault(sql, [])
+        rows.append(row)
+        if len(rows) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        # Statements flush in first-use order (Sales before SaleItems) so foreign keys hold
+        for sql, rows in list(self.pending.items()):
+            if rows:
+                self.cursor.executemany(sql, rows)
+        self.pending.clear()
+
+
+def populate(conn, scale, seed=42, as_of=None, years=3, sqlite=True):
+    """Fill an empty database through the DB-API connection `conn` and return a
+    manifest describing what was generated (counts and ids the benchmarks use)."""
+    rng = random.Random(seed)
+    as_of = (as_of or datetime.now()).replace(microsecond=0)
+    counts = sizes(scale)
+    cur = conn.cursor()
+    for table in ('Medicines', 'Sales', 'Customers', 'Suppliers'):
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        if cur.fetchone()[0]:
+            raise ValueError(f'{table} is not empty; populate() needs a freshly created database')
+    w = _Writer(conn, sqlite)
+    start = as_of - timedelta(days=365 * years)
+    span = (as_of - start).total_seconds()
+
+    for username in CASHIERS:
+        w.add("INSERT INTO Users (Username, FullName, PasswordHash, Role, Active, Email, Phone) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?)",
+              (username, username.title(), 'cashier123', 'cashier', 1, f'{username}@example.com', ''))
+
+    for i in range(1, counts['suppliers'] + 1):
+        w.add("INSERT INTO Suppliers (Name, Company, Phone, Email, Active, CreatedDate) VALUES (?, ?, ?, ?, ?, ?)",
+              (f'Supplier {i:05d}', f'Pharma Co {i % 97}', f'800{i:07d}', f'orders{i}@supplier.example',
+               1 if rng.random() > 0.1 else 0, w.timestamp(start)))
+
+    prices = [0.0]
+    for i in range(1, counts['medicines'] + 1):
+        name = f'{rng.choice(NAME_PARTS)}{rng.choice(NAME_SUFFIXES)} {rng.choice((5, 10, 20, 50, 100, 250, 500))}mg #{i:06d}'
+        price = round(rng.uniform(0.5, 120), 2)
+        prices.append(price)
+        min_stock = rng.randint(5, 50)
+        qty = 10 ** 9 if i <= BENCH_MEDICINES else rng.randint(0, 500)
+        status = 'out of stock' if qty <= 0 else 'low stock' if qty < min_stock else 'ok'
+        w.add("INSERT INTO Medicines (Name, Category, Quantity, Price, MinimumStock, Status, SupplierID, CreatedDate) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (name, rng.choice(CATEGORIES), qty, price, min_stock, status,
+               rng.randint(1, counts['suppliers']), w.timestamp(start)))
+
+    for i in range(1, counts['customers'] + 1):
+        w.add("INSERT INTO Customers (Name, Phone, Email, CreatedDate) VALUES (?, ?, ?, ?)",
+              (f'Customer {i:07d}', f'555{i:07d}', f'customer{i}@example.com',
+               w.timestamp(start + timedelta(seconds=span * i / (counts['customers'] + 1)))))
+    w.flush()
+
+    # Sales in time order; the last 1% fall on the as_of day so "today" views have data
+    returnable = []
+    returns = 0
+    today = as_of.replace(hour=0, minute=0, second=0)
+    today_sales = max(20, scale // 100)
+    for sale_id in range(1, scale + 1):
+        if sale_id > scale - today_sales:
+            ts = today + timedelta(seconds=(as_of - today).total_seconds() * (sale_id - scale + today_sales) / (today_sales + 1))
+        else:
+            ts = start + timedelta(seconds=span * sale_id / (scale + 1))
+        user = rng.choice(CASHIERS)
+        customer = rng.randint(1, counts['customers']) if rng.random() < 0.4 else None
+        lines = {}
+        for _ in range(rng.choice((1, 1, 2, 2, 3, 4, 5))):
+            lines[rng.randint(1, counts['medicines'])] = rng.randint(1, 4)
+        subtotal = round(sum(qty * prices[mid] for mid, qty in lines.items()), 2)
+        tax = round(subtotal * TAX_RATE / 100, 2)
+        w.add("INSERT INTO Sales (CustomerID, Subtotal, Tax, Total, [Timestamp], UserName) VALUES (?, ?, ?, ?, ?, ?)",
+              (customer, subtotal, tax, round(subtotal + tax, 2), w.timestamp(ts), user))
+        for mid, qty in lines.items():
+            w.add("INSERT INTO SaleItems (SaleID, MedicineID, Quantity, Price) VALUES (?, ?, ?, ?)",
+                  (sale_id, mid, qty, prices[mid]))
+        mid, qty = next(iter(lines.items()))
+        if rng.random() < 0.02:
+            returns += 1
+            back = rng.randint(1, qty)
+            w.add("INSERT INTO Returns (MedicineID, Quantity, UnitPrice, Amount, SaleID, CustomerID, Reason, [Timestamp], UserName) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                  (mid, back, prices[mid], round(back * prices[mid], 2), sale_id, customer,
+                   rng.choice(RETURN_REASONS), w.timestamp(ts + timedelta(hours=rng.randint(1, 72))), user))
+        elif sale_id > scale - 500:
+            # Recent, untouched sale lines the add_return benchmark can return against
+            returnable.append((sale_id, mid, qty, customer))
+
+    for i in range(counts['adjustments']):
+        mid = rng.randint(1, counts['medicines'])
+        old = rng.randint(0, 400)
+        change = rng.randint(10, 200)
+        w.add("INSERT INTO StockAdjustments (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName, [Timestamp]) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (mid, old, old + change, change, rng.randint(1, counts['suppliers']), 'Restock delivery',
+               rng.choice(CASHIERS), w.timestamp(start + timedelta(seconds=span * i / (counts['adjustments'] + 1)))))
+
+    for i in range(counts['activity']):
+        w.add("INSERT INTO ActivityLog (UserName, Action, LogTime) VALUES (?, ?, ?)",
+              (rng.choice(CASHIERS), f'Sale {rng.randint(1, scale)} created',
+               w.timestamp(start + timedelta(seconds=span * i / (counts['activity'] + 1)))))
+    w.flush()
+    conn.commit()
+
+    counts['returns'] = returns
+    return {
+        'scale': scale,
+        'seed': seed,
+        'as_of': as_of.isoformat(),
+        'counts': counts,
+        'bench_medicines': [str(i) for i in range(1, BENCH_MEDICINES + 1)],
+        'returnable': returnable,
+        'search_terms': ['amoxi', 'statin', 'mg #00', '250mg', 'zzz-no-match'],
+    }
+
+
+def populate_sqlite(path, scale, seed=42, as_of=None, years=3):
+    """Create the SQLite engine's schema at `path` and populate it."""
+    from pharmacy_core.sqlite_engine import connect_sqlite
+    connect_sqlite(path).close()
+    conn = sqlite3.connect(path)
+    try:
+        # Bulk load without fsyncs; the finished file is checkpointed on close
+        conn.execute("PRAGMA synchronous = OFF")
+        return populate(conn, scale, seed=seed, as_of=as_of, years=years, sqlite=True)
+    finally:
+        conn.close()
@@ -0,0 +1,311 @@
+"""Simulate N point-of-sale terminals hitting one database at the same time.
+
+    python -m benchmarks.load [--terminals 8] [--duration 10] [--scale 10000]
+                              [--mix browse=30,search=20,sale=35,return=5,stock_in=10]
+                              [--hot 20] [--shared-backend] [--output load.json] [--config pharmacy.ini]
+
+Each terminal is a thread with its own PharmacyBackend and connection (with
+--shared-backend all threads drive one backend, which gives each thread its
+own connection), picking operations at random according to --mix: browse (a
+page of medicines), search, sale (create_sale of 1-3 lines), return (one unit
+of a line this terminal sold) and stock_in (apply_stock_delta). Sales and
+stock-ins are drawn from the first --hot medicines so terminals contend for
+the same rows.
+
+The report gives throughput, p50/p95/p99 latency per operation, sales rejected
+for insufficient stock, errors, and the transaction runner's retries,
+deadlocks and lock timeouts. Afterwards the stock invariants are checked:
+no quantity is negative, every quantity equals its starting value plus the
+stock adjustments recorded during the run, that ledger matches what the
+terminals report having sold, returned and received, and each new sale's
+subtotal matches its lines. The exit status is 1 when an invariant fails.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from .run import _percentile, prepare_dataset
+
+DEFAULT_MIX = 'browse=30,search=20,sale=35,return=5,stock_in=10'
+OPERATIONS = ('browse', 'search', 'sale', 'return', 'stock_in')
+
+
+def parse_mix(text):
+    """'browse=30,sale=70' -> {'browse': 30.0, 'sale': 70.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f'unknown operation {name!r} (choose from {", ".join(OPERATIONS)})')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('the mix needs at least one operation with a positive weight')
+    return mix
+
+
+class Terminal(threading.Thread):
+    """One simulated cashier running operations until the deadline."""
+
+    def __init__(self, index, config, manifest, mix, deadline, hot, seed, start_gate, shared=None):
+        super().__init__(name=f'terminal-{index}', daemon=True)
+        self.config = config
+        self.shared = shared                     # one PharmacyBackend used by every terminal thread
+        self.manifest = manifest
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.deadline = deadline
+        self.hot = [str(i) for i in range(1, hot + 1)]
+        self.rng = random.Random(seed * 1000 + index)
+        self.user = f'cashier{index % 5 + 1}'
+        self.start_gate = start_gate
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)     # op -> {'ok', 'rejected', 'error'}
+        self.errors = Counter()
+        self.stock = Counter()                   # medicine id -> net quantity change this terminal caused
+        self.sold_lines = []                     # [sale_id, medicine_id, remaining quantity]
+        self.txn_stats = {}
+        self.crash = None
+
+    def run(self):
+        from pharmacy_core import PharmacyBackend
+        try:
+            backend = self.shared or PharmacyBackend(self.config).connect()
+            self.start_gate.wait()
+            while time.monotonic() < self.deadline:
+                op = self.rng.choices(self.names, self.weights)[0]
+                if op == 'return' and not any(line[2] for line in self.sold_lines):
+                    op = 'browse'
+                started = time.perf_counter()
+                outcome = getattr(self, '_' + op)(backend)
+                self.latencies[op].append((time.perf_counter() - started) * 1000.0)
+                self.outcomes[op][outcome] += 1
+            if self.shared is None:
+                self.txn_stats = backend.get_transaction_stats()
+            else:
+                backend.release_thread_connection()
+        except Exception as e:
+            self.crash = e
+
+    def _failed(self, op, error):
+        if error and 'insufficient stock' in str(error).lower():
+            return 'rejected'
+        self.errors[f'{op}: {error}'] += 1
+        return 'error'
+
+    def _browse(self, backend):
+        rows, _ = backend.get_medicines_page(offset=self.rng.randrange(0, 10) * 100, sort='Name')
+        return 'ok' if rows is not None else self._failed('browse', 'no page')
+
+    def _search(self, backend):
+        backend.search_medicines(self.rng.choice(self.manifest['search_terms']))
+        return 'ok'
+
+    def _sale(self, backend):
+        lines = {mid: self.rng.randint(1, 3) for mid in self.rng.sample(self.hot, self.rng.randint(1, 3))}
+        items = [{'medicine_id': mid, 'quantity': qty, 'price': 1.0} for mid, qty in lines.items()]
+        sale_id, result = backend.create_sale(None, items, user=self.user)
+        if sale_id is None:
+            return self._failed('sale', result)
+        for mid, qty in lines.items():
+            self.stock[mid] -= qty
+            self.sold_lines.append([sale_id, mid, qty])
+        return 'ok'
+
+    def _return(self, backend):
+        line = self.rng.choice([line for line in self.sold_lines if line[2]])
+        return_id, error = backend.add_return(line[1], 1, sale_id=line[0], reason='load test', user=self.user)
+        if error:
+            return self._failed('return', error)
+        line[2] -= 1
+        self.stock[line[1]] += 1
+        return 'ok'
+
+    def _stock_in(self, backend):
+        mid = self.rng.choice(self.hot)
+        qty = self.rng.randint(1, 20)
+        result, error = backend.apply_stock_delta(mid, qty, reason='load test', user=self.user)
+        if error:
+            return self._failed('stock_in', error)
+        self.stock[mid] += qty
+        return 'ok'
+
+
+def _snapshot(config):
+    # Quantities and the high-water marks of the ledger tables, read with plain SQL
+    from pharmacy_core import connect_database
+    conn = connect_database(config)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MedicineID, Quantity FROM Medicines")
+        quantities = {str(r[0]): int(r[1] or 0) for r in cur.fetchall()}
+        cur.execute("SELECT COALESCE(MAX(AdjustmentID), 0) FROM StockAdjustments")
+        last_adjustment = int(cur.fetchone()[0])
+        cur.execute("SELECT COALESCE(MAX(SaleID), 0) FROM Sales")
+        last_sale = int(cur.fetchone()[0])
+        return quantities, last_adjustment, last_sale
+    finally:
+        conn.close()
+
+
+def check_invariants(config, before, terminals):
+    """Return a list of (name, passed, detail)."""
+    from pharmacy_core import connect_database
+    quantities, last_adjustment, last_sale = before
+    after, _, _ = _snapshot(config)
+    conn = connect_database(config)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MedicineID, SUM(ChangeQty) FROM StockAdjustments WHERE AdjustmentID > ? "
+                    "GROUP BY MedicineID", last_adjustment)
+        ledger = {str(r[0]): int(r[1] or 0) for r in cur.fetchall()}
+        cur.execute("SELECT s.SaleID FROM Sales s "
+                    "LEFT JOIN (SELECT SaleID, SUM(Quantity * Price) AS LineTotal FROM SaleItems GROUP BY SaleID) i "
+                    "ON i.SaleID = s.SaleID "
+                    "WHERE s.SaleID > ? AND ABS(s.Subtotal - COALESCE(i.LineTotal, 0)) > 0.01", last_sale)
+        bad_totals = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT COUNT(*) FROM Sales WHERE SaleID > ?", last_sale)
+        new_sales = int(cur.fetchone()[0])
+    finally:
+        conn.close()
+
+    reported = Counter()
+    for t in terminals:
+        reported.update(t.stock)
+    sales_ok = sum(t.outcomes['sale']['ok'] for t in terminals)
+    negative = [mid for mid, qty in after.items() if qty < 0]
+    drift = [mid for mid in after if after[mid] != quantities.get(mid, 0) + ledger.get(mid, 0)]
+    mismatch = [mid for mid in set(ledger) | set(reported) if ledger.get(mid, 0) != reported.get(mid, 0)]
+    return [
+        ('no negative stock', not negative, f'{len(negative)} negative' if negative else f'{len(after)} medicines'),
+        ('quantity = start + ledger', not drift, f'drift on {drift[:10]}' if drift else 'all medicines'),
+        ('ledger = terminal tally', not mismatch, f'differs on {sorted(mismatch)[:10]}' if mismatch else
+         f'{sum(abs(v) for v in ledger.values())} units moved'),
+        ('one row per sale', new_sales == sales_ok, f'{new_sales} rows for {sales_ok} successful sales'),
+        ('sale subtotal = its lines', not bad_totals, f'wrong on {bad_totals[:10]}' if bad_totals else
+         f'{new_sales} sales'),
+    ]
+
+
+def summarize(terminals, elapsed, invariants, txn_stats=None):
+    # txn_stats: the get_transaction_stats() dicts to add up (default: one per terminal)
+    ops = {}
+    for op in OPERATIONS:
+        times = [ms for t in terminals for ms in t.latencies.get(op, ())]
+        if not times:
+            continue
+        outcomes = Counter()
+        for t in terminals:
+            outcomes.update(t.outcomes[op])
+        ops[op] = {
+            'count': len(times),
+            'ok': outcomes['ok'],
+            'rejected': outcomes['rejected'],
+            'errors': outcomes['error'],
+            'p50_ms': round(_percentile(times, 50), 3),
+            'p95_ms': round(_percentile(times, 95), 3),
+            'p99_ms': round(_percentile(times, 99), 3),
+        }
+    txn = Counter()
+    for per_label in (txn_stats if txn_stats is not None else [t.txn_stats for t in terminals]):
+        for stats in per_label.values():
+            txn.update({k: v for k, v in stats.items() if k != 'calls'})
+    errors = Counter()
+    for t in terminals:
+        errors.update(t.errors)
+    total = sum(o['count'] for o in ops.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'operations': total,
+        'throughput_ops_s': round(total / elapsed, 1) if elapsed else 0.0,
+        'ops': ops,
+        'transactions': dict(txn),
+        'errors': dict(errors.most_common(20)),
+        'crashed_terminals': [f'{t.name}: {t.crash!r}' for t in terminals if t.crash],
+        'invariants': [{'name': n, 'passed': p, 'detail': d} for n, p, d in invariants],
+    }
+
+
+def _print_report(report, terminals):
+    print(f"{terminals} terminals, {report['elapsed_s']:.1f} s, {report['operations']} operations, "
+          f"{report['throughput_ops_s']} ops/s")
+    print(f"  {'op':<10}{'count':>8}{'ok':>8}{'rejected':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, o in report['ops'].items():
+        print(f"  {op:<10}{o['count']:>8}{o['ok']:>8}{o['rejected']:>10}{o['errors']:>8}"
+              f"{o['p50_ms']:>10.2f}{o['p95_ms']:>10.2f}{o['p99_ms']:>10.2f}")
+    txn = report['transactions']
+    print(f"  transactions: {txn.get('retries', 0)} retries, {txn.get('deadlocks', 0)} deadlocks, "
+          f"{txn.get('lock_timeouts', 0)} lock timeouts, {txn.get('failures', 0)} failures")
+    for message, count in report['errors'].items():
+        print(f'  error x{count}: {message}')
+    for crash in report['crashed_terminals']:
+        print(f'  CRASHED {crash}')
+    print('invariants:')
+    for inv in report['invariants']:
+        print(f"  [{'ok' if inv['passed'] else 'FAIL'}] {inv['name']}: {inv['detail']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--terminals', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--hot', type=int, default=20, help='medicines that sales and stock-ins draw from')
+    parser.add_argument('--scale', type=int, default=10000, help='sales in the generated data set')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'pharmacy-bench'))
+    parser.add_argument('--config', help='pharmacy.ini of a SQL Server to load instead of SQLite')
+    parser.add_argument('--shared-backend', action='store_true',
+                        help='drive one PharmacyBackend from all terminal threads (each gets its own connection)')
+    parser.add_argument('--output', help='write the report as JSON')
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.environ['PHARMACY_DATA_DIR'] = os.path.join(args.workdir, 'data')
+    config, manifest = prepare_dataset(args.scale, args.seed, args.workdir, args.config, datetime.now())
+    hot = max(1, min(args.hot, manifest['counts']['medicines']))
+    before = _snapshot(config)
+
+    gate = threading.Barrier(args.terminals + 1)
+    shared = None
+    if args.shared_backend:
+        from pharmacy_core import PharmacyBackend
+        shared = PharmacyBackend(config).connect()
+    terminals = [Terminal(i, config, manifest, mix, 0, hot, args.seed, gate, shared)
+                 for i in range(args.terminals)]
+    for t in terminals:
+        t.start()
+    # Terminals connect, then wait at the gate so the clock starts for all of them at once
+    started = time.monotonic()
+    for t in terminals:
+        t.deadline = started + args.duration
+    gate.wait()
+    for t in terminals:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    report = summarize(terminals, elapsed, check_invariants(config, before, terminals),
+                       [shared.get_transaction_stats()] if shared else None)
+    report['settings'] = {'terminals': args.terminals, 'duration': args.duration, 'mix': mix, 'hot': hot,
+                          'scale': args.scale, 'shared_backend': args.shared_backend, 'engine': 'sqlserver' if args.config else 'sqlite'}
+    _print_report(report, args.terminals)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    failed = report['crashed_terminals'] or not all(i['passed'] for i in report['invariants'])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""Time PharmacyBackend operations on synthetic data at several scales.
+
+    python -m benchmarks.run [--scales 10000 100000 1000000] [--repeat 5]
+                             [--ops create_sale get_sales ...] [--output results.json]
+                             [--compare baseline.json] [--workdir DIR] [--config pharmacy.ini]
+
+For each scale a database is generated once (cached in --workdir as
+bench_<scale>_<seed>.db) and copied before each run, so write operations never
+change the cached copy. Each operation is run once to warm up and then
+--repeat times; the JSON output records min/median/p95/max wall time and the
+database round-trips (statements executed) per call, with the commit, Python
+and SQLite versions, so runs can be compared across commits with --compare.
+
+With --config the backend connects to the SQL Server named in that file
+instead; its database must have been created from pharmacy.sql and be empty
+(apart from the seed rows) before the first run.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from . import datagen
+
+
+class RoundTripCounter:
+    """Wraps a connection factory and counts the statements executed on every
+    connection it opens (the shared one and the dedicated streaming ones)."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.count = 0
+
+    def __call__(self):
+        return _CountingConnection(self.factory(), self)
+
+
+class _CountingConnection:
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self):
+        return _CountingCursor(self._conn.cursor(), self._counter)
+
+    def execute(self, *args):
+        self._counter.count += 1
+        return self._conn.execute(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+
+class _CountingCursor:
+    def __init__(self, cur, counter):
+        self._cur = cur
+        self._counter = counter
+
+    def execute(self, *args):
+        self._counter.count += 1
+        self._cur.execute(*args)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+# name -> fn(backend, manifest, i) for the i-th timed call. Write operations
+# touch only the bench medicines / returnable sale lines the generator set aside.
+
+def _create_sale(backend, manifest, i):
+    meds = manifest['bench_medicines']
+    items = [{'medicine_id': meds[(i + k) % len(meds)], 'quantity': 1 + k, 'price': 1.0} for k in range(3)]
+    sale_id, result = backend.create_sale(None, items, user='cashier1')
+    if sale_id is None:
+        raise RuntimeError(result)
+
+
+def _add_return(backend, manifest, i):
+    sale_id, medicine_id, _, customer = manifest['returnable'][i % len(manifest['returnable'])]
+    return_id, error = backend.add_return(str(medicine_id), 1, sale_id=sale_id, customer_id=customer,
+                                          reason='benchmark', user='cashier1')
+    if error:
+        raise RuntimeError(error)
+
+
+def _apply_stock_delta(backend, manifest, i):
+    meds = manifest['bench_medicines']
+    result, error = backend.apply_stock_delta(meds[i % len(meds)], 5, reason='benchmark', user='cashier1')
+    if error:
+        raise RuntimeError(error)
+
+
+OPERATIONS = {
+    'get_dashboard_stats': lambda b, m, i: b.get_dashboard_stats(),
+    'search_medicines': lambda b, m, i: b.search_medicines(m['search_terms'][i % len(m['search_terms'])]),
+    'search_customers': lambda b, m, i: b.search_customers(f'{i % 10}{i % 7}'),
+    'get_medicines_page': lambda b, m, i: b.get_medicines_page(offset=(i % 5) * 100, sort='Quantity'),
+    'get_returns_page': lambda b, m, i: b.get_returns_page(),
+    'get_sales_report_month': lambda b, m, i: b.get_sales_report('month'),
+    'get_low_stock_medicines': lambda b, m, i: b.get_low_stock_medicines(),
+    'get_medicines': lambda b, m, i: b.get_medicines(),
+    'get_sales': lambda b, m, i: b.get_sales(),
+    'create_sale': _create_sale,
+    'add_return': _add_return,
+    'apply_stock_delta': _apply_stock_delta,
+}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def measure(backend, counter, manifest, name, repeat):
+    """Warm up once, then time `repeat` calls of operation `name`."""
+    fn = OPERATIONS[name]
+    fn(backend, manifest, 0)
+    times, trips = [], []
+    for i in range(1, repeat + 1):
+        before = counter.count
+        started = time.perf_counter()
+        fn(backend, manifest, i)
+        times.append((time.perf_counter() - started) * 1000.0)
+        trips.append(counter.count - before)
+    return {
+        'op': name,
+        'runs': repeat,
+        'min_ms': round(min(times), 3),
+        'median_ms': round(statistics.median(times), 3),
+        'p95_ms': round(_percentile(times, 95), 3),
+        'max_ms': round(max(times), 3),
+        'round_trips': max(trips),
+    }
+
+
+def _prepare_sqlite(workdir, scale, seed, as_of):
+    # Generate (or reuse) the pristine database and return a fresh working copy
+    pristine = os.path.join(workdir, f'bench_{scale}_{seed}.db')
+    manifest_path = pristine + '.json'
+    if not (os.path.exists(pristine) and os.path.exists(manifest_path)):
+        for path in (pristine, pristine + '-wal', pristine + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        started = time.perf_counter()
+        manifest = datagen.populate_sqlite(pristine, scale, seed=seed, as_of=as_of)
+        manifest['generate_seconds'] = round(time.perf_counter() - started, 2)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    working = os.path.join(workdir, f'bench_{scale}_{seed}.run.db')
+    for path in (working + '-wal', working + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copyfile(pristine, working)
+    return working, manifest
+
+
+def prepare_dataset(scale, seed, workdir, config_path=None, as_of=None):
+    """Return (config, manifest) for a database holding the synthetic data set:
+    a fresh copy of the cached SQLite database, or the SQL Server in
+    `config_path` (populated on first use)."""
+    from pharmacy_core import Config, connect_database, load_config
+    if not config_path:
+        path, manifest = _prepare_sqlite(workdir, scale, seed, as_of)
+        return Config(engine='sqlite', sqlite_path=path), manifest
+    config = load_config(config_path)
+    manifest_path = os.path.join(workdir, f'bench_{scale}_{seed}.sqlserver.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            return config, json.load(f)
+    conn = connect_database(config)
+    try:
+        conn.autocommit = False
+        manifest = datagen.populate(conn, scale, seed=seed, as_of=as_of, sqlite=False)
+    finally:
+        conn.close()
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return config, manifest
+
+
+def run_scale(scale, ops, repeat, seed, workdir, config_path=None, as_of=None):
+    from pharmacy_core import PharmacyBackend, connect_database
+    config, manifest = prepare_dataset(scale, seed, workdir, config_path, as_of)
+    counter = RoundTripCounter(lambda: connect_database(config))
+    backend = PharmacyBackend(config, connection_factory=counter).connect()
+    results = []
+    for name in ops:
+        try:
+            result = measure(backend, counter, manifest, name, repeat)
+        except Exception as e:
+            result = {'op': name, 'error': str(e)}
+        result['scale'] = scale
+        results.append(result)
+        _print_result(result)
+    return results, manifest
+
+
+def _print_result(r):
+    if 'error' in r:
+        print(f"  {r['op']:<26} ERROR {r['error']}")
+    else:
+        print(f"  {r['op']:<26} median {r['median_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms"
+              f"   round-trips {r['round_trips']:>3}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(base, current):
+    """Print the median time and round-trip change of every (scale, op) in both runs."""
+    before = {(r['scale'], r['op']): r for r in base.get('results', []) if 'median_ms' in r}
+    print(f"\nCompared with {base.get('meta', {}).get('commit') or 'baseline'}:")
+    for r in current['results']:
+        old = before.get((r['scale'], r['op']))
+        if old is None or 'median_ms' not in r:
+            continue
+        ratio = r['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        trips = r['round_trips'] - old['round_trips']
+        print(f"  {r['scale']:>8} {r['op']:<26} {old['median_ms']:>10.3f} -> {r['median_ms']:>10.3f} ms"
+              f"  x{ratio:5.2f}  round-trips {trips:+d}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000],
+                        help='numbers of sales to generate (default: 10000 100000)')
+    parser.add_argument('--ops', nargs='+', choices=sorted(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'pharmacy-bench'))
+    parser.add_argument('--config', help='pharmacy.ini of a SQL Server to benchmark instead of SQLite')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    # Keep the backend's offline catalog cache out of the user's real data folder
+    os.environ['PHARMACY_DATA_DIR'] = os.path.join(args.workdir, 'data')
+    as_of = datetime.now()
+    meta = {
+        'commit': _git_commit(),
+        'started': as_of.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'engine': 'sqlserver' if args.config else 'sqlite',
+        'sqlite': sqlite3.sqlite_version,
+        'seed': args.seed,
+        'repeat': args.repeat,
+    }
+    output = {'meta': meta, 'datasets': {}, 'results': []}
+    for scale in args.scales:
+        print(f'scale {scale}:')
+        results, manifest = run_scale(scale, args.ops, args.repeat, args.seed, args.workdir,
+                                      config_path=args.config, as_of=as_of)
+        output['datasets'][str(scale)] = manifest['counts']
+        output['results'].extend(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print(f'\nResults written to {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), output)
+    return 1 if any('error' in r for r in output['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
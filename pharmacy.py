@@ -1,1247 +1,604 @@
+import time
+_STARTUP_T0 = time.perf_counter()  # for --profile-startup
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import tkinter.font as tkfont
-from datetime import datetime, timedelta
+from tkinter import ttk, messagebox
+from datetime import datetime
+from contextlib import ExitStack, contextmanager
+from collections import deque
 import sys
-import ctypes
-try:
-    import pyodbc
-except ImportError:
+import os
+import uuid
+import threading
+import traceback
+# tkinter.font, tkinter.filedialog and ctypes are imported where used; none is needed to reach the login window
+from pharmacy_core import (PAGE_SIZE, CartJournal, DatabaseError, OfflineConnection, ParkedCartStore,
+                           PharmacyBackend, SaleReplayer, load_config, local_data_path)
+from pharmacy_core import db as _core_db
+from pharmacy_core.metrics import MetricFamily, MetricsServer, backend_metrics
+if _core_db.pyodbc is None and load_config().engine != 'sqlite':
     _tmp_root = tk.Tk()
     _tmp_root.withdraw()
     messagebox.showerror("Dependency Error", "pyodbc is not installed. Please install it manually.")
     _tmp_root.destroy()
     sys.exit(1)
 
-# Database connection setup
-conn = None
-cursor = None
-try:
-    conn = pyodbc.connect('DRIVER={SQL Server};SERVER=DESKTOP-HE9I4KD\\SQLEXPRESS;DATABASE=PharmacyDB;Trusted_Connection=yes;')
-    cursor = conn.cursor()
-except (pyodbc.Error, AttributeError):
-    _tmp_root = tk.Tk()
-    _tmp_root.withdraw()
-    messagebox.showerror("Database Error", "Unable to connect to SQL Server.\nPlease ensure SQL Server is running.")
-    _tmp_root.destroy()
-    sys.exit(1)
-
-class PharmacyBackend:
-    def __init__(self):
-        # Keep no persistent settings cache. Provide helpers to always read
-        # settings from the database so the UI never relies on stale in-memory data.
-        # Backwards-compatible `self.settings` remains empty.
-        self.settings = {}
-
-    def get_settings(self):
-        """Read settings from DB on-demand and return a dict.
-        This avoids keeping an in-memory, possibly stale, copy.
-        """
-        defaults = {
-            'pharmacy_name': 'City Pharmacy',
-            'address': '',
-            'phone': '',
-            'tax_rate': 0.0,
-            'currency': 'USD',
-            'start_maximized': True
-        }
-        try:
-            cursor.execute("EXEC GetSettings")
-            row = cursor.fetchone()
-            if not row:
-                return defaults
-            return {
-                'pharmacy_name': row[0] or defaults['pharmacy_name'],
-                'address': row[1] or defaults['address'],
-                'phone': row[2] or defaults['phone'],
-                'tax_rate': float(row[3]) if row[3] is not None else defaults['tax_rate'],
-                'currency': row[4] or defaults['currency'],
-                'start_maximized': bool(row[5]) if row[5] is not None else defaults['start_maximized']
-            }
-        except Exception:
-            return defaults
-
-    def update_settings(self, pharmacy_name, address, phone, tax_rate, currency, start_maximized, user=None):
-        """Persist settings to DB via stored procedure."""
-        try:
-            cursor.execute("EXEC UpdateSettings ?,?,?,?,?,?", pharmacy_name, address, phone, tax_rate, currency, 1 if start_maximized else 0)
-            conn.commit()
-            return True
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return False
-    
-    # Helper methods to get data from database
-    def get_medicines(self):
-        """Get all medicines from database view"""
-        results = {}
-        try:
-            cursor.execute("EXEC GetAllMedicines")
-            rows = cursor.fetchall()
-        except Exception:
-            # Stored procedure missing or failed — return empty set (no inline SQL)
-            rows = []
-
-        for r in rows:
-            # Normalize MedicineID to string so UI code continues to work with string keys
-            mid_key = str(r[0])
-            # Map columns returned by GetAllMedicines (now includes supplier columns)
-            med = {
-                'name': r[1] or '',
-                'category': r[2] or '',
-                'quantity': int(r[3] or 0),
-                'price': float(r[4] or 0),
-                'minimum_stock': int(r[5] or 0),
-                'status': r[6] or '',
-                'created_date': r[7] if len(r) > 7 else None,
-                'supplier_id': str(r[8]) if (len(r) > 8 and r[8] is not None) else None,
-                'supplier_name': r[9] or '' if len(r) > 9 else ''
-            }
-            results[mid_key] = med
-        return results
-    
-    def get_customers(self):
-        """Get all customers from database view"""
-        results = {}
-        try:
-            cursor.execute("EXEC GetAllCustomers")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            # Normalize CustomerID to string for consistent UI keys
-            cid_key = str(r[0])
-            results[cid_key] = {
-                'name': r[1] or '',
-                'phone': r[2] or '',
-                'email': r[3] or '',
-                'created_date': r[4] if len(r) > 4 else None,
-                'total_purchases': float(r[5] or 0) if len(r) > 5 else 0
-            }
-        return results
-    
-    def get_suppliers(self):
-        """Get all suppliers from database view"""
-        results = {}
-        try:
-            cursor.execute("EXEC GetAllSuppliers")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            # Normalize SupplierID to string so UI code continues to work with string keys
-            sid_key = str(r[0])
-            results[sid_key] = {
-                'name': r[1] or '',
-                'company': r[2] or '',
-                'phone': r[3] or '',
-                'email': r[4] or '',
-                'active': bool(r[5]) if r[5] is not None else True,
-                'created_date': r[6] if len(r) > 6 else None
-            }
-        return results
-    
-    def get_users(self):
-        """Get all users from database view"""
-        results = {}
-        try:
-            cursor.execute("EXEC GetAllUsers")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            results[r[0]] = {
-                'full_name': r[1] or '',
-                'password': r[2] or '',
-                'role': r[3] or '',
-                'active': bool(r[4]) if r[4] is not None else True,
-                'email': r[5] or '',
-                'phone': r[6] or ''
-            }
-        return results
-    
-    def get_sales(self):
-        """Get all sales from database view"""
-        results = {}
-        # Prefer stored procedure if available
-        try:
-            cursor.execute("EXEC GetAllSales")
-            rows = cursor.fetchall()
-            for r in rows:
-                sale_id = r[0]
-                # Normalize SaleID to string for consistent UI keys
-                key = str(sale_id)
-                results[key] = {
-                    'customer_id': str(r[1]) if r[1] is not None else None,
-                    'customer_name': r[2] or '',
-                    'items': [],
-                    'subtotal': float(r[3] or 0),
-                    'tax': float(r[4] or 0),
-                    'total': float(r[5] or 0),
-                    'timestamp': r[6] if len(r) > 6 else None,
-                    'user': r[7] if len(r) > 7 else None,
-                    'user_fullname': r[8] if len(r) > 8 else None
-                }
-                
-            # Populate sale items via stored procedure exposing vw_Sales_Details
-            try:
-                cursor.execute("EXEC GetAllSaleDetails")
-                detail_rows = cursor.fetchall()
-            except Exception:
-                detail_rows = []
-            for dr in detail_rows:
-                sid = dr[0]
-                sid_key = str(sid)
-                if sid_key in results:
-                    # support both shapes (with MedicineName) and without
-                    if len(dr) >= 5:
-                        mid = dr[1]
-                        mname = dr[2]
-                        qty = int(dr[3] or 0)
-                        price = float(dr[4] or 0)
-                    else:
-                        mid = dr[1]
-                        mname = ''
-                        qty = int(dr[2] or 0)
-                        price = float(dr[3] or 0)
-                    results[sid_key]['items'].append({'medicine_id': str(mid), 'medicine_name': mname, 'quantity': qty, 'price': price})
-        except Exception:
-            # Stored procedure failed — return empty results (no inline SQL fallback)
-            return results
-        return results
-    
-    def get_returns(self):
-        """Get all returns from the detailed view (includes medicine/customer names)"""
-        results = {}
-        # Prefer stored procedure if available
-        try:
-            cursor.execute("EXEC GetAllReturns")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            # When using base table fallback the column order differs; handle both shapes
-            if len(r) >= 12:
-                rid = str(r[0])
-                results[rid] = {
-                    'sale_id': r[1] or None,
-                    'medicine_id': r[2] or None,
-                    'medicine_name': r[3] or '',
-                    'quantity': int(r[4] or 0),
-                    'unit_price': float(r[5] or 0),
-                    'amount': float(r[6] or 0),
-                    'customer_id': str(r[7]) if r[7] is not None else None,
-                    'customer_name': r[8] or '',
-                    'reason': r[9] or '',
-                    'timestamp': r[10] if len(r) > 10 else None,
-                    'user': r[11] if len(r) > 11 else None
-                }
-            else:
-                rid = str(r[0])
-                results[rid] = {
-                    'sale_id': r[5] or None,
-                    'medicine_id': r[1] or None,
-                    'medicine_name': '',
-                    'quantity': int(r[2] or 0),
-                    'unit_price': float(r[3] or 0),
-                    'amount': float(r[4] or 0),
-                    'customer_id': str(r[6]) if (len(r) > 6 and r[6] is not None) else None,
-                    'customer_name': '',
-                    'reason': r[7] or '' if len(r) > 7 else '',
-                    'timestamp': r[8] if len(r) > 8 else None,
-                    'user': r[9] if len(r) > 9 else None
-                }
-        return results
-    
-    def get_stock_adjustments(self):
-        """Get all stock adjustments from database view"""
-        results = {}
-        # Prefer stored procedure if available
-        try:
-            cursor.execute("EXEC GetStockAdjustments")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            aid = str(r[0])
-            if len(r) >= 12:
-                reason_text = (r[8] or '') if r[8] is not None else ''
-
-                results[aid] = {
-                    'medicine_id': str(r[1]) if r[1] is not None else None,
-                    'medicine_name': r[2] or '',
-                    'old_quantity': int(r[3] or 0),
-                    'new_quantity': int(r[4] or 0),
-                    'change': int(r[5] or 0),
-                    'supplier_id': str(r[6]) if r[6] is not None else None,
-                    'supplier_name': r[7] or '',
-                    'reason': r[8] or '',
-                    'user': r[9] or '',
-                    'user_fullname': r[10] if len(r) > 10 else None,
-                    'timestamp': r[11] if len(r) > 11 else None
-                }
-            else:
-                reason_text = (r[6] or '') if r[6] is not None else ''
-                results[aid] = {
-                    'medicine_id': str(r[1]) if r[1] is not None else None,
-                    'medicine_name': '',
-                    'old_quantity': int(r[2] or 0),
-                    'new_quantity': int(r[3] or 0),
-                    'change': int(r[4] or 0),
-                    'supplier_id': str(r[5]) if r[5] is not None else None,
-                    'supplier_name': '',
-                    'reason': r[6] or '',
-                    'user': r[7] or '',
-                    'user_fullname': None,
-                    'timestamp': r[8] if len(r) > 8 else None
-                }
-        return results
-    
-    def get_activity_log(self):
-        """Get activity log from database view"""
-        results = {}
-        # Prefer stored procedure if available
-        try:
-            cursor.execute("EXEC GetActivityLog")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            log_id = int(r[0]) if r[0] else str(r[0])
-            results[log_id] = {
-                'user': r[1] or '',
-                'action': r[2] or '',
-                'timestamp': r[3] if len(r) > 3 else None
-            }
-        return results
-    
-    def add_medicine(self, name, category, quantity, price, medicine_id=None, minimum_stock=10, supplier_id=None, user=None):
-        # Add a new medicine to inventory (database only)
-        qty = int(quantity) if quantity else 0
-        min_stock = int(minimum_stock or 10)
-
-        # Determine status based on quantities and minimum stock
-        status = 'ok'
-        if qty <= 0:
-            status = 'out of stock'
-        elif qty < min_stock:
-            status = 'low stock'
-        # Add to database and return the generated MedicineID as a string.
-        try:
-            # Pass supplier_id (INT) to stored procedure; allow NULL
-            try:
-                supp_param = int(supplier_id) if supplier_id is not None else None
-            except Exception:
-                supp_param = None
-            # Status is now computed server-side in AddMedicine; do not pass local status
-            cursor.execute("EXEC AddMedicine ?,?,?,?,?,?,?", name, category, qty, price, min_stock, supp_param, user)
-            row = cursor.fetchone()
-            try:
-                conn.commit()
-            except Exception:
-                conn.rollback()
-
-            new_med_id = None
-            if row and len(row) > 0:
-                try:
-                    new_med_id = int(row[0])
-                except Exception:
-                    new_med_id = None
-
-            return str(new_med_id) if new_med_id is not None else None
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return None
-    
-    def update_medicine(self, medicine_id, name=None, category=None, quantity=None, price=None, minimum_stock=None, supplier_id=None, record_adjustment=False, user=None, reason=None):
-        # Update medicine details (database only)
-        try:
-            # Get current medicine data from database
-            cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
-            row = cursor.fetchone()
-            if not row:
-                return False
-            
-            # Current values
-            db_name = name if name is not None else row[0]
-            db_category = category if category is not None else row[1]
-            old_qty = int(row[2] or 0)
-            db_qty = int(quantity) if quantity is not None else old_qty
-            db_price = price if price is not None else float(row[4])
-            db_min_stock = int(minimum_stock) if minimum_stock is not None else int(row[3] or 0)
-            
-            # Status is now computed inside the database `UpdateMedicine`
-            # stored procedure (it will use @Quantity and @MinimumStock).
-            # Use provided supplier_id if given, otherwise try to read from returned row
-            supp_param = None
-            if supplier_id is not None:
-                try:
-                    supp_param = int(supplier_id)
-                except Exception:
-                    supp_param = None
-            else:
-                try:
-                    if len(row) > 6:
-                        try:
-                            supp_param = int(row[6])
-                        except Exception:
-                            supp_param = None
-                except Exception:
-                    supp_param = None
-
-            cursor.execute("EXEC UpdateMedicine ?,?,?,?,?,?,?,?", int(medicine_id), db_name, db_category, db_qty, db_price, db_min_stock, supp_param, user)
-            conn.commit()
-
-            return True
-        except Exception:
-            conn.rollback()
-            return False
-    
-    def delete_medicine(self, medicine_id, user = None):
-        # Delete medicine from inventory (database only)
-        try:
-            cursor.execute("EXEC DeleteMedicineCascade ?,?", int(medicine_id), user)
-            conn.commit()
-            #self.add_activity(f'Deleted medicine {medicine_id}')
-            return True
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return False
-    
-    def add_customer(self, name, phone, email, user=None):
-        # Add a new customer (database only)
-        # Let the database generate the integer CustomerID (IDENTITY).
-            # Client-side validation: require non-empty phone and email
-            if not phone or str(phone).strip() == '' or not email or str(email).strip() == '':
-                return None
-            try:
-                # Pass the values as provided (not forcing empty strings)
-                cursor.execute("EXEC AddCustomer ?,?,?,?", name, phone, email, user)
-                row = cursor.fetchone()
-                conn.commit()
-            except Exception as e:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-                print("AddCustomer failed:", e)
-                return None
-
-            if not row:
-                return None
-
-            try:
-                new_id = int(row[0])
-            except Exception:
-                return None
-
-            return str(new_id)
-
-    def update_customer(self, customer_id, name=None, phone=None, email=None, user=None):
-        # Update customer details (database only)
-        try:
-            # Get current customer data via stored procedure
-            # ensure we pass integer CustomerID to the DB
-            int_cid = int(customer_id)
-            cursor.execute("EXEC GetCustomerByID ?", int_cid)
-            row = cursor.fetchone()
-            if not row:
-                return False
-            
-            db_name = name if name is not None else row[0]
-            db_phone = phone if phone is not None else row[1]
-            db_email = email if email is not None else row[2]
-            
-            cursor.execute("EXEC UpdateCustomer ?,?,?,?,?", int_cid, db_name, db_phone, db_email, user)
-            conn.commit()
-            #self.add_activity(f'Updated customer {customer_id}')
-            return True
-        except Exception:
-            conn.rollback()
-            return False
-
-    def delete_customer(self, customer_id, user=None):
-        # Delete a customer (database only)
-        try:
-            cursor.execute("EXEC DeleteCustomer ?,?", int(customer_id), user)
-            conn.commit()
-            #self.add_activity(f'Deleted customer {customer_id}')
-            return True
-        except Exception:
-            conn.rollback()
-            return False
-    
-    def create_sale(self, customer_id, items, user=None):
-        # Create a new sale transaction using identity-based SaleID in the DB.
-        # Calculate totals
-        subtotal = sum(item['quantity'] * item['price'] for item in items)
-        # Read settings at call time to avoid KeyError when settings haven't been loaded
-        settings = self.get_settings()
-        tax_rate = float(settings.get('tax_rate', 0.0))
-        tax = (subtotal * tax_rate) / 100
-        total = subtotal + tax
-
-        # Pre-check stock availability to avoid the DB stored procedure throwing
-        try:
-            for item in items:
-                med_id = item['medicine_id']
-                qty = int(item['quantity'])
-                try:
-                    cursor.execute("EXEC GetMedicineByID ?", int(med_id))
-                    row = cursor.fetchone()
-                except Exception:
-                    row = None
-                if not row:
-                    return None, f'Invalid medicine id: {med_id}'
-                # GetMedicineByID returns (Name, Category, Quantity, MinimumStock, Price, Status)
-                available = int(row[2] or 0)
-                if available < qty:
-                    return None, f'Insufficient stock for {med_id} (available {available})'
-        except Exception:
-            pass
-
-        # Persist sale via stored procedures (CreateSale now returns the generated SaleID)
-        try:
-            conn.autocommit = False
-
-            # Ensure CustomerID is passed as INT or NULL (UI uses string keys)
-            cust_param = None
-            try:
-                if customer_id is not None:
-                    cust_param = int(customer_id)
-            except Exception:
-                cust_param = None
-
-            cursor.execute("EXEC CreateSale ?,?,?,?,?", cust_param, subtotal, tax, total, user)
-            row = cursor.fetchone()
-            if not row:
-                conn.rollback()
-                conn.autocommit = True
-                return None, 'Failed to create sale header'
-            try:
-                sale_id = int(row[0])
-            except Exception:
-                sale_id = row[0]
-
-            # For each sale item: add sale item and update medicine qty (all within one transaction)
-            db_errors = False
-            last_error = None
-            for item in items:
-                med_id = item['medicine_id']
-                qty = item['quantity']
-                price = item.get('price', 0)
-                try:
-                    # Read current DB medicine row BEFORE subtracting so we have the correct old quantity
-                    cursor.execute("EXEC GetMedicineByID ?", int(med_id))
-                    mrow_pre = cursor.fetchone()
-                    if mrow_pre is not None:
-                        db_name = mrow_pre[0] or ''
-                        db_cat = mrow_pre[1] or ''
-                        db_old = int(mrow_pre[2] or 0)
-                        db_min = int(mrow_pre[3] or 0)
-                        db_price = float(mrow_pre[4] or 0)
-                        db_status = mrow_pre[5] or ''
-                    else:
-                        db_name = ''
-                        db_cat = ''
-                        db_old = 0
-                        db_min = 0
-                        db_price = price
-                        db_status = ''
-
-                    # Now add sale item which itself decreases the medicine quantity in the DB
-                    # Pass the current user so stock adjustments record who performed the sale
-                    cursor.execute("EXEC AddSaleItem ?,?,?,?,?", sale_id, int(med_id), qty, price, user or None)
-
-                    # Compute new quantity based on pre-read value (the stored proc should participate in this transaction)
-                    db_new = db_old - qty
-                except Exception:
-                    db_errors = True
-                    try:
-                        last_error = str(sys.exc_info()[1])
-                    except Exception:
-                        last_error = 'Error adding sale item or updating medicine/stock'
-                    break
-
-            if db_errors:
-                conn.rollback()
-                conn.autocommit = True
-                return None, (last_error or 'Database error during sale persistence')
-
-            try:
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                conn.autocommit = True
-                return None, f'Database commit failed: {e}'
-
-            # Log activity for the created sale (best-effort; don't break sale flow if logging fails)
-            self.add_activity(f'Sale {sale_id} created: {total}', user)
-
-
-            conn.autocommit = True
-
-            # Sale created successfully in database
-            return sale_id, total
-        except Exception as e:
-            conn.rollback()
-            conn.autocommit = True
-            return None, str(e)
-
-    def add_return(self, medicine_id, quantity, sale_id=None, customer_id=None, reason='', user=None):
-        # Register a returned item in database
-        try:
-            qty = int(quantity)
-            if qty <= 0:
-                return None, 'Quantity must be positive'
-        except Exception:
-            return None, 'Invalid quantity'
-
-        # Get medicine price and current quantity from database
-        try:
-            cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
-            mrow = cursor.fetchone()
-            if mrow is None:
-                return None, 'Invalid medicine id'
-            # (Name, Category, Quantity, MinimumStock, Price, Status)
-            unit_price = float(mrow[4] or 0) if len(mrow) > 4 else 0.0
-            old_qty = int(mrow[2] or 0) if len(mrow) > 2 else 0
-        except Exception:
-            return None, 'Database error retrieving medicine'
-
-        refund_amount = unit_price * qty
-
-        # Re-read current quantity right before creating the return to ensure accurate old_qty
-        try:
+# Event-loop watchdog: tick interval, how long the loop may be stuck before its stack
+# is captured, and the run time from which a handler is logged as slow (all ms)
+WATCHDOG_TICK_MS = 100
+STALL_THRESHOLD_MS = 500
+SLOW_HANDLER_MS = 200
+
+class BackgroundConnector:
+    """Opens the first database connection on a worker thread so the login
+    window can be shown, and typed into, while SQL Server is contacted.
+    `factory` is the backend's connection factory.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.conn = None
+        self.error = None
+        self.seconds = None
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name='db-connect', daemon=True).start()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.conn = self.factory()
+        except DatabaseError as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - started
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+class StartupProfiler:
+    """Wall-clock time per startup phase; printed once by --profile-startup."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def mark(self, name, seconds):
+        # Record a phase timed elsewhere (e.g. on a worker thread)
+        if seconds is not None:
+            self.phases.append((name, seconds))
+
+    def report(self, stream=None):
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        stream = stream or sys.stderr
+        print('Startup profile (wall clock):', file=stream)
+        for name, seconds in self.phases:
+            print(f'  {name:<36} {seconds * 1000:9.1f} ms', file=stream)
+        print(f'  {"total since process start":<36} {(time.perf_counter() - _STARTUP_T0) * 1000:9.1f} ms',
+              file=stream)
+
+def callback_name(func):
+    # Readable name of a Tk callback: the method or function it runs
+    code = getattr(func, '__code__', None)
+    if code is not None and code.co_name == 'callit' and func.__closure__:
+        # after() schedules a local `callit` that calls the real function
+        cells = dict(zip(code.co_freevars, func.__closure__))
+        if 'func' in cells:
+            func = cells['func'].cell_contents
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or repr(func)
+    return name.replace('.<locals>', '').replace('PharmacyFrontend.', '')
+
+class ActionCallWrapper(tk.CallWrapper):
+    """Runs every Tk callback (button command, event binding, after() job) as
+    one action of `tracer`, so the database round-trips of each click or view
+    change are counted together and over-budget or N+1 actions are flagged,
+    and times it with `watchdog`. Installed for the whole process by install()."""
+    tracer = None
+    watchdog = None
+
+    @classmethod
+    def install(cls, tracer, watchdog=None):
+        cls.tracer = tracer
+        cls.watchdog = watchdog
+        tk.CallWrapper = cls
+
+    def __call__(self, *args):
+        if self.tracer is None and self.watchdog is None:
+            return super().__call__(*args)
+        name = callback_name(self.func)
+        with ExitStack() as scopes:
+            if self.tracer is not None:
+                scopes.enter_context(self.tracer.action(name))
+            if self.watchdog is not None:
+                scopes.enter_context(self.watchdog.handler(name))
+            return super().__call__(*args)
+
+class StallWatchdog:
+    """Finds what freezes the UI. An after() tick every `tick_ms` measures how
+    late the event loop runs it (tick lag). A daemon thread watches the last
+    tick: once the loop has been stuck for `stall_ms` it logs the Tk thread's
+    Python stack and the handler running. handler() times each callback; those
+    blocking the loop for `slow_handler_ms` or more are logged too (a handler
+    that opened a dialog kept the loop running and is not counted as slow).
+    """
+
+    def __init__(self, root, log_path, tick_ms=WATCHDOG_TICK_MS, stall_ms=STALL_THRESHOLD_MS,
+                 slow_handler_ms=SLOW_HANDLER_MS):
+        self.root = root
+        self.log_path = log_path
+        self.tick_ms = tick_ms
+        self.stall_ms = stall_ms
+        self.slow_handler_ms = slow_handler_ms
+        self.thread_id = threading.get_ident()
+        self.lags = deque(maxlen=600)          # ms, about the last minute of ticks
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self.recent_stalls = deque(maxlen=50)
+        self.handlers = {}                     # name -> {'calls', 'total_ms', 'max_ms', 'slow', 'stalls'}
+        self.running = []                      # handler frames on the Tk thread, innermost last
+        self._last_tick = time.monotonic()
+        self._stall = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        self.root.after(self.tick_ms, self._tick)
+        threading.Thread(target=self._watch, name='ui-watchdog', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _tick(self):
+        now = time.monotonic()
+        # The loop is alive: handlers still running are waiting in a nested loop (a dialog)
+        for frame in self.running:
+            frame['nested'] = True
+        with self._lock:
+            lag = max(0.0, (now - self._last_tick) * 1000.0 - self.tick_ms)
+            self._last_tick = now
+            self.lags.append(lag)
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+            stall, self._stall = self._stall, None
+        if stall is not None:
+            stall['duration_ms'] = round(lag + self.tick_ms, 1)
+            self._write_log(f"{stall['time']}  STALL ended after {stall['duration_ms']:.0f} ms in {stall['handler']}")
+        if not self._stop.is_set():
             try:
-                cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
-                mrow_now = cursor.fetchone()
-                if mrow_now is not None:
-                    old_qty = int(mrow_now[2] or 0) if len(mrow_now) > 2 else old_qty
-            except Exception:
-                # If re-read fails, proceed with previously read old_qty
-                pass
-        except Exception:
+                self.root.after(self.tick_ms, self._tick)
+            except tk.TclError:
+                pass  # root destroyed
+
+    def _watch(self):
+        while not self._stop.wait(self.tick_ms / 1000.0):
+            with self._lock:
+                stuck_ms = (time.monotonic() - self._last_tick) * 1000.0 - self.tick_ms
+                capture = stuck_ms >= self.stall_ms and self._stall is None
+            if capture:
+                self._capture(stuck_ms)
+
+    def _capture(self, stuck_ms):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+        running = list(self.running)
+        handler = running[-1]['name'] if running else '(event loop)'
+        entry = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'handler': handler,
+                 'stuck_ms': round(stuck_ms, 1), 'duration_ms': None, 'stack': stack}
+        with self._lock:
+            self._stall = entry
+            self.stalls += 1
+            self.recent_stalls.append(entry)
+            if running:
+                self._handler_stats(handler)['stalls'] += 1
+        self._write_log(f"{entry['time']}  STALL {stuck_ms:.0f} ms in {handler}; Tk thread stack:\n{stack}")
+
+    def _handler_stats(self, name):
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = {'name': name, 'calls': 0, 'timed': 0, 'total_ms': 0.0,
+                                           'max_ms': 0.0, 'slow': 0, 'stalls': 0}
+        return stats
+
+    @contextmanager
+    def handler(self, name):
+        """Time one callback running on the Tk thread."""
+        frame = {'name': name, 'nested': False}
+        self.running.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.running.pop()
+            elapsed = (time.perf_counter() - started) * 1000.0
+            if name != 'StallWatchdog._tick':
+                slow = not frame['nested'] and elapsed >= self.slow_handler_ms
+                with self._lock:
+                    stats = self._handler_stats(name)
+                    stats['calls'] += 1
+                    if not frame['nested']:
+                        stats['timed'] += 1
+                        stats['total_ms'] += elapsed
+                        stats['max_ms'] = max(stats['max_ms'], elapsed)
+                    stats['slow'] += 1 if slow else 0
+                if slow:
+                    self._write_log(f"{datetime.now():%Y-%m-%d %H:%M:%S}  SLOW HANDLER {name}: {elapsed:.0f} ms")
+
+    def stats(self):
+        """Tick lag percentiles over the last minute, stall count and per-handler times,
+        copied under the lock (the metrics endpoint calls this from its own thread)."""
+        with self._lock:
+            lags = sorted(self.lags)
+            handlers = [dict(h) for h in self.handlers.values()]
+            stalls = self.stalls
+            max_lag_ms = self.max_lag_ms
+
+        def pick(pct):
+            return round(lags[min(len(lags) - 1, int(pct / 100.0 * len(lags)))], 1) if lags else 0.0
+        handlers.sort(key=lambda h: h['max_ms'], reverse=True)
+        return {'lag_p50_ms': pick(50), 'lag_p95_ms': pick(95), 'lag_max_ms': round(max_lag_ms, 1),
+                'stalls': stalls, 'handlers': handlers}
+
+    def _write_log(self, line):
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError:
             pass
 
-        # Create return in database (stored procedure handles stock update and returns the new ReturnID)
-        try:
-            # Ensure SaleID and CustomerID are passed as INT or NULL (UI may supply string ids)
-            sale_param = None
-            cust_param = None
-            try:
-                if sale_id is not None:
-                    sale_param = int(sale_id)
-            except Exception:
-                sale_param = None
-            try:
-                if customer_id is not None:
-                    cust_param = int(customer_id)
-            except Exception:
-                cust_param = None
-
-            cursor.execute("EXEC AddReturn ?,?,?,?,?,?,?,?", int(medicine_id), qty, unit_price, refund_amount, sale_param, cust_param, reason or '', user)
-            row = cursor.fetchone()
-            try:
-                conn.commit()
-            except Exception:
-                conn.rollback()
-
-            if row is not None:
-                return_id = row[0]
-            else:
-                # Do not generate a local ReturnID here; require DB to return it.
-                return_id = None
-        except Exception as e:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return None, str(e)
-
-        # Stock adjustment is now recorded by the AddReturn stored procedure.
-
-        #self.add_activity(f'Created return {return_id}', user)
-
-        # Return the DB-provided ID (may be None if DB didn't return one)
-        return return_id, None
-
-    def add_activity(self, action, user=None):
-        """Record an activity entry in database.
-        Returns the LogID (int) when known, otherwise None.
-        """
-        log_id = None
-        # Persist to database
-        try:
-            cursor.execute("EXEC AddActivityLog ?,?", user or None, action)
-            row = cursor.fetchone()
-            conn.commit()
-            if row is not None:
-                try:
-                    log_id = int(row[0])
-                except Exception:
-                    log_id = row[0]
-        except Exception:
-            conn.rollback()
-
-        # Return log_id (None if DB failed to provide one)
-
-        return log_id
-    
-    def get_low_stock_medicines(self, threshold=10):
-        # Prefer using the database stored procedure which returns low-stock items
-        results = {}
-        try:
-            cursor.execute("EXEC GetLowStockItems")
-            rows = cursor.fetchall()
-        except Exception:
-            rows = None
-
-        # If the stored procedure is not available or fails, fall back to in-Python filter
-        if rows is None:
-            try:
-                medicines = self.get_medicines()
-                return {mid: med for mid, med in medicines.items() if med.get('quantity', 0) < threshold}
-            except Exception:
-                return {}
-
-        for r in rows:
-            try:
-                mid = str(r[0])
-                results[mid] = {
-                    'name': r[1] or '',
-                    'category': r[2] or '',
-                    'quantity': int(r[3] or 0),
-                    'price': float(r[5] or 0) if len(r) > 5 else float(r[4] or 0),
-                    'minimum_stock': int(r[4] or 0) if len(r) > 4 else 0,
-                    'status': 'low stock',
-                    'created_date': None
-                }
-            except Exception:
-                # Skip malformed rows
-                continue
-
-        return results
-    
-    def get_today_sales(self):
-        # Use stored procedure to fetch today's sales for efficiency
-        today_sales = []
-        total_amount = 0.0
-        try:
-            cursor.execute("EXEC GetSalesReport ?", 'today')
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
-        for r in rows:
-            try:
-                sale = {
-                    'sale_id': str(r[0]),
-                    'customer_id': str(r[1]) if r[1] is not None else None,
-                    'customer_name': r[2] or '',
-                    'subtotal': float(r[3]) if len(r) > 3 and r[3] is not None else 0.0,
-                    'tax': float(r[4]) if len(r) > 4 and r[4] is not None else 0.0,
-                    'total': float(r[5]) if len(r) > 5 and r[5] is not None else 0.0,
-                    'timestamp': r[6] if len(r) > 6 else None,
-                    'items': []
-                }
-                total_amount += sale['total']
-                today_sales.append(sale)
-            except Exception:
-                continue
-
-        return today_sales, total_amount
-
-    def get_dashboard_stats(self):
-        """Return aggregated values used by the dashboard:
-        - total_medicines
-        - low_stock (medicines where Quantity < MinimumStock)
-        - today_sales_count
-        - today_revenue
-
-        Prefer an efficient SQL query; fall back to in-Python computation if the query fails.
-        """
-        stats = {
-            'total_medicines': 0,
-            'low_stock': 0,
-            'today_sales_count': 0,
-            'today_revenue': 0.0
+class MemoryProfiler:
+    """--profile-memory: a tracemalloc snapshot after every view change. Each
+    snapshot is compared with the one taken the last time the same view was
+    shown, so memory that grows with every visit stands out, and the Tk widget
+    count, widget objects whose Tk widget is gone but are still referenced
+    (leaked), backend Record objects alive and frontend attributes holding
+    destroyed widgets or large containers (stale) are reported with it.
+    Reports go to `log_path` and `views`; nothing is traced when disabled.
+    """
+    TOP_SITES = 10
+    LARGE_CONTAINER = 1000    # frontend dicts / lists this long are listed as retained data
+
+    def __init__(self, enabled=False, log_path=None, frames=10):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.views = {}       # view name -> summary of its latest visit (see view_shown)
+        self._snapshots = {}
+        if enabled:
+            import tracemalloc
+            tracemalloc.start(frames)
+
+    def view_shown(self, name, owner):
+        """Snapshot memory after view `name` of `owner` (the frontend) was shown."""
+        if not self.enabled:
+            return
+        import gc
+        import tracemalloc
+        from pharmacy_core import Record
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')))
+        objects = gc.get_objects()
+        leaked = sum(1 for o in objects if isinstance(o, tk.Misc) and not isinstance(o, tk.Tk)
+                     and not self._exists(o))
+        records = sum(1 for o in objects if isinstance(o, Record))
+        del objects
+        stale = []
+        for attr, value in vars(owner).items():
+            if isinstance(value, tk.Misc) and not self._exists(value):
+                stale.append(f'{attr} (destroyed widget)')
+            elif isinstance(value, (dict, list)) and len(value) >= self.LARGE_CONTAINER:
+                stale.append(f'{attr} ({type(value).__name__} of {len(value)})')
+        previous = self.views.get(name)
+        growth = []
+        if name in self._snapshots:
+            growth = [stat for stat in snapshot.compare_to(self._snapshots[name], 'lineno')
+                      if stat.size_diff > 0][:self.TOP_SITES]
+        traced = sum(stat.size for stat in snapshot.statistics('filename'))
+        summary = {
+            'visits': (previous['visits'] + 1) if previous else 1,
+            'traced_bytes': traced,
+            'growth_bytes': traced - previous['traced_bytes'] if previous else 0,
+            'widgets': self._count_widgets(owner.root),
+            'leaked_widgets': leaked,
+            'records': records,
+            'stale': stale,
         }
+        self.views[name] = summary
+        self._snapshots[name] = snapshot
+        self._report(name, summary, snapshot.statistics('lineno')[:self.TOP_SITES], growth)
 
+    @staticmethod
+    def _exists(widget):
         try:
-            # Use stored procedure to fetch dashboard aggregates
-            cursor.execute("EXEC GetDashboardStats")
-            row = cursor.fetchone()
-            if row:
-                stats['total_medicines'] = int(row[0] or 0)
-                stats['low_stock'] = int(row[1] or 0)
-                stats['today_sales_count'] = int(row[2] or 0)
-                try:
-                    stats['today_revenue'] = float(row[3] or 0.0)
-                except Exception:
-                    stats['today_revenue'] = 0.0
-            return stats
-        except Exception:
-            # Fall back to existing Python helpers (less efficient)
-            try:
-                meds = self.get_medicines()
-                stats['total_medicines'] = len(meds)
-                stats['low_stock'] = len([m for m in meds.values() if int(m.get('quantity', 0)) < int(m.get('minimum_stock', 0) or 0)])
-            except Exception:
-                stats['total_medicines'] = 0
-                stats['low_stock'] = 0
-
-            try:
-                today_sales, total_amount = self.get_today_sales()
-                stats['today_sales_count'] = len(today_sales)
-                stats['today_revenue'] = total_amount
-            except Exception:
-                stats['today_sales_count'] = 0
-                stats['today_revenue'] = 0.0
-
-            return stats
-    
-    def search_medicines(self, query):
-        # Prefer database-backed search procedure when available for efficiency
-        results = {}
-        try:
-            try:
-                cursor.execute("EXEC SearchMedicines ?", query or '')
-                rows = cursor.fetchall()
-            except Exception:
-                rows = None
-
-            if rows is None:
-                # Fallback to in-Python filter when stored procedure unavailable
-                q = (query or '').lower()
-                medicines = self.get_medicines()
-                for mid, med in medicines.items():
-                    try:
-                        if (q in med.get('name','').lower() or
-                            q in med.get('category','').lower() or
-                            q in mid.lower()):
-                            results[mid] = med
-                    except Exception:
-                        continue
-                return results
-
-            for r in rows:
-                mid_key = str(r[0])
-                results[mid_key] = {
-                    'name': r[1] or '',
-                    'category': r[2] or '',
-                    'quantity': int(r[3] or 0),
-                    'price': float(r[4] or 0),
-                    'minimum_stock': int(r[5] or 0),
-                    'status': r[6] or '',
-                    'created_date': r[7] if len(r) > 7 else None
-                }
-            return results
-        except Exception:
-            # Final fallback to existing Python search
-            q = (query or '').lower()
-            medicines = self.get_medicines()
-            for mid, med in medicines.items():
-                try:
-                    if (q in med.get('name','').lower() or q in med.get('category','').lower() or q in mid.lower()):
-                        results[mid] = med
-                except Exception:
-                    continue
-            return results
-    
-    def search_customers(self, query):
-        # Use DB stored procedure when possible
-        results = {}
-        try:
-            try:
-                cursor.execute("EXEC SearchCustomers ?", query or '')
-                rows = cursor.fetchall()
-            except Exception:
-                rows = None
-
-            if rows is None:
-                q = (query or '').lower()
-                customers = self.get_customers()
-                for cid, cust in customers.items():
-                    try:
-                        if (q in cust.get('name','').lower() or
-                            q in cust.get('phone','').lower() or
-                            q in cust.get('email','').lower() or
-                            q in cid.lower()):
-                            results[cid] = cust
-                    except Exception:
-                        continue
-                return results
-
-            for r in rows:
-                cid = str(r[0])
-                results[cid] = {
-                    'name': r[1] or '',
-                    'phone': r[2] or '',
-                    'email': r[3] or '',
-                    'created_date': r[4] if len(r) > 4 else None,
-                    'total_purchases': float(r[5] or 0) if len(r) > 5 else 0
-                }
-            return results
-        except Exception:
-            # Fallback
-            q = (query or '').lower()
-            customers = self.get_customers()
-            for cid, cust in customers.items():
-                try:
-                    if (q in cust.get('name','').lower() or q in cust.get('phone','').lower() or q in cust.get('email','').lower() or q in cid.lower()):
-                        results[cid] = cust
-                except Exception:
-                    continue
-            return results
-
-    # --- Suppliers management ---
-    def add_supplier(self, name, company='', phone='', email='', active=True, supplier_id=None, user=None):
-        # Add a new supplier (DB will generate numeric SupplierID via IDENTITY)
-        try:
-            # Stored procedure signature: AddSupplier @Name, @Company, @Phone, @Email, @Active, @UserName
-            cursor.execute("EXEC AddSupplier ?,?,?,?,?,?", name, company or '', phone or '', email or '', 1 if active else 0, user)
-            row = cursor.fetchone()
-            try:
-                conn.commit()
-            except Exception:
-                conn.rollback()
-
-            if row is not None:
-                try:
-                    new_id = int(row[0])
-                except Exception:
-                    new_id = row[0]
-            else:
-                new_id = None
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            return None
-
-        supplier_key = str(new_id) if new_id is not None else None
-        #self.add_activity(f'Added supplier {supplier_key}', user=None)
-        return supplier_key
-
-    def record_stock_adjustment(self, medicine_id, old_qty, new_qty, supplier_id=None, reason='', user=None):
-        # Record an audit entry for a stock adjustment in database
-        adj_id = None
-        try:
-            try:
-                change = int((new_qty or 0) - (old_qty or 0))
-            except Exception:
-                change = 0
-
-            # Call DB procedure which now returns the generated AdjustmentID
-            # Ensure supplier_id is passed as INT or NULL
-            supp_param = None
-            try:
-                if supplier_id is not None:
-                    supp_param = int(supplier_id)
-            except Exception:
-                supp_param = None
-
-            cursor.execute("EXEC AddStockAdjustment ?,?,?,?,?,?,?", int(medicine_id), old_qty, new_qty, change, supp_param, reason or '', user or None)
-            row = cursor.fetchone()
-            try:
-                conn.commit()
-            except Exception:
-                conn.rollback()
-
-            if row is not None:
-                adj_id = row[0]
-            # Do not generate local IDs here; force DB to provide the ID.
-        except Exception:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
-            # On error, do not synthesize a local AdjustmentID. Leave adj_id as None.
-
-        # Log stock adjustment
-        try:
-            delta = int(new_qty - old_qty)
-        except Exception:
-            delta = 0
-        self.add_activity(f'Stock adjustment {adj_id} for {medicine_id} ({delta:+d})', user)
-
-        return str(adj_id)    # --- User management ---
-    def _hash_password(self, username, password):
-        try:
-            return str(password)
-        except Exception:
-            return None
-
-    def add_user(self, username, full_name, password, role='cashier', active=True, email=None, phone=None):
-        # Add a new user with a role (admin/manager/cashier). Password stored hashed.
-        uname = str(username).strip()
-        if not uname:
-            return None
-        pwd_hash = self._hash_password(uname, password)
-
-        # Persist to database
-        try:
-            cursor.execute("EXEC AddUser ?,?,?,?,?,?,?", uname, full_name, pwd_hash, role, 1 if active else 0, email or '', phone or '')
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            return None
-
-        #self.add_activity(f'Added user {uname}', user=uname)
-
-        return uname
-
-    def authenticate_user(self, username, password):
-        uname = str(username).strip()
-        users = self.get_users()
-        if uname not in users:
-            return False, None
-        expected = users[uname].get('password')
-        got = self._hash_password(uname, password)
-        if expected and got and expected == got:
-            return True, users[uname].get('role')
-        return False, None
-
-    def update_user(self, username, full_name=None, password=None, role=None, active=None, email=None, phone=None):
-        users = self.get_users()
-        if username not in users:
-            return False
-        
-        # Prepare values for update
-        pwd_hash = self._hash_password(username, password) if password is not None else None
-        
-        # Update in database
-        try:
-            cursor.execute("EXEC UpdateUser ?,?,?,?,?,?,?", username, full_name, pwd_hash, role, 1 if active else 0 if active is not None else None, email, phone)
-            conn.commit()
-        except Exception:
-            conn.rollback()
+            return bool(widget.winfo_exists())
+        except tk.TclError:
             return False
 
-        #self.add_activity(f'Updated user {username}', user=username)
-
-        return True
-
-    def toggle_user_status(self, username):
-        """
-        Toggle the active status of a user. Returns (True, new_status) on success,
-        or (False, error_message) on failure.
-        """
-        users = self.get_users()
-        if username not in users:
-            return False, 'User not found'
-
-        # Toggle in database
-        try:
-            cursor.execute("EXEC ToggleUserStatus ?", username)
-            row = cursor.fetchone()
-            conn.commit()
-            if row is not None:
-                new_active = bool(row[0])
-                self.add_activity(f'User {username} status toggled to {"Active" if new_active else "Inactive"}', user=username)
-                return True, new_active
-            else:
-                return False, 'Toggle did not return status'
-        except Exception as e:
-            conn.rollback()
-            return False, str(e)
-
-    def delete_user(self, username):
-        users = self.get_users()
-        if username in users:
+    def _count_widgets(self, widget):
+        return 1 + sum(self._count_widgets(child) for child in widget.winfo_children())
+
+    def _report(self, name, summary, top, growth):
+        lines = [f"{datetime.now():%Y-%m-%d %H:%M:%S}  view {name} (visit {summary['visits']}): "
+                 f"traced {summary['traced_bytes'] / 1048576:.1f} MB ({summary['growth_bytes'] / 1024:+.0f} KB "
+                 f"since last visit), {summary['widgets']} Tk widgets, {summary['leaked_widgets']} leaked widget "
+                 f"objects, {summary['records']} records alive"]
+        if summary['stale']:
+            lines.append('  stale frontend attributes: ' + ', '.join(summary['stale']))
+        if growth:
+            lines.append('  growth since last visit:')
+            lines.extend(f'    {stat.size_diff / 1024:+9.1f} KB  {stat.traceback}' for stat in growth)
+        lines.append('  top allocation sites:')
+        lines.extend(f'    {stat.size / 1024:9.1f} KB  {stat.traceback}' for stat in top)
+        if self.log_path:
             try:
-                cursor.execute("EXEC DeleteUser ?", username)
-                conn.commit()
-            except Exception:
-                conn.rollback()
-                return False
-            #self.add_activity(f'Deleted user {username}', user=username)
-            return True
-        return False
-
-    def update_supplier(self, supplier_id, name=None, company=None, phone=None, email=None, active=None, user=None):
-        # Update supplier details (supports company and active status)
-        suppliers = self.get_suppliers()
-        if supplier_id not in suppliers:
-            return False
-        
-        # Get current values
-        supplier = suppliers[supplier_id]
-        final_name = name if name is not None else supplier.get('name', '')
-        final_company = company if company is not None else supplier.get('company', '')
-        final_phone = phone if phone is not None else supplier.get('phone', '')
-        final_email = email if email is not None else supplier.get('email', '')
-        final_active = active if active is not None else supplier.get('active', True)
-        
-        # Persist to DB via stored procedure
-        try:
-            cursor.execute("EXEC UpdateSupplier ?,?,?,?,?,?,?", int(supplier_id), final_name, final_company, final_phone, final_email, 1 if final_active else 0, user)
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            return False
-        
-        #self.add_activity(f'Updated supplier {supplier_id}', user=None)
-        return True
-    
-    def delete_supplier(self, supplier_id, user=None):
-        # Delete a supplier
-        suppliers = self.get_suppliers()
-        if supplier_id in suppliers:
-            try:
-                cursor.execute("EXEC DeleteSupplier ?,?", int(supplier_id), user)
-                conn.commit()
-            except Exception:
-                conn.rollback()
-                return False
-            #self.add_activity(f'Deleted supplier {supplier_id}', user=None)
-            return True
-        return False
-
-    def toggle_supplier_status(self, supplier_id, user=None):
-        """
-        Toggle the active status of a supplier. Returns (True, new_status) on success,
-        or (False, error_message) on failure.
-        """
-        suppliers = self.get_suppliers()
-        if supplier_id not in suppliers:
-            return False, 'Supplier not found'
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+            except OSError:
+                pass
 
-        try:
-            cursor.execute("EXEC ToggleSupplierStatus ?,?", int(supplier_id), user)
-            row = cursor.fetchone()
-            conn.commit()
-            if row is not None:
-                new_active = bool(row[0])
-                #self.add_activity(f'Supplier {supplier_id} status toggled to {"Active" if new_active else "Inactive"}', user=None)
-                return True, new_active
-            else:
-                return False, 'Toggle did not return status'
-        except Exception as e:
-            conn.rollback()
-            return False, str(e)
+class RefreshBus:
+    """Coalesces view refreshes after writes.
+    Writes publish the topics they changed ('medicines', 'adjustments',
+    'returns', ...). Every view subscribed to any of them is refreshed once, on
+    the next Tk idle cycle, however many topics or publishes named it. While a
+    flush runs, shared(name, fetch) hands every view the same fetched data so
+    each entity is read from the database at most once per flush.
+    """
 
-    def search_suppliers(self, query):
-        # Use DB-side search when available
-        results = {}
-        try:
-            try:
-                cursor.execute("EXEC SearchSuppliers ?", query or '')
-                rows = cursor.fetchall()
-            except Exception:
-                rows = None
-
-            if rows is None:
-                q = (query or '').lower()
-                suppliers = self.get_suppliers()
-                for sid, sup in suppliers.items():
-                    try:
-                        if (q in sup.get('name','').lower() or
-                            q in sup.get('company','').lower() or
-                            q in sup.get('phone','').lower() or
-                            q in sup.get('email','').lower() or
-                            q in sid.lower()):
-                            results[sid] = sup
-                    except Exception:
-                        continue
-                return results
-
-            for r in rows:
-                sid = str(r[0])
-                results[sid] = {
-                    'name': r[1] or '',
-                    'company': r[2] or '',
-                    'phone': r[3] or '',
-                    'email': r[4] or '',
-                    'active': bool(r[5]) if r[5] is not None else True,
-                    'created_date': r[6] if len(r) > 6 else None
-                }
-            return results
-        except Exception:
-            q = (query or '').lower()
-            suppliers = self.get_suppliers()
-            for sid, sup in suppliers.items():
-                try:
-                    if (q in sup.get('name','').lower() or q in sup.get('company','').lower() or q in sup.get('phone','').lower() or q in sup.get('email','').lower() or q in sid.lower()):
-                        results[sid] = sup
-                except Exception:
-                    continue
-            return results
+    def __init__(self, root):
+        self.root = root
+        self._subscribers = {}
+        self._pending = []
+        self._scheduled = False
+        self._shared = None
+        self._listeners = []
+        # shared() fetches reused within a flush / made, for the metrics endpoint
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def listen(self, callback):
+        """Call `callback(topics)` synchronously on every publish."""
+        self._listeners.append(callback)
+
+    def subscribe(self, topic, callback):
+        callbacks = self._subscribers.setdefault(topic, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def publish(self, *topics):
+        for listener in self._listeners:
+            listener(topics)
+        for topic in topics:
+            for callback in self._subscribers.get(topic, ()):
+                if callback not in self._pending:
+                    self._pending.append(callback)
+        if self._pending and not self._scheduled:
+            self._scheduled = True
+            self.root.after_idle(self._flush)
+
+    def shared(self, name, fetch):
+        """fetch() once per flush; outside a flush it is simply called."""
+        if self._shared is None:
+            return fetch()
+        if name not in self._shared:
+            self.shared_misses += 1
+            self._shared[name] = fetch()
+        else:
+            self.shared_hits += 1
+        return self._shared[name]
 
-    def search_users(self, query):
-        # Search users via DB procedure when available
-        results = {}
+    def _flush(self):
+        self._scheduled = False
+        callbacks, self._pending = self._pending, []
+        self._shared = {}
         try:
-            try:
-                cursor.execute("EXEC SearchUsers ?", query or '')
-                rows = cursor.fetchall()
-            except Exception:
-                rows = None
-
-            if rows is None:
-                q = (query or '').lower()
-                users = self.get_users()
-                for uname, info in users.items():
-                    try:
-                        if (q in uname.lower() or q in info.get('full_name','').lower() or q in info.get('email','').lower() or q in info.get('phone','').lower()):
-                            results[uname] = info
-                    except Exception:
-                        continue
-                return results
-
-            for r in rows:
-                uname = r[0]
-                results[uname] = {
-                    'full_name': r[1] or '',
-                    'password': r[2] or '',
-                    'role': r[3] or '',
-                    'active': bool(r[4]) if r[4] is not None else True,
-                    'email': r[5] or '',
-                    'phone': r[6] or ''
-                }
-            return results
-        except Exception:
-            q = (query or '').lower()
-            users = self.get_users()
-            for uname, info in users.items():
+            for callback in callbacks:
                 try:
-                    if (q in uname.lower() or q in info.get('full_name','').lower() or q in info.get('email','').lower() or q in info.get('phone','').lower()):
-                        results[uname] = info
-                except Exception:
-                    continue
-            return results
+                    callback()
+                except tk.TclError:
+                    # The view was torn down between publish and flush
+                    pass
+        finally:
+            self._shared = None
+
+def reconcile_tree(tree, rows):
+    """Bring `tree` in line with `rows` ((iid, values, tags) tuples, in display order)
+    by touching only what changed: stale items are deleted, new ones inserted, and
+    existing ones updated only when the hash of their values/tags differs. Items are
+    keyed by entity ID, so a selection survives a refresh.
+    """
+    hashes = getattr(tree, '_row_hashes', None)
+    if hashes is None:
+        hashes = tree._row_hashes = {}
+    existing = tree.get_children()
+    wanted = {iid for iid, _values, _tags in rows}
+
+    stale = [iid for iid in existing if iid not in wanted]
+    if stale:
+        tree.delete(*stale)
+    present = set(existing) - set(stale)
+    for iid in list(hashes):
+        if iid not in present:
+            del hashes[iid]
+
+    # Rows that survive keep their relative order unless the sort changed
+    kept = [iid for iid in existing if iid in present]
+    ordered = [iid for iid, _values, _tags in rows if iid in present]
+    if kept != ordered:
+        for index, iid in enumerate(ordered):
+            tree.move(iid, '', index)
+
+    for index, (iid, values, tags) in enumerate(rows):
+        digest = hash((values, tags))
+        if iid not in present:
+            tree.insert('', index, iid=iid, values=values, tags=tags)
+        elif hashes.get(iid) != digest:
+            tree.item(iid, values=values, tags=tags)
+        hashes[iid] = digest
+
+class TreePager:
+    """Server-side paging and sorting for one list view.
+    The Treeview only ever holds one page. Clicking a sortable heading, the
+    Prev/Next buttons and set_search() all re-query the backend through
+    `fetch_page(offset, limit, sort, descending, search) -> (rows, has_more)`;
+    `row_for(key, record) -> (values, tags)` formats one row for reconcile_tree. `sort_keys` maps heading names to
+    backend sort keys; headings not in it stay unsortable.
+    """
+
+    def __init__(self, parent, tree, fetch_page, row_for, sort_keys, sort, descending=False,
+                 page_size=PAGE_SIZE):
+        self.tree = tree
+        self.fetch_page = fetch_page
+        self.row_for = row_for
+        self.sort_keys = sort_keys
+        self.sort = sort
+        self.descending = descending
+        self.page_size = page_size
+        self.offset = 0
+        self.search = None
+        self.has_more = False
+        self._titles = {col: tree.heading(col, 'text') for col in tree['columns']}
+        for col in sort_keys:
+            tree.heading(col, command=lambda c=col: self.sort_by(c))
+
+        self.frame = ttk.Frame(parent)
+        self.prev_button = ttk.Button(self.frame, text='< Prev', command=self.prev_page)
+        self.prev_button.pack(side='left', padx=4)
+        self.next_button = ttk.Button(self.frame, text='Next >', command=self.next_page)
+        self.next_button.pack(side='left', padx=4)
+        self.status_var = tk.StringVar()
+        ttk.Label(self.frame, textvariable=self.status_var).pack(side='left', padx=8)
+
+    def sort_by(self, col):
+        key = self.sort_keys[col]
+        if key == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = key, False
+        self.offset = 0
+        self.reload()
+
+    def set_search(self, text):
+        self.search = (text or '').strip() or None
+        self.offset = 0
+        self.reload()
+
+    def next_page(self):
+        if self.has_more:
+            self.offset += self.page_size
+            self.reload()
+
+    def prev_page(self):
+        if self.offset > 0:
+            self.offset = max(0, self.offset - self.page_size)
+            self.reload()
+
+    def reload(self):
+        """Fetch and redraw the current page."""
+        rows, self.has_more = self.fetch_page(self.offset, self.page_size, self.sort,
+                                              self.descending, self.search)
+        if not rows and self.offset > 0:
+            # The page emptied under us (e.g. its last row was deleted); step back
+            self.offset = max(0, self.offset - self.page_size)
+            rows, self.has_more = self.fetch_page(self.offset, self.page_size, self.sort,
+                                                  self.descending, self.search)
+        reconcile_tree(self.tree, [(str(key),) + self.row_for(key, record) for key, record in rows])
+
+        for col, title in self._titles.items():
+            if self.sort_keys.get(col) == self.sort:
+                title = f"{title} {'▼' if self.descending else '▲'}"
+            self.tree.heading(col, text=title)
+        self.prev_button.state(['!disabled'] if self.offset > 0 else ['disabled'])
+        self.next_button.state(['!disabled'] if self.has_more else ['disabled'])
+        if rows:
+            self.status_var.set(f"Rows {self.offset + 1}-{self.offset + len(rows)}")
+        else:
+            self.status_var.set('No rows')
 
 class PharmacyFrontend:
-    def __init__(self, root):
+    def __init__(self, root, backend=None, connector=None, profiler=None, memory_profiler=None):
         self.root = root
         self.root.title("Pharmacy Management System")
-        # Backend is created early so start-up preferences can be respected
-        # (backend initialized below after root setup)
-
-        # Initialize backend early so we can read startup settings
-        self.backend = PharmacyBackend()
-
-        # Use configured pharmacy name in the window title
-        settings = self.backend.get_settings()
+        # Startup is staged: the login window comes up straight away while
+        # `connector` opens the database connection in the background; it is
+        # adopted when the user logs in (see _ensure_connected).
+        self.connector = connector
+        self.profiler = profiler or StartupProfiler()
+        self.memory_profiler = memory_profiler or MemoryProfiler()
+
+        # Initialize backend early so we can read startup settings (it does not connect yet)
+        with self.profiler.phase('backend init'):
+            self.backend = backend or PharmacyBackend(load_config())
+        # Count database round-trips and time the handler of every click / view change,
+        # and watch the event loop for stalls (see the Diagnostics screen)
+        self.watchdog = StallWatchdog(self.root, local_data_path('ui_stalls.log'))
+        ActionCallWrapper.install(self.backend.tracer, self.watchdog)
+        self.watchdog.start()
+
+        # Use configured pharmacy name in the window title (last known; the server may not be up yet)
+        settings = self.backend.get_cached_settings()
         self.root.title(f"{settings.get('pharmacy_name', 'Pharmacy')} - Pharmacy Management")
-        self.current_cart = []
+        # Suspended carts so a cashier can serve the next customer while one waits
+        self.parked_carts = ParkedCartStore(local_data_path('parked_carts.json'))
+        # Recover the active cart from the crash-safe journal (empty on a clean start)
+        self.cart_journal = CartJournal(local_data_path('cart_journal.jsonl'))
+        self.current_cart, self._journal_customer = self.cart_journal.replay()
+        self.cart_journal.compact(self.current_cart, self._journal_customer)
+        self._cart_recovered = bool(self.current_cart)
+        # Idempotency key of the sale being paid for; kept until the cart changes so a
+        # double-click or a retry after an error cannot record the same sale twice
+        self._sale_key = None
+        self._schedule_journal_sync()
+        # Send sales queued while offline once the server is reachable again
+        self.sale_replayer = SaleReplayer(self.backend)
+        self.sale_replayer.start()
+        self._known_conflicts = len(self.backend.sale_queue.conflicts)
+        self.root.after(2000, self._poll_sale_replayer)
+        # Writes publish what they changed; visible views refresh once per idle cycle
+        self.refresh_bus = RefreshBus(self.root)
+        for topic, callback in (('medicines', self.refresh_medicines),
+                                ('medicines', self.refresh_stock),
+                                ('medicines', self.refresh_stock_medicines_list),
+                                ('medicines', self.refresh_sales_medicines),
+                                ('adjustments', self.refresh_stock_history),
+                                ('returns', self.refresh_returns),
+                                ('customers', self.refresh_customers),
+                                ('customers', self.refresh_sales_customers),
+                                ('suppliers', self.refresh_suppliers),
+                                ('suppliers', self.refresh_stock_suppliers_list),
+                                ('users', self.refresh_users)):
+            self.refresh_bus.subscribe(topic, callback)
+        # Hidden views are not refreshed; they are marked stale and catch up when shown
+        self.refresh_bus.listen(self._mark_views_stale)
+        # Optional Prometheus endpoint on localhost (off unless metrics_port is configured)
+        self.metrics_server = None
+        if self.backend.config.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.backend.config.metrics_port,
+                                                    [lambda: backend_metrics(self.backend), self._ui_metrics]).start()
+            except OSError as e:
+                print(f'Metrics endpoint not started on port {self.backend.config.metrics_port}: {e}',
+                      file=sys.stderr)
+        self._views = {}
+        self._stale_views = set()
+        self._current_view = None
 
         # Setup styles
         self.setup_styles()
@@ -1256,6 +613,7 @@ class PharmacyFrontend:
             except Exception:
                 self.root.attributes('-zoomed', True)
             if sys.platform == 'win32':
+                import ctypes
                 hwnd = self.root.winfo_id()
                 ctypes.windll.user32.ShowWindow(hwnd, 3)  # SW_MAXIMIZE
             
@@ -1284,6 +642,23 @@ class PharmacyFrontend:
         self.current_role = None
         self.show_login_dialog()
     
+    def _ui_metrics(self):
+        # Event-loop health and UI-side caching for the metrics endpoint
+        ui = self.watchdog.stats()
+        return [
+            MetricFamily('pharmacy_ui_stalls_total', 'counter', 'Times the Tk event loop was stuck past the threshold')
+            .add(ui['stalls']),
+            MetricFamily('pharmacy_ui_tick_lag_seconds', 'gauge', 'Lateness of the watchdog tick over the last minute')
+            .add(ui['lag_p50_ms'] / 1000.0, quantile='0.5').add(ui['lag_p95_ms'] / 1000.0, quantile='0.95')
+            .add(ui['lag_max_ms'] / 1000.0, quantile='1'),
+            MetricFamily('pharmacy_ui_slow_handlers_total', 'counter', 'Handler runs that blocked the event loop')
+            .add(sum(h['slow'] for h in ui['handlers'])),
+            MetricFamily('pharmacy_cache_hits_total', 'counter', 'Lookups answered from a cache')
+            .add(self.refresh_bus.shared_hits, cache='refresh_bus'),
+            MetricFamily('pharmacy_cache_misses_total', 'counter', 'Lookups the cache could not answer')
+            .add(self.refresh_bus.shared_misses, cache='refresh_bus'),
+        ]
+
     def setup_styles(self):
         # Configure styles for the application
         style = ttk.Style()
@@ -1316,6 +691,10 @@ class PharmacyFrontend:
         
         ph_settings = self.backend.get_settings()
         ttk.Label(header_frame, text=ph_settings.get('pharmacy_name', 'Pharmacy').upper(), style='Title.TLabel').pack(side='left')
+        # Connection / offline queue status
+        self.connection_status_var = tk.StringVar()
+        ttk.Label(header_frame, textvariable=self.connection_status_var).pack(side='right')
+        self.update_connection_status()
         
         # Navigation
         nav_frame = ttk.Frame(self.root)
@@ -1349,12 +728,21 @@ class PharmacyFrontend:
         self.users_btn = ttk.Button(nav_frame, text="Users", command=self.show_users)
         if getattr(self, 'current_role', None) == 'admin':
             self.users_btn.pack(side='left', padx=5)
+        # Query timings of this session (admin only)
+        self.diagnostics_btn = ttk.Button(nav_frame, text="Diagnostics", command=self.show_diagnostics)
+        if getattr(self, 'current_role', None) == 'admin':
+            self.diagnostics_btn.pack(side='left', padx=5)
         ttk.Button(nav_frame, text="Logout", command=self.logout).pack(side='right', padx=5)
         ttk.Button(nav_frame, text="Exit", command=self.confirm_exit, style='Danger.TButton').pack(side='right', padx=5)
         
-        # Main content area
-        self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        # Main content area. Each screen gets its own child frame, built on first
+        # visit and then hidden and shown on navigation (see _switch_view).
+        self.content_frame = ttk.Frame(self.root)
+        self.content_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        self.main_frame = self.content_frame
+        self._views = {}
+        self._stale_views = set()
+        self._current_view = None
 
     def amount_to_words(self, amount: float) -> str:
         # Convert a numeric amount to words (supports dollars and cents style).
@@ -1420,14 +808,88 @@ class PharmacyFrontend:
         # Prevent default handling
         return "break"
     
-    def clear_main_frame(self):
-        # Clear the main content area
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
+    # Screen name -> (topics that make it stale while hidden, refresh run when it is
+    # shown again). Screens without a refresh are rebuilt when they went stale.
+    VIEW_SPECS = {
+        'dashboard': (('medicines', 'sales', 'returns', 'settings'), None),
+        'medicines': (('medicines', 'suppliers', 'settings'), 'refresh_medicines'),
+        'sales': (('medicines', 'customers', 'settings'), '_refresh_sales_view'),
+        'returns': (('returns', 'sales', 'medicines', 'settings'), '_refresh_returns_view'),
+        'stock': (('medicines', 'adjustments', 'suppliers'), '_refresh_stock_view'),
+        'customers': (('customers', 'sales', 'returns', 'settings'), 'refresh_customers'),
+        'suppliers': (('suppliers',), 'refresh_suppliers'),
+        'users': (('users',), 'refresh_users'),
+        'reports': (('medicines', 'sales', 'returns', 'customers', 'settings'), 'generate_report'),
+        'activity': (('medicines', 'adjustments', 'sales', 'returns', 'customers', 'suppliers', 'users'),
+                     'refresh_activity_log'),
+        'settings': ((), None),
+        'diagnostics': ((), 'refresh_diagnostics'),
+    }
+
+    def _switch_view(self, name):
+        """Show screen `name`. Returns True when a cached instance was brought back
+        (refreshed first if it went stale); False when the caller must build it into
+        the fresh, empty self.main_frame.
+        """
+        current = self._views.get(self._current_view)
+        if current is not None:
+            current.pack_forget()
+        self._current_view = name
+        if self.memory_profiler.enabled:
+            # Once the screen is built / refreshed
+            self.root.after_idle(lambda: self.memory_profiler.view_shown(name, self))
+        _topics, refresh = self.VIEW_SPECS[name]
+        frame = self._views.get(name)
+        if frame is not None and frame.winfo_exists():
+            if name not in self._stale_views or refresh is not None:
+                self.main_frame = frame
+                frame.pack(fill='both', expand=True)
+                if name in self._stale_views:
+                    self._stale_views.discard(name)
+                    getattr(self, refresh)()
+                return True
+            frame.destroy()
+        self._stale_views.discard(name)
+        self.main_frame = self._views[name] = ttk.Frame(self.content_frame)
+        self.main_frame.pack(fill='both', expand=True)
+        return False
+
+    def _mark_views_stale(self, topics):
+        for name in self._views:
+            if name != self._current_view and set(topics) & set(self.VIEW_SPECS[name][0]):
+                self._stale_views.add(name)
+
+    def _view_visible(self, attr):
+        # True while the widget stored in `attr` belongs to the screen on show
+        widget = getattr(self, attr, None)
+        try:
+            return (widget is not None and bool(widget.winfo_exists())
+                    and str(widget).startswith(str(self.main_frame) + '.'))
+        except Exception:
+            return False
+
+    def _shared_medicines(self):
+        # One medicines fetch shared by every view refreshed in the same flush
+        return self.refresh_bus.shared('medicines', self.backend.get_medicines)
+
+    def _refresh_sales_view(self):
+        self.refresh_sales_medicines()
+        self.refresh_sales_customers()
+
+    def _refresh_returns_view(self):
+        self.refresh_returns()
+        self._refresh_returns_sales_list()
+        self._on_return_sale_selected()
+
+    def _refresh_stock_view(self):
+        self.refresh_stock_medicines_list()
+        self.refresh_stock_suppliers_list()
+        self.refresh_stock_history()
     
     def show_dashboard(self):
         # Display dashboard screen
-        self.clear_main_frame()
+        if self._switch_view('dashboard'):
+            return
         
         stats = self.backend.get_dashboard_stats()
         total_medicines = stats.get('total_medicines', 0)
@@ -1495,52 +957,10 @@ class PharmacyFrontend:
         
         tree.pack(fill='both', expand=True, pady=5)
         
-        # Load sales via stored procedures (no inline SELECT)
-        recent_sales = []
+        # Load sales (with their lines) through the backend
         try:
-            try:
-                cursor.execute("EXEC GetAllSales")
-                rows = cursor.fetchall()
-            except Exception:
-                rows = []
-
-            sales_map = {}
-            for r in rows:
-                sid = r[0]
-                sid_key = str(sid)
-                sales_map[sid_key] = {
-                    'customer_id': str(r[1]) if r[1] is not None else None,
-                    'customer_name': r[2] or '',
-                    'items': [],
-                    'subtotal': float(r[3] or 0),
-                    'tax': float(r[4] or 0),
-                    'total': float(r[5] or 0),
-                    'timestamp': r[6] if len(r) > 6 else None,
-                    'user_fullname': r[7] if len(r) > 7 else None
-                }
-
-            # Populate items via stored procedure
-            try:
-                cursor.execute("EXEC GetAllSaleDetails")
-                detail_rows = cursor.fetchall()
-            except Exception:
-                detail_rows = []
-
-            for dr in detail_rows:
-                sid = dr[0]
-                sid_key = str(sid)
-                if sid_key in sales_map:
-                    if len(dr) >= 4:
-                        mid = dr[1]
-                        mname = dr[2] if len(dr) >= 3 else ''
-                        qty = int(dr[3] or 0)
-                        sales_map[sid_key]['items'].append({'medicine_id': str(mid), 'medicine_name': mname, 'quantity': qty})
-                    else:
-                        mid = dr[1]
-                        qty = int(dr[2] or 0)
-                        sales_map[sid_key]['items'].append({'medicine_id': str(mid), 'medicine_name': '', 'quantity': qty})
-
-            recent_sales = sorted(sales_map.items(), key=lambda x: x[1].get('timestamp', datetime.min), reverse=True)
+            recent_sales = sorted(self.backend.get_sales().items(),
+                                  key=lambda x: x[1].get('timestamp') or datetime.min, reverse=True)
         except Exception:
             recent_sales = []
 
@@ -1566,7 +986,8 @@ class PharmacyFrontend:
     
     def show_stock_management(self):
         # Display stock management screen with stock in/out functionality
-        self.clear_main_frame()
+        if self._switch_view('stock'):
+            return
         
         # Header
         header_frame = ttk.Frame(self.main_frame)
@@ -1663,16 +1084,11 @@ class PharmacyFrontend:
         self.refresh_stock_history()
     
     def refresh_stock_medicines_list(self):
-        if not hasattr(self, 'stock_med_combo'):
-            return
-        try:
-            if not self.stock_med_combo.winfo_exists():
-                return
-        except:
+        if not self._view_visible('stock_med_combo'):
             return
 
         meds = []
-        for mid, med in self.backend.get_medicines().items():
+        for mid, med in self._shared_medicines().items():
             meds.append(f"{mid}: {med.get('name','')} (Current: {med.get('quantity',0)})")
         try:
             self.stock_med_combo['values'] = meds
@@ -1683,12 +1099,7 @@ class PharmacyFrontend:
             return
     
     def refresh_stock_suppliers_list(self):
-        if not hasattr(self, 'stock_supplier_combo'):
-            return
-        try:
-            if not self.stock_supplier_combo.winfo_exists():
-                return
-        except:
+        if not self._view_visible('stock_supplier_combo'):
             return
 
         suppliers = ['']
@@ -1718,22 +1129,8 @@ class PharmacyFrontend:
             messagebox.showerror('Error', 'Please enter a valid quantity')
             return
         
-        medicines = self.backend.get_medicines()
-        if med_id not in medicines:
-            messagebox.showerror('Error', 'Invalid medicine selected')
-            return
-        med = medicines[med_id]
-        old_qty = int(med.get('quantity', 0))
         movement_type = self.stock_type_var.get()
-        
-        # Calculate new quantity
-        if movement_type == 'in':
-            new_qty = old_qty + qty
-        else:  # stock out
-            new_qty = old_qty - qty
-            if new_qty < 0:
-                messagebox.showerror('Error', f'Insufficient stock. Current quantity: {old_qty}')
-                return
+        delta = qty if movement_type == 'in' else -qty
         
         # Get supplier if provided
         sup_sel = self.stock_supplier_var.get().strip()
@@ -1749,46 +1146,32 @@ class PharmacyFrontend:
         if not reason:
             reason = f'Stock {movement_type.upper()}'
         
-        # Update stock (pass current user so stored procedure can log activity)
-        success = self.backend.update_medicine(med_id, quantity=new_qty, user=getattr(self, 'current_user', None))
-        if success:
-            # The DB `UpdateMedicine` stored procedure creates the stock adjustment
-            # and activity log when quantity changes. Avoid duplicating that here.
+        # Apply the movement as a delta in one atomic database call (it also records
+        # the stock adjustment and activity log, and rejects stock going negative)
+        result, error = self.backend.apply_stock_delta(med_id, delta, supplier_id=sup_id, reason=reason,
+                                                       user=getattr(self, 'current_user', None))
+        if result:
             messagebox.showinfo('Success', 
                 f'Stock {movement_type.upper()} processed successfully!\n'
-                f'Medicine: {med.get("name")}\n'
-                f'Old Quantity: {old_qty}\n'
-                f'New Quantity: {new_qty}\n'
-                f'Change: {new_qty - old_qty:+d}')
+                f'Medicine: {result["name"]}\n'
+                f'Old Quantity: {result["old_qty"]}\n'
+                f'New Quantity: {result["new_qty"]}\n'
+                f'Change: {result["new_qty"] - result["old_qty"]:+d}')
             
             # Clear form
             self.stock_qty_var.set('1')
             self.stock_reason_var.set('')
             self.stock_supplier_var.set('')
             
-            # Refresh displays
-            self.refresh_stock_medicines_list()
-            self.refresh_stock_history()
-            
-            # Also refresh other stock views if visible
-            if hasattr(self, 'stock_tree'):
-                self.refresh_stock()
-            if hasattr(self, 'medicines_tree'):
-                self.refresh_medicines()
+            # Refresh whichever views are showing stock
+            self.refresh_bus.publish('medicines', 'adjustments')
         else:
-            messagebox.showerror('Error', 'Failed to update stock')
+            messagebox.showerror('Error', f'Failed to update stock: {error}')
     
     def refresh_stock_history(self):
-        # Guard: widget may have been destroyed if the view changed while a
-        # background callback is running (common when dialogs close). Check
-        # attribute existence and that the underlying Tcl widget still exists
-        # before attempting tree operations.
-        if not hasattr(self, 'stock_history_tree'):
-            return
-        try:
-            if not self.stock_history_tree.winfo_exists():
-                return
-        except Exception:
+        # Guard: the stock screen may be hidden (or gone) when a background
+        # callback or a refresh-bus flush gets here
+        if not self._view_visible('stock_history_tree'):
             return
 
         adjustments = sorted(self.backend.get_stock_adjustments().items(),
@@ -1815,13 +1198,16 @@ class PharmacyFrontend:
             # The widget no longer exists at the Tcl level; nothing to do.
             return
 
+        # Lookups for rows the detailed view could not name; fetched once, on demand
+        medicines = suppliers = None
         for adj_id, adj in adjustments:
             med_id = adj.get('medicine_id')
-            medicines = self.backend.get_medicines()
-            med_name = medicines.get(med_id, {}).get('name', med_id)
             # Prefer the medicine_name provided by the detailed view when available
-            if adj.get('medicine_name'):
-                med_name = adj.get('medicine_name')
+            med_name = adj.get('medicine_name')
+            if not med_name:
+                if medicines is None:
+                    medicines = self._shared_medicines()
+                med_name = medicines.get(med_id, {}).get('name', med_id)
 
             # Apply optional filter
             if filter_query:
@@ -1849,7 +1235,8 @@ class PharmacyFrontend:
             sup_name = adj.get('supplier_name') or ''
             if not sup_name:
                 sup_id = adj.get('supplier_id', '')
-                suppliers = self.backend.get_suppliers()
+                if sup_id and suppliers is None:
+                    suppliers = self.backend.get_suppliers()
                 if sup_id and sup_id in suppliers:
                     sup_name = suppliers[sup_id].get('name', sup_id)
 
@@ -1899,7 +1286,8 @@ class PharmacyFrontend:
 
 
     def show_medicines(self):
-        self.clear_main_frame()
+        if self._switch_view('medicines'):
+            return
 
         header_frame = ttk.Frame(self.main_frame)
         header_frame.pack(fill='x', pady=10)
@@ -1925,9 +1313,9 @@ class PharmacyFrontend:
         ttk.Entry(toolbar, textvariable=self.meds_search_var, width=30).pack(side='right', padx=5)
         # Auto-refresh medicines list when search box is cleared
         try:
-            self.meds_search_var.trace_add('write', lambda *a: self.refresh_medicines() if not (self.meds_search_var.get() or '').strip() else None)
+            self.meds_search_var.trace_add('write', lambda *a: self.search_medicines_in_medicines_tab() if not (self.meds_search_var.get() or '').strip() else None)
         except Exception:
-            self.meds_search_var.trace('w', lambda *a: self.refresh_medicines() if not (self.meds_search_var.get() or '').strip() else None)
+            self.meds_search_var.trace('w', lambda *a: self.search_medicines_in_medicines_tab() if not (self.meds_search_var.get() or '').strip() else None)
         ttk.Button(toolbar, text="Search", command=self.search_medicines_in_medicines_tab).pack(side='right', padx=5)
 
         # Medicines table
@@ -1952,6 +1340,15 @@ class PharmacyFrontend:
         self.medicines_tree.configure(yscrollcommand=scrollbar.set)
         self.medicines_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
+        self.medicines_tree.tag_configure('low_stock', background='#ffcccc')
+
+        # One page at a time; headings sort on the server
+        self.medicines_pager = TreePager(
+            self.main_frame, self.medicines_tree, self.backend.get_medicines_page, self._medicine_row,
+            {'ID': 'MedicineID', 'Name': 'Name', 'Category': 'Category', 'Supplier': 'SupplierName',
+             'Quantity': 'Quantity', 'Min Stock': 'MinimumStock', 'Price': 'Price', 'Created': 'CreatedDate'},
+            sort='Name')
+        self.medicines_pager.frame.pack(fill='x')
 
         # Bind click for possible row actions
         self.medicines_tree.bind('<ButtonRelease-1>', self.on_medicines_click)
@@ -1960,26 +1357,24 @@ class PharmacyFrontend:
         self.refresh_medicines()
     
     def refresh_stock(self):
-        if not hasattr(self, 'stock_tree'):
+        if not self._view_visible('stock_tree'):
             return
         try:
-            for item in self.stock_tree.get_children():
-                self.stock_tree.delete(item)
-
-            for med_id, medicine in self.backend.get_medicines().items():
+            medicines = self._shared_medicines()
+            rows = []
+            for med_id, medicine in medicines.items():
                 tags = () if int(medicine.get('quantity', 0)) >= 10 else ('low_stock',)
-
-                self.stock_tree.insert('', 'end', values=(
+                rows.append((med_id, (
                     med_id,
                     medicine.get('name', ''),
                     medicine.get('category', ''),
                     medicine.get('quantity', 0),
                     self.format_currency(medicine.get('price', 0))
-                ), tags=tags)
+                ), tags))
+            reconcile_tree(self.stock_tree, rows)
 
             self.stock_tree.tag_configure('low_stock', background='#ffcccc')
 
-            medicines = self.backend.get_medicines()
             total_value = sum(float(med.get('quantity', 0)) * float(med.get('price', 0)) for med in medicines.values())
             total_items = sum(int(med.get('quantity', 0)) for med in medicines.values())
 
@@ -1994,39 +1389,34 @@ class PharmacyFrontend:
             return
 
     def refresh_medicines(self):
-        if not hasattr(self, 'medicines_tree'):
+        if not hasattr(self, 'medicines_pager') or not self._view_visible('medicines_tree'):
             return
         try:
-            for item in self.medicines_tree.get_children():
-                self.medicines_tree.delete(item)
-
-            # Insert current medicines
-            for med_id, medicine in self.backend.get_medicines().items():
-                created = medicine.get('created_date')
-                created_str = created.strftime('%Y-%m-%d') if created else ''
-                tags = ()
-                qty = int(medicine.get('quantity', 0) or 0)
-                min_st = int(medicine.get('minimum_stock', 0) or 0)
-                if min_st > 0 and qty < min_st:
-                    tags = ('low_stock',)
-
-                self.medicines_tree.insert('', 'end', values=(
-                    med_id,
-                    medicine.get('name', ''),
-                    medicine.get('category', ''),
-                    medicine.get('supplier_name', ''),
-                    medicine.get('quantity', 0),
-                    medicine.get('minimum_stock', 0),
-                    self.format_currency(medicine.get('price', 0)),
-                    created_str
-                ), tags=tags)
-
-            self.medicines_tree.tag_configure('low_stock', background='#ffcccc')
-
-            self.root.update_idletasks()
+            # Re-query the page on screen (keeps sort, search and position)
+            self.medicines_pager.reload()
         except tk.TclError:
             return
 
+    def _medicine_row(self, med_id, medicine):
+        created = medicine.get('created_date')
+        created_str = created.strftime('%Y-%m-%d') if hasattr(created, 'strftime') else (created or '')[:10]
+        tags = ()
+        qty = int(medicine.get('quantity', 0) or 0)
+        min_st = int(medicine.get('minimum_stock', 0) or 0)
+        if min_st > 0 and qty < min_st:
+            tags = ('low_stock',)
+
+        return (
+            med_id,
+            medicine.get('name', ''),
+            medicine.get('category', ''),
+            medicine.get('supplier_name', ''),
+            medicine.get('quantity', 0),
+            medicine.get('minimum_stock', 0),
+            self.format_currency(medicine.get('price', 0)),
+            created_str
+        ), tags
+
     def on_medicines_click(self, event):
         if not hasattr(self, 'medicines_tree'):
             return
@@ -2046,33 +1436,13 @@ class PharmacyFrontend:
 
 
     def search_medicines_in_medicines_tab(self):
-        if not hasattr(self, 'meds_search_var') or not hasattr(self, 'medicines_tree'):
+        if not hasattr(self, 'meds_search_var') or not hasattr(self, 'medicines_pager'):
             return
-
-        query = self.meds_search_var.get()
-        if not query:
-            self.refresh_medicines()
+        try:
+            # The filter runs on the server, paged and sorted like the full list
+            self.medicines_pager.set_search(self.meds_search_var.get())
+        except tk.TclError:
             return
-
-        results = self.backend.search_medicines(query)
-
-        for item in self.medicines_tree.get_children():
-            self.medicines_tree.delete(item)
-
-        for med_id, medicine in results.items():
-            created = medicine.get('created_date')
-            created_str = created.strftime('%Y-%m-%d') if created else ''
-            min_stock = medicine.get('minimum_stock', 0)
-            self.medicines_tree.insert('', 'end', values=(
-                med_id,
-                medicine['name'],
-                medicine['category'],
-                medicine.get('supplier_name',''),
-                medicine['quantity'],
-                min_stock,
-                self.format_currency(medicine['price']),
-                created_str
-            ))
     
     def show_add_medicine_dialog(self):
         # Show dialog to add new medicine
@@ -2181,9 +1551,11 @@ class PharmacyFrontend:
         except Exception:
             pass
         
-        medicines = self.backend.get_medicines()
-        if medicine_id and medicine_id in medicines:
-            medicine = medicines[medicine_id]
+        # Row version the form was loaded from; the update only applies if it is still current
+        loaded_version = {'value': None}
+        medicine = self.backend.get_medicine(medicine_id) if medicine_id else None
+        if medicine is not None:
+            loaded_version['value'] = medicine.get('row_version')
             name_var.set(medicine['name'])
             category_var.set(medicine['category'])
             quantity_var.set(str(medicine['quantity']))
@@ -2254,7 +1626,7 @@ class PharmacyFrontend:
 
             if medicine_id:
                 # Update existing (pass minimum_stock). Record adjustment if quantity changed.
-                success = self.backend.update_medicine(
+                success, new_version = self.backend.update_medicine(
                     medicine_id,
                     name=name,
                     category=category,
@@ -2269,21 +1641,27 @@ class PharmacyFrontend:
                     # (we pass supplier via backend by temporarily using update_medicine's DB read path)
                     
                     record_adjustment=False,
-                    reason=f'Edit via Medicines dialog: {medicine_id}'
+                    reason=f'Edit via Medicines dialog: {medicine_id}',
+                    expected_version=loaded_version['value']
                 )
                 if success:
-                    # Show status after update
-                    medicines = self.backend.get_medicines()
-                    status = medicines[medicine_id].get('status', 'ok') if medicine_id in medicines else 'ok'
+                    # Keep editing from the new version; show the status after update
+                    loaded_version['value'] = new_version
+                    updated = self.backend.get_medicine(medicine_id)
+                    status = updated.get('status', 'ok') if updated is not None else 'ok'
                     messagebox.showinfo("Success", f"Medicine updated successfully (Status: {status})")
+                elif self.backend.medicine_changed_since(medicine_id, loaded_version['value']):
+                    messagebox.showerror("Error", "This medicine was changed by another user while you were editing it.\n"
+                                                  "Close the dialog and open it again to see the latest values.")
+                    return
                 else:
                     messagebox.showerror("Error", "Failed to update medicine")
             else:
                 # Add new (include minimum_stock) — pass current user so stock history records who added it
                 new_med_id = self.backend.add_medicine(name, category, quantity, price, medicine_id=None, minimum_stock=min_stock, supplier_id=sup_id, user=getattr(self, 'current_user', None))
                 if new_med_id:
-                    medicines = self.backend.get_medicines()
-                    status = medicines[new_med_id].get('status', 'ok') if new_med_id in medicines else 'ok'
+                    added = self.backend.get_medicine(new_med_id)
+                    status = added.get('status', 'ok') if added is not None else 'ok'
                     messagebox.showinfo("Success", f"Medicine added successfully (Status: {status})")
                 else:
                     messagebox.showerror("Error", "Failed to add medicine")
@@ -2292,44 +1670,8 @@ class PharmacyFrontend:
             if close_after:
                 dialog.destroy()
 
-            # Update visible tables immediately for better UX
-            try:
-                if not medicine_id:
-                    # Instead of inserting a single row manually (which can miss
-                    # sort/filter state or leave inconsistent UI), refresh the
-                    # full medicines and stock views so the UI accurately
-                    # reflects the database after the add.
-                    if hasattr(self, 'medicines_tree'):
-                        try:
-                            self.refresh_medicines()
-                        except Exception:
-                            pass
-
-                    if hasattr(self, 'stock_tree'):
-                        try:
-                            self.refresh_stock()
-                        except Exception:
-                            pass
-
-                else:
-                    # For edits, refresh rows to reflect updates
-                    if hasattr(self, 'medicines_tree'):
-                        self.refresh_medicines()
-                    if hasattr(self, 'stock_tree'):
-                        self.refresh_stock()
-            except Exception:
-                pass  # If direct insert fails, tables will refresh on next view
-
-            # Refresh sales medicines list if present
-            if hasattr(self, 'sales_med_combo'):
-                self.refresh_sales_medicines()
-
-            # Also refresh stock medicine dropdown and history so the new medicine
-            # appears in the Stock Adjustment view immediately (if visible)
-            if hasattr(self, 'refresh_stock_medicines_list'):
-                self.refresh_stock_medicines_list()
-            if hasattr(self, 'refresh_stock_history'):
-                self.refresh_stock_history()
+            # Medicines, stock, sales and stock-adjustment views all show this medicine
+            self.refresh_bus.publish('medicines', 'adjustments')
         
         # Buttons: different for add vs edit
         button_frame = ttk.Frame(dialog)
@@ -2366,16 +1708,13 @@ class PharmacyFrontend:
             success = self.backend.delete_medicine(medicine_id, user=getattr(self, 'current_user', None))
             if success:
                 messagebox.showinfo("Success", "Medicine deleted successfully")
-                self.refresh_stock()
-                if hasattr(self, 'medicines_tree'):
-                    self.refresh_medicines()
-                if hasattr(self, 'sales_med_combo'):
-                    self.refresh_sales_medicines()
+                self.refresh_bus.publish('medicines', 'adjustments')
             else:
                 messagebox.showerror("Error", "Failed to delete medicine")
     
     def show_sales(self):
-        self.clear_main_frame()
+        if self._switch_view('sales'):
+            return
         
         header_frame = ttk.Frame(self.main_frame)
         header_frame.pack(fill='x', pady=10)
@@ -2390,13 +1729,14 @@ class PharmacyFrontend:
         customer_combo = ttk.Combobox(customer_frame, textvariable=self.customer_var, state="readonly", width=20)
         customer_combo.pack(side='left', padx=5)
         
-        # Populate customers
-        customer_options = ["Walk-in Customer"]
-        for cust_id, customer in self.backend.get_customers().items():
-            customer_options.append(f"{cust_id}: {customer['name']}")
-        customer_combo['values'] = customer_options
         customer_combo.set("Walk-in Customer")
-        
+        self.sales_customer_combo = customer_combo
+        self.refresh_sales_customers()
+        # Restore the customer of an in-progress (or recovered) cart
+        if self.current_cart and self._journal_customer in customer_combo['values']:
+            customer_combo.set(self._journal_customer)
+        customer_combo.bind('<<ComboboxSelected>>', lambda e: self._set_sale_customer(self.customer_var.get()))
+
         # Main POS layout
         pos_frame = ttk.Frame(self.main_frame)
         pos_frame.pack(fill='both', expand=True, pady=10)
@@ -2482,8 +1822,43 @@ class PharmacyFrontend:
         ttk.Button(button_frame, text="Process Payment", command=self.process_payment).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Cart", command=self.clear_cart).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Remove Selected", command=self.remove_from_cart).pack(side='left', padx=5)
-    
+        ttk.Button(button_frame, text="Park Cart", command=self.park_current_cart).pack(side='left', padx=5)
+
+        # Parked carts: double-click (or Resume) swaps the parked cart in
+        parked_frame = ttk.LabelFrame(right_frame, text="Parked Carts", padding="5")
+        parked_frame.pack(fill='x', pady=5)
+
+        parked_cols = ('Label', 'Customer', 'Items', 'Total', 'Parked')
+        self.parked_tree = ttk.Treeview(parked_frame, columns=parked_cols, show='headings', height=4)
+        for col in parked_cols:
+            self.parked_tree.heading(col, text=col)
+            self.parked_tree.column(col, width=80)
+        self.parked_tree.pack(fill='x')
+        self.parked_tree.bind('<Double-1>', lambda e: self.resume_parked_cart())
+
+        parked_btns = ttk.Frame(parked_frame)
+        parked_btns.pack(fill='x', pady=3)
+        ttk.Button(parked_btns, text="Resume", command=self.resume_parked_cart).pack(side='left', padx=5)
+        ttk.Button(parked_btns, text="Discard", command=self.discard_parked_cart).pack(side='left', padx=5)
+
+        self.refresh_parked_carts()
+        # Show any cart still in progress (e.g. recovered from the journal after a crash)
+        self.update_cart_display()
+
+    def refresh_sales_customers(self):
+        if not self._view_visible('sales_customer_combo'):
+            return
+        customer_options = ["Walk-in Customer"]
+        for cust_id, customer in self.backend.get_customers().items():
+            customer_options.append(f"{cust_id}: {customer['name']}")
+        self.sales_customer_combo['values'] = customer_options
+        # The chosen customer may have been deleted meanwhile
+        if self.customer_var.get() not in customer_options:
+            self._set_sale_customer("Walk-in Customer")
+
     def refresh_sales_medicines(self):
+        if not self._view_visible('sales_med_combo'):
+            return
         medicines_list = []
         query = None
         # If a search box exists and has text, use it to filter results
@@ -2495,7 +1870,7 @@ class PharmacyFrontend:
         except Exception:
             query = None
 
-        for med_id, medicine in self.backend.get_medicines().items():
+        for med_id, medicine in self._shared_medicines().items():
             if medicine['quantity'] > 0:
                 label = f"{med_id}: {medicine['name']} ({self.format_currency(medicine['price'])})"
                 if query:
@@ -2534,7 +1909,8 @@ class PharmacyFrontend:
     # --- Returns UI ---
     def show_returns(self):
         # Display returns management screen: process returns and view history.
-        self.clear_main_frame()
+        if self._switch_view('returns'):
+            return
 
         ttk.Label(self.main_frame, text="RETURNS", style='Title.TLabel').pack(pady=10)
 
@@ -2580,6 +1956,14 @@ class PharmacyFrontend:
         self.returns_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+        # Newest returns first; older ones are a page away
+        self.returns_pager = TreePager(
+            self.main_frame, self.returns_tree, self.backend.get_returns_page, self._return_row,
+            {'ID': 'ReturnID', 'Medicine': 'MedicineName', 'Qty': 'Quantity', 'Amount': 'Amount',
+             'Sale ID': 'SaleID', 'Customer': 'CustomerName', 'Time': 'Timestamp', 'Reason': 'Reason'},
+            sort='Timestamp', descending=True)
+        self.returns_pager.frame.pack(fill='x')
+
         # Populate selectors and table
         self._refresh_returns_sales_list()
         # medicine list will be populated when a sale is selected
@@ -2679,15 +2063,8 @@ class PharmacyFrontend:
         returns = self.backend.get_returns()
         refund_amount = returns[return_id]["amount"] if return_id in returns else 0
         messagebox.showinfo('Success', f'Return processed: {return_id}\nRefund: {self.format_currency(refund_amount)}')
-        # Refresh views
-        self.refresh_returns()
-        if hasattr(self, 'stock_tree'):
-            self.refresh_stock()
-            # Also refresh stock movement history so the return adjustment appears
-            if hasattr(self, 'refresh_stock_history'):
-                self.refresh_stock_history()
-        if hasattr(self, 'medicines_tree'):
-            self.refresh_medicines()
+        # The return restocks the medicine and records a stock adjustment
+        self.refresh_bus.publish('returns', 'medicines', 'adjustments', 'sales')
         # Update sale-specific selectors and sales list so UI reflects change immediately
         # Re-populate medicines for the currently selected sale (may clear if sale exhausted)
         self._on_return_sale_selected()
@@ -2699,29 +2076,29 @@ class PharmacyFrontend:
             self.return_sale_var.set('')
 
     def refresh_returns(self):
-        if not hasattr(self, 'returns_tree'):
+        if not hasattr(self, 'returns_pager') or not self._view_visible('returns_tree'):
             return
-        for item in self.returns_tree.get_children():
-            self.returns_tree.delete(item)
-        medicines = self.backend.get_medicines()
-        for rid, info in self.backend.get_returns().items():
-            # Prefer names returned by the detailed view
-            mid = info.get('medicine_id')
-            med_name = info.get('medicine_name') or medicines.get(mid, {}).get('name', mid)
-            cust = info.get('customer_name') or (info.get('customer_id') or '')
-            sale = info.get('sale_id') or ''
-            t = info.get('timestamp')
-            tstr = t.strftime('%Y-%m-%d %H:%M') if t else ''
-            self.returns_tree.insert('', 'end', values=(
-                rid,
-                med_name,
-                info.get('quantity'),
-                self.format_currency(info.get('amount', 0)),
-                sale,
-                cust,
-                tstr,
-                info.get('reason','')
-            ))
+        try:
+            self.returns_pager.reload()
+        except tk.TclError:
+            return
+
+    def _return_row(self, rid, info):
+        # The detailed view supplies the medicine and customer names
+        cust = info.get('customer_name') or (info.get('customer_id') or '')
+        sale = info.get('sale_id') or ''
+        t = info.get('timestamp')
+        tstr = t.strftime('%Y-%m-%d %H:%M') if t else ''
+        return (
+            rid,
+            info.get('medicine_name') or info.get('medicine_id') or '',
+            info.get('quantity'),
+            self.format_currency(info.get('amount', 0)),
+            sale,
+            cust,
+            tstr,
+            info.get('reason','')
+        ), ()
     
     def add_to_cart(self):
         # Add selected medicine to cart
@@ -2769,6 +2146,7 @@ class PharmacyFrontend:
                 return
             existing['quantity'] = new_qty
             existing['total'] = new_qty * existing['price']
+            self._record_cart_change('add', medicine_id=med_id, quantity=quantity)
         else:
             cart_item = {
                 'medicine_id': med_id,
@@ -2778,6 +2156,8 @@ class PharmacyFrontend:
                 'total': quantity * medicine['price']
             }
             self.current_cart.append(cart_item)
+            self._record_cart_change('add', medicine_id=med_id, name=cart_item['name'],
+                                     quantity=quantity, price=cart_item['price'])
         self.update_cart_display()
     
     def update_cart_display(self):
@@ -2811,10 +2191,12 @@ class PharmacyFrontend:
             messagebox.showerror("Error", "Please select an item to remove")
             return
         
-        for item in selection:
-            index = self.cart_tree.index(item)
+        # Pop from the highest index down so earlier removals don't shift later ones
+        for index in sorted((self.cart_tree.index(item) for item in selection), reverse=True):
             if 0 <= index < len(self.current_cart):
-                self.current_cart.pop(index)
+                removed = self.current_cart.pop(index)
+                self._record_cart_change('remove', medicine_id=removed.get('medicine_id'))
+        for item in selection:
             self.cart_tree.delete(item)
         
         self.update_cart_display()
@@ -2822,10 +2204,160 @@ class PharmacyFrontend:
     def clear_cart(self):
         # Clear the entire cart
         self.current_cart.clear()
+        self._record_cart_change('clear')
         for item in self.cart_tree.get_children():
             self.cart_tree.delete(item)
         self.update_cart_display()
-    
+
+    # --- Cart journal ---
+    def _record_cart_change(self, op, **fields):
+        # Journal a cart mutation; a changed cart is a new sale and needs a new key
+        self._sale_key = None
+        self.cart_journal.append(op, **fields)
+
+    def _schedule_journal_sync(self):
+        # Batched fsync of the cart journal; a cheap no-op when nothing is pending
+        self.cart_journal.sync_if_due()
+        try:
+            self.root.after(int(CartJournal.SYNC_INTERVAL * 1000), self._schedule_journal_sync)
+        except tk.TclError:
+            pass
+
+    def update_connection_status(self):
+        # Reflect offline mode and the offline sale queue in the header
+        var = getattr(self, 'connection_status_var', None)
+        if var is None:
+            return
+        queue = self.backend.sale_queue
+        parts = []
+        if self.backend.offline:
+            parts.append('OFFLINE')
+        if queue.pending:
+            parts.append(f'{len(queue.pending)} sale(s) queued')
+        if queue.conflicts:
+            parts.append(f'{len(queue.conflicts)} sale(s) need review')
+        try:
+            var.set(' | '.join(parts))
+        except tk.TclError:
+            pass
+
+    def _poll_sale_replayer(self):
+        # Runs on the Tk thread: adopt a recovered connection, start the replay on a
+        # worker and report the conflicts it has found since the last poll
+        new_conn = self.sale_replayer.take_connection()
+        if new_conn is not None and self.backend.offline:
+            self.backend.install_connection(new_conn)
+        elif new_conn is not None:
+            try:
+                new_conn.close()
+            except Exception:
+                pass
+        if self.backend.connected and not self.backend.offline:
+            self.sale_replayer.replay_in_background()
+        conflicts = list(self.backend.sale_queue.conflicts)
+        if len(conflicts) > self._known_conflicts:
+            new = conflicts[self._known_conflicts:]
+            self._known_conflicts = len(conflicts)
+            details = '\n'.join(f"{c.get('queued_at', '')}  total {c.get('total', 0):.2f}: {c.get('error', '')}" for c in new)
+            messagebox.showwarning('Offline Sales Rejected',
+                                   f'{len(new)} sale(s) taken offline could not be posted to the server:\n\n{details}')
+        self.update_connection_status()
+        try:
+            self.root.after(2000, self._poll_sale_replayer)
+        except tk.TclError:
+            pass
+
+    def _set_sale_customer(self, customer):
+        # Record the selected customer so a recovered cart keeps it
+        if hasattr(self, 'customer_var'):
+            self.customer_var.set(customer)
+        if customer != self._journal_customer:
+            self._journal_customer = customer
+            self._record_cart_change('customer', customer=customer)
+
+    # --- Parked (suspended) carts ---
+    def park_current_cart(self):
+        # Suspend the current cart so the next customer can be served
+        if not self.current_cart:
+            messagebox.showerror("Error", "Cart is empty")
+            return
+        customer = self.customer_var.get() if hasattr(self, 'customer_var') else 'Walk-in Customer'
+        self.parked_carts.park(self.current_cart, customer=customer, user=getattr(self, 'current_user', None))
+        self.clear_cart()
+        self._set_sale_customer("Walk-in Customer")
+        self.refresh_parked_carts()
+
+    def resume_parked_cart(self):
+        if not hasattr(self, 'parked_tree'):
+            return
+        sel = self.parked_tree.selection()
+        if not sel:
+            messagebox.showerror("Error", "Please select a parked cart to resume")
+            return
+        cart_id = sel[0]
+        if cart_id not in self.parked_carts.carts:
+            self.refresh_parked_carts()
+            return
+
+        # Swap rather than overwrite: a cart in progress is parked first
+        if self.current_cart:
+            self.park_current_cart()
+
+        entry = self.parked_carts.resume(cart_id)
+        if entry is None:
+            return
+        self.current_cart.extend(dict(it) for it in entry.get('items', []))
+        customer = entry.get('customer') or "Walk-in Customer"
+        try:
+            options = list(self.sales_customer_combo['values'])
+        except Exception:
+            options = []
+        if customer not in options:
+            customer = "Walk-in Customer"
+        self.customer_var.set(customer)
+        self._journal_customer = customer
+        self._record_cart_change('load', items=self.current_cart, customer=customer)
+        self.update_cart_display()
+        self.refresh_parked_carts()
+
+    def discard_parked_cart(self):
+        if not hasattr(self, 'parked_tree'):
+            return
+        sel = self.parked_tree.selection()
+        if not sel:
+            messagebox.showerror("Error", "Please select a parked cart to discard")
+            return
+        if not messagebox.askyesno("Confirm", "Discard the selected parked cart?"):
+            return
+        self.parked_carts.discard(sel[0])
+        self.refresh_parked_carts()
+
+    def refresh_parked_carts(self):
+        if not hasattr(self, 'parked_tree'):
+            return
+        try:
+            if not self.parked_tree.winfo_exists():
+                return
+        except Exception:
+            return
+
+        for item in self.parked_tree.get_children():
+            self.parked_tree.delete(item)
+        for entry in self.parked_carts.list():
+            items = entry.get('items', [])
+            total = sum(float(it.get('total', 0) or 0) for it in items)
+            parked_at = (entry.get('parked_at') or '')[11:16]
+            customer = entry.get('customer', '')
+            if ':' in customer:
+                customer = customer.split(':', 1)[1].strip()
+            self.parked_tree.insert('', 'end', iid=entry['id'], values=(
+                entry.get('label', ''),
+                customer,
+                sum(int(it.get('quantity', 0) or 0) for it in items),
+                self.format_currency(total),
+                parked_at
+            ))
+
     def process_payment(self):
         # Process the payment for current cart
         if not self.current_cart:
@@ -2848,13 +2380,21 @@ class PharmacyFrontend:
                 'price': item['price']
             })
         
-        # Create sale
-        sale_id, total = self.backend.create_sale(customer_id, items, user=self.current_user)
+        # Create sale (queued locally when the database is offline)
+        if self._sale_key is None:
+            self._sale_key = uuid.uuid4().hex
+        sale_id, total, queued = self.backend.submit_sale(customer_id, items, user=self.current_user,
+                                                          idempotency_key=self._sale_key)
 
         # If sale failed, show error and abort receipt display
         if sale_id is None:
             messagebox.showerror('Sale Error', f'Failed to create sale: {total}')
             return
+        self.update_connection_status()
+
+        # The sale is committed; the journal no longer needs to replay this cart
+        self.cart_journal.compact()
+        self._sale_key = None
 
         # Build and show a nicely formatted receipt in a dialog
         receipt = tk.Toplevel(self.root)
@@ -2864,6 +2404,7 @@ class PharmacyFrontend:
         receipt.grab_set()
 
         # Use monospace font so columns align
+        import tkinter.font as tkfont
         mono = tkfont.Font(family='Courier New', size=10)
 
         txt = tk.Text(receipt, wrap='none', font=mono)
@@ -2880,6 +2421,9 @@ class PharmacyFrontend:
         # Prefer customer name from the freshly created sale (detailed view), else fall back to selection lookup
         customer_name = 'Walk-in'
         try:
+            if queued:
+                # Not on the server yet; look the customer up in the cached list
+                raise LookupError(sale_id)
             sales_info = self.backend.get_sales()
             sale_key = str(sale_id)
             if sale_id and sale_key in sales_info:
@@ -2899,6 +2443,8 @@ class PharmacyFrontend:
         lines.append("" )
         lines.append(f"Invoice: {sale_id}  Date: {now.strftime('%Y-%m-%d %H:%M')}")
         lines.append(f"Customer: {customer_name}")
+        if queued:
+            lines.append("OFFLINE SALE - pending upload to server")
         lines.append("-" * 56)
 
         # Items header
@@ -2937,6 +2483,7 @@ class PharmacyFrontend:
         def save_receipt_to_file():
             try:
                 default_name = f"receipt_{sale_id}.txt"
+                from tkinter import filedialog
                 path = filedialog.asksaveasfilename(defaultextension='.txt', initialfile=default_name,
                                                     filetypes=[('Text Files', '*.txt'), ('All Files', '*.*')])
                 if not path:
@@ -2955,7 +2502,7 @@ class PharmacyFrontend:
 
         # Clear cart and refresh
         self.clear_cart()
-        self.refresh_sales_medicines()
+        self.refresh_bus.publish('medicines', 'adjustments', 'sales')
 
     def copy_to_clipboard(self, text):
         # Copy provided text to the system clipboard and notify the user
@@ -2965,7 +2512,8 @@ class PharmacyFrontend:
     
     def show_customers(self):
         # Display customers management screen
-        self.clear_main_frame()
+        if self._switch_view('customers'):
+            return
 
         ttk.Label(self.main_frame, text="CUSTOMER MANAGEMENT", style='Title.TLabel').pack(pady=10)
 
@@ -2983,9 +2531,9 @@ class PharmacyFrontend:
         ttk.Entry(toolbar, textvariable=self.customers_search_var, width=30).pack(side='right', padx=5)
         # Auto-refresh customers list when search box is cleared
         try:
-            self.customers_search_var.trace_add('write', lambda *a: self.refresh_customers() if not (self.customers_search_var.get() or '').strip() else None)
+            self.customers_search_var.trace_add('write', lambda *a: self.search_customers() if not (self.customers_search_var.get() or '').strip() else None)
         except Exception:
-            self.customers_search_var.trace('w', lambda *a: self.refresh_customers() if not (self.customers_search_var.get() or '').strip() else None)
+            self.customers_search_var.trace('w', lambda *a: self.search_customers() if not (self.customers_search_var.get() or '').strip() else None)
         ttk.Button(toolbar, text="Search", command=self.search_customers).pack(side='right', padx=5)
 
         # Customers table
@@ -3004,6 +2552,13 @@ class PharmacyFrontend:
         self.customers_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+        self.customers_pager = TreePager(
+            self.main_frame, self.customers_tree, self.backend.get_customers_page, self._customer_row,
+            {'ID': 'CustomerID', 'Name': 'Name', 'Phone': 'Phone', 'Email': 'Email',
+             'Total Purchases': 'TotalPurchases'},
+            sort='Name')
+        self.customers_pager.frame.pack(fill='x')
+
         # Load customers into table
         self.refresh_customers()
     
@@ -3050,9 +2605,8 @@ class PharmacyFrontend:
                 return
             messagebox.showinfo("Success", "Customer added successfully")
 
-            # Refresh customers list if it's visible
-            if hasattr(self, 'customers_tree'):
-                self.refresh_customers()
+            # Refresh customers list and the sales customer picker
+            self.refresh_bus.publish('customers')
 
             if close_after:
                 dialog.destroy()
@@ -3079,7 +2633,7 @@ class PharmacyFrontend:
             w.destroy()
 
         # Respect user's startup preference: only maximize if configured
-        settings = self.backend.get_settings()
+        settings = self.backend.get_cached_settings()
         start_max = bool(settings.get('start_maximized', True))
         self.root.update_idletasks()
         if start_max:
@@ -3110,7 +2664,7 @@ class PharmacyFrontend:
         logo_row = ttk.Frame(card, style='Card.TFrame')
         logo_row.grid(row=0, column=0, sticky='ew', pady=(0,8))
         # Simple textual logo: first letter inside a circle-like label
-        pharm_name = str(self.backend.get_settings().get('pharmacy_name', 'Pharmacy'))
+        pharm_name = str(settings.get('pharmacy_name', 'Pharmacy'))
         logo_text = pharm_name[:1].upper()
         logo = tk.Canvas(logo_row, width=56, height=56, highlightthickness=0, bg='#f7f9fc')
         # Draw a circle and place initial
@@ -3163,7 +2717,10 @@ class PharmacyFrontend:
         def do_login(event=None):
             username = user_var.get().strip()
             password = pass_var.get()
-            success, role = self.backend.authenticate_user(username, password)
+            if not self._ensure_connected():
+                return
+            with self.profiler.phase('login: authenticate'):
+                success, role = self.backend.authenticate_user(username, password)
             if not success:
                 error_label.config(text='Invalid username or password')
                 return
@@ -3177,17 +2734,28 @@ class PharmacyFrontend:
                 self.login_frame.destroy()
                 self.login_frame = None
             # Build main layout and show dashboard
-            self.create_main_layout()
+            with self.profiler.phase('main layout'):
+                self.create_main_layout()
             # Show/hide Users and Settings buttons based on role
             if role != 'admin':
                 self.users_btn.pack_forget()
                 if hasattr(self, 'settings_btn'):
                     self.settings_btn.pack_forget()
+                self.diagnostics_btn.pack_forget()
             else:
                 self.users_btn.pack(side='left', padx=5)
                 if hasattr(self, 'settings_btn'):
                     self.settings_btn.pack(side='left', padx=5)
-            self.show_dashboard()
+                self.diagnostics_btn.pack(side='left', padx=5)
+            with self.profiler.phase('dashboard'):
+                self.show_dashboard()
+            # Once the dashboard is drawn, prepare the Sales screen off the critical path
+            self.root.after_idle(self._warm_up)
+            if self._cart_recovered and self.current_cart:
+                self._cart_recovered = False
+                messagebox.showinfo('Cart Recovered',
+                    f'An unfinished cart with {len(self.current_cart)} item(s) was recovered.\n'
+                    'Open Sales to complete or clear it.')
 
         login_btn = ttk.Button(btns, text='Login', command=do_login, style='Primary.TButton', width=14)
         login_btn.pack(side='right', padx=6)
@@ -3221,6 +2789,54 @@ class PharmacyFrontend:
         except Exception:
             pass
 
+    def _ensure_connected(self):
+        """Install the startup connection, waiting for the background connect if it
+        is still running. Falls back to offline mode when the server is unreachable
+        but a catalog is cached; returns False when the app cannot go on.
+        """
+        if self.backend.connected:
+            return True
+        connector = self.connector or BackgroundConnector(self.backend.connection_factory).start()
+        if not connector.done():
+            with self.profiler.phase('login: wait for database'):
+                try:
+                    self.root.config(cursor='watch')
+                    self.root.update_idletasks()
+                except tk.TclError:
+                    pass
+                connector.wait()
+                try:
+                    self.root.config(cursor='')
+                except tk.TclError:
+                    pass
+        self.profiler.mark('database connect (background)', connector.seconds)
+        if connector.conn is not None:
+            self.backend.install_connection(connector.conn)
+            return True
+        if not os.path.exists(local_data_path('catalog_cache.json')):
+            # Nothing cached yet (first run on this terminal): offline mode has no catalog to sell from
+            messagebox.showerror("Database Error", "Unable to connect to SQL Server.\nPlease ensure SQL Server is running.")
+            self.root.destroy()
+            return False
+        messagebox.showwarning("Offline Mode", "Unable to connect to SQL Server.\n"
+                               "The application will start in offline mode: sales are saved locally "
+                               "and sent to the server automatically when it becomes available.")
+        self.backend.install_connection(OfflineConnection())
+        return True
+
+    def _warm_up(self):
+        # Build the Sales screen hidden (and refresh the offline catalog with it) so
+        # the first switch to Sales is instant, then print the startup profile
+        try:
+            shown = self._current_view
+            if shown is not None and 'sales' not in self._views:
+                with self.profiler.phase('warm-up: sales screen'):
+                    self.show_sales()
+                    self._switch_view(shown)
+        except tk.TclError:
+            pass
+        self.profiler.report()
+
     def logout(self):
         confirm = messagebox.askyesno('Logout', 'Are you sure you want to logout?')
         if not confirm:
@@ -3237,7 +2853,8 @@ class PharmacyFrontend:
     
     def show_reports(self):
         # Display reports screen
-        self.clear_main_frame()
+        if self._switch_view('reports'):
+            return
         
         ttk.Label(self.main_frame, text="REPORTS & ANALYTICS", style='Title.TLabel').pack(pady=10)
         
@@ -3266,7 +2883,8 @@ class PharmacyFrontend:
 
     def show_activity_log(self):
         # Display activity log entries
-        self.clear_main_frame()
+        if self._switch_view('activity'):
+            return
 
         ttk.Label(self.main_frame, text="ACTIVITY LOG", style='Title.TLabel').pack(pady=10)
 
@@ -3302,7 +2920,7 @@ class PharmacyFrontend:
 
     def refresh_activity_log(self):
         # Refresh tree with backend activity log
-        if not hasattr(self, 'activity_tree'):
+        if not self._view_visible('activity_tree'):
             return
         for i in self.activity_tree.get_children():
             self.activity_tree.delete(i)
@@ -3331,44 +2949,211 @@ class PharmacyFrontend:
                 ts_str = ts.strftime('%Y-%m-%d %H:%M:%S') if ts else ''
                 self.activity_tree.insert('', 'end', values=(log_id, user, rec.get('action',''), ts_str))
 
-    def refresh_customers(self):
-        if not hasattr(self, 'customers_tree'):
+    DIAGNOSTICS_SORTS = {'Total time': 'total_ms', 'Slowest call': 'max_ms', 'p95': 'p95_ms',
+                         'Calls': 'calls', 'Rows': 'rows', 'Errors': 'errors'}
+
+    def show_diagnostics(self):
+        # Per-statement query timings and slow queries of this session
+        if getattr(self, 'current_role', None) != 'admin':
+            messagebox.showerror('Access Denied', 'Only administrators can access Diagnostics')
+            return
+        if self._switch_view('diagnostics'):
+            self.refresh_diagnostics()
             return
 
-        for item in self.customers_tree.get_children():
-            self.customers_tree.delete(item)
+        ttk.Label(self.main_frame, text="DIAGNOSTICS", style='Title.TLabel').pack(pady=10)
 
-        for cust_id, customer in self.backend.get_customers().items():
-            self.customers_tree.insert('', 'end', values=(
-                cust_id,
-                customer['name'],
-                customer['phone'],
-                customer['email'],
-                self.format_currency(customer.get('total_purchases', 0))
-            ))
+        toolbar = ttk.Frame(self.main_frame)
+        toolbar.pack(fill='x', pady=5)
+        ttk.Label(toolbar, text="Sort by:").pack(side='left', padx=5)
+        self.diagnostics_sort_var = tk.StringVar(value='Total time')
+        sort_box = ttk.Combobox(toolbar, textvariable=self.diagnostics_sort_var, state='readonly', width=14,
+                                values=list(self.DIAGNOSTICS_SORTS))
+        sort_box.pack(side='left', padx=5)
+        sort_box.bind('<<ComboboxSelected>>', lambda e: self.refresh_diagnostics())
+        ttk.Button(toolbar, text="Refresh", command=self.refresh_diagnostics).pack(side='left', padx=5)
+        ttk.Button(toolbar, text="Reset", command=self.reset_diagnostics).pack(side='left', padx=5)
+        self.diagnostics_info_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.diagnostics_info_var).pack(side='right', padx=5)
+
+        # Top statements
+        cols = ('Statement', 'Calls', 'Errors', 'Rows', 'Avg ms', 'p95 ms', 'Max ms', 'Fetch ms', 'Total ms')
+        table_frame = ttk.Frame(self.main_frame)
+        table_frame.pack(fill='both', expand=True, pady=5)
+        self.diagnostics_tree = ttk.Treeview(table_frame, columns=cols, show='headings', height=12)
+        for c in cols:
+            self.diagnostics_tree.heading(c, text=c)
+            self.diagnostics_tree.column(c, width=90, anchor='e')
+        self.diagnostics_tree.column('Statement', width=260, anchor='w')
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.diagnostics_tree.yview)
+        self.diagnostics_tree.configure(yscrollcommand=scrollbar.set)
+        self.diagnostics_tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        self.diagnostics_tree.bind('<<TreeviewSelect>>', lambda e: self._show_statement_detail())
+
+        # Histogram and parameter shapes of the selected statement
+        self.diagnostics_detail_var = tk.StringVar(value='Select a statement to see its latency histogram.')
+        ttk.Label(self.main_frame, textvariable=self.diagnostics_detail_var, justify='left',
+                  font=('Consolas', 9)).pack(fill='x', pady=5)
+
+        lower = ttk.Frame(self.main_frame)
+        lower.pack(fill='both', expand=True)
+
+        # Round-trips per user action; flagged ones exceeded the budget or repeated a statement
+        actions_frame = ttk.LabelFrame(lower, text="Round-trips per action", padding="5")
+        actions_frame.pack(side='left', fill='both', expand=True, pady=5, padx=(0, 5))
+        action_cols = ('Action', 'Runs', 'Last', 'Max', 'Over budget', 'N+1', 'Worst repeat')
+        self.actions_tree = ttk.Treeview(actions_frame, columns=action_cols, show='headings', height=8)
+        for c in action_cols:
+            self.actions_tree.heading(c, text=c)
+            self.actions_tree.column(c, width=70, anchor='e')
+        self.actions_tree.column('Action', width=220, anchor='w')
+        self.actions_tree.column('Worst repeat', width=180, anchor='w')
+        self.actions_tree.tag_configure('flagged', foreground='#c9302c')
+        self.actions_tree.pack(fill='both', expand=True)
+
+        # Event-loop responsiveness and the slowest UI handlers
+        handlers_frame = ttk.LabelFrame(lower, text="UI handlers", padding="5")
+        handlers_frame.pack(side='left', fill='both', expand=True, pady=5, padx=(0, 5))
+        self.ui_latency_var = tk.StringVar()
+        ttk.Label(handlers_frame, textvariable=self.ui_latency_var).pack(anchor='w')
+        handler_cols = ('Handler', 'Calls', 'Avg ms', 'Max ms', 'Slow', 'Stalls')
+        self.handlers_tree = ttk.Treeview(handlers_frame, columns=handler_cols, show='headings', height=7)
+        for c in handler_cols:
+            self.handlers_tree.heading(c, text=c)
+            self.handlers_tree.column(c, width=60, anchor='e')
+        self.handlers_tree.column('Handler', width=220, anchor='w')
+        self.handlers_tree.tag_configure('flagged', foreground='#c9302c')
+        self.handlers_tree.pack(fill='both', expand=True)
+
+        # Recent slow queries
+        slow_frame = ttk.LabelFrame(lower, text="Slow queries", padding="5")
+        slow_frame.pack(side='left', fill='both', expand=True, pady=5)
+        slow_cols = ('Time', 'Statement', 'Parameters', 'ms', 'Rows', 'Error')
+        self.slow_queries_tree = ttk.Treeview(slow_frame, columns=slow_cols, show='headings', height=8)
+        for c in slow_cols:
+            self.slow_queries_tree.heading(c, text=c)
+        self.slow_queries_tree.column('Time', width=140)
+        self.slow_queries_tree.column('Statement', width=220)
+        self.slow_queries_tree.column('Parameters', width=260)
+        self.slow_queries_tree.column('ms', width=80, anchor='e')
+        self.slow_queries_tree.column('Rows', width=70, anchor='e')
+        self.slow_queries_tree.column('Error', width=140)
+        self.slow_queries_tree.pack(fill='both', expand=True)
+
+        # Memory per view (only with --profile-memory)
+        self.memory_tree = None
+        if self.memory_profiler.enabled:
+            memory_frame = ttk.LabelFrame(self.main_frame, text="Memory per view (details in memory_profile.log)",
+                                          padding="5")
+            memory_frame.pack(fill='x', pady=5)
+            memory_cols = ('View', 'Visits', 'Traced MB', 'Growth KB', 'Tk widgets', 'Leaked widgets',
+                           'Records', 'Stale attributes')
+            self.memory_tree = ttk.Treeview(memory_frame, columns=memory_cols, show='headings', height=5)
+            for c in memory_cols:
+                self.memory_tree.heading(c, text=c)
+                self.memory_tree.column(c, width=90, anchor='e')
+            self.memory_tree.column('View', width=120, anchor='w')
+            self.memory_tree.column('Stale attributes', width=320, anchor='w')
+            self.memory_tree.tag_configure('flagged', foreground='#c9302c')
+            self.memory_tree.pack(fill='x')
+
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        if not self._view_visible('diagnostics_tree'):
+            return
+        tracer = self.backend.tracer
+        sort = self.DIAGNOSTICS_SORTS.get(self.diagnostics_sort_var.get(), 'total_ms')
+        self._diagnostics_rows = {}
+        for i in self.diagnostics_tree.get_children():
+            self.diagnostics_tree.delete(i)
+        for stat in self.backend.get_query_stats(sort=sort, limit=50):
+            iid = self.diagnostics_tree.insert('', 'end', values=(
+                stat['name'], stat['calls'], stat['errors'], stat['rows'], f"{stat['avg_ms']:.2f}",
+                f"{stat['p95_ms']:g}", f"{stat['max_ms']:.2f}", f"{stat['fetch_ms']:.1f}", f"{stat['total_ms']:.1f}"))
+            self._diagnostics_rows[iid] = stat
+        for i in self.slow_queries_tree.get_children():
+            self.slow_queries_tree.delete(i)
+        for entry in tracer.slow_queries():
+            self.slow_queries_tree.insert('', 'end', values=(
+                entry['time'], entry['name'], entry['shape'], f"{entry['wall_ms']:.1f}", entry['rows'],
+                entry['error'] or ''))
+        for i in self.actions_tree.get_children():
+            self.actions_tree.delete(i)
+        for action in tracer.action_stats():
+            name, count = max(action['worst'].items(), key=lambda kv: kv[1], default=('', 0))
+            flagged = action['over_budget'] or action['repeats']
+            self.actions_tree.insert('', 'end', tags=('flagged',) if flagged else (), values=(
+                action['name'], action['runs'], action['last'], action['max'], action['over_budget'],
+                action['repeats'], f"{name} x{count}" if count > 1 else ''))
+        ui = self.watchdog.stats()
+        self.ui_latency_var.set(f"Tick lag p50 {ui['lag_p50_ms']:g} ms, p95 {ui['lag_p95_ms']:g} ms, "
+                                f"max {ui['lag_max_ms']:g} ms  |  stalls: {ui['stalls']}")
+        for i in self.handlers_tree.get_children():
+            self.handlers_tree.delete(i)
+        for h in ui['handlers'][:50]:
+            self.handlers_tree.insert('', 'end', tags=('flagged',) if h['slow'] or h['stalls'] else (), values=(
+                h['name'], h['calls'], f"{h['total_ms'] / h['timed']:.1f}" if h['timed'] else '',
+                f"{h['max_ms']:.1f}", h['slow'], h['stalls']))
+        if self.memory_tree is not None:
+            for i in self.memory_tree.get_children():
+                self.memory_tree.delete(i)
+            for view, m in sorted(self.memory_profiler.views.items()):
+                flagged = m['leaked_widgets'] or m['stale'] or (m['visits'] > 1 and m['growth_bytes'] > 256 * 1024)
+                self.memory_tree.insert('', 'end', tags=('flagged',) if flagged else (), values=(
+                    view, m['visits'], f"{m['traced_bytes'] / 1048576:.1f}", f"{m['growth_bytes'] / 1024:+.0f}",
+                    m['widgets'], m['leaked_widgets'], m['records'], ', '.join(m['stale'])))
+        threshold = f"{tracer.slow_ms:g} ms" if tracer.slow_ms else 'off'
+        self.diagnostics_info_var.set(f"Since {tracer.started:%H:%M:%S}  |  slow-query threshold {threshold}"
+                                      f"  |  round-trip budget {tracer.round_trip_budget or 'off'}"
+                                      f"  |  log: {tracer.log_path}")
+        self.diagnostics_detail_var.set('Select a statement to see its latency histogram.')
+
+    def _show_statement_detail(self):
+        sel = self.diagnostics_tree.selection()
+        stat = getattr(self, '_diagnostics_rows', {}).get(sel[0]) if sel else None
+        if not stat:
+            return
+        # One text bar per histogram bucket, scaled to the fullest bucket
+        peak = max(count for _, count in stat['histogram']) or 1
+        lines = [f"{stat['name']}: p50 <= {stat['p50_ms']:g} ms, p95 <= {stat['p95_ms']:g} ms, "
+                 f"p99 <= {stat['p99_ms']:g} ms"]
+        for bound, count in stat['histogram']:
+            if count:
+                lines.append(f"  <= {bound:>5} ms {count:>7}  {'#' * max(1, round(40 * count / peak))}")
+        shapes = ', '.join(f"{shape} x{count}" for shape, count in stat['shapes'].items())
+        lines.append(f"  parameters: {shapes}")
+        self.diagnostics_detail_var.set('\n'.join(lines))
+
+    def reset_diagnostics(self):
+        self.backend.tracer.reset()
+        self.refresh_diagnostics()
 
-    def search_customers(self):
-        if not hasattr(self, 'customers_tree') or not hasattr(self, 'customers_search_var'):
+    def refresh_customers(self):
+        if not hasattr(self, 'customers_pager') or not self._view_visible('customers_tree'):
             return
-
-        query = self.customers_search_var.get().strip()
-        if not query:
-            self.refresh_customers()
+        try:
+            self.customers_pager.reload()
+        except tk.TclError:
             return
 
-        results = self.backend.search_customers(query)
+    def _customer_row(self, cust_id, customer):
+        return (
+            cust_id,
+            customer['name'],
+            customer['phone'],
+            customer['email'],
+            self.format_currency(customer.get('total_purchases', 0))
+        ), ()
 
-        for item in self.customers_tree.get_children():
-            self.customers_tree.delete(item)
-
-        for cust_id, customer in results.items():
-            self.customers_tree.insert('', 'end', values=(
-                cust_id,
-                customer['name'],
-                customer['phone'],
-                customer['email'],
-                self.format_currency(customer.get('total_purchases', 0))
-            ))
+    def search_customers(self):
+        if not hasattr(self, 'customers_pager') or not hasattr(self, 'customers_search_var'):
+            return
+        try:
+            self.customers_pager.set_search(self.customers_search_var.get())
+        except tk.TclError:
+            return
 
     def edit_selected_customer(self):
         if not hasattr(self, 'customers_tree'):
@@ -3401,7 +3186,7 @@ class PharmacyFrontend:
         success = self.backend.delete_customer(cust_id, user=self.current_user)
         if success:
             messagebox.showinfo("Success", "Customer deleted successfully")
-            self.refresh_customers()
+            self.refresh_bus.publish('customers')
         else:
             messagebox.showerror("Error", "Failed to delete customer")
 
@@ -3450,7 +3235,7 @@ class PharmacyFrontend:
             if success:
                 messagebox.showinfo("Success", "Customer updated successfully")
                 dialog.destroy()
-                self.refresh_customers()
+                self.refresh_bus.publish('customers')
             else:
                 messagebox.showerror("Error", "Failed to update customer")
 
@@ -3462,7 +3247,8 @@ class PharmacyFrontend:
 
     # --- Suppliers UI ---
     def show_suppliers(self):
-        self.clear_main_frame()
+        if self._switch_view('suppliers'):
+            return
 
         ttk.Label(self.main_frame, text="SUPPLIERS", style='Title.TLabel').pack(pady=10)
 
@@ -3480,9 +3266,9 @@ class PharmacyFrontend:
         ttk.Entry(toolbar, textvariable=self.suppliers_search_var, width=30).pack(side='right', padx=5)
         # Auto-refresh suppliers list when search box is cleared
         try:
-            self.suppliers_search_var.trace_add('write', lambda *a: self.refresh_suppliers() if not (self.suppliers_search_var.get() or '').strip() else None)
+            self.suppliers_search_var.trace_add('write', lambda *a: self.search_suppliers() if not (self.suppliers_search_var.get() or '').strip() else None)
         except Exception:
-            self.suppliers_search_var.trace('w', lambda *a: self.refresh_suppliers() if not (self.suppliers_search_var.get() or '').strip() else None)
+            self.suppliers_search_var.trace('w', lambda *a: self.search_suppliers() if not (self.suppliers_search_var.get() or '').strip() else None)
         ttk.Button(toolbar, text="Search", command=self.search_suppliers).pack(side='right', padx=5)
 
         # Suppliers table
@@ -3501,6 +3287,13 @@ class PharmacyFrontend:
         self.suppliers_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+        self.suppliers_pager = TreePager(
+            self.main_frame, self.suppliers_tree, self.backend.get_suppliers_page, self._supplier_row,
+            {'ID': 'SupplierID', 'Name': 'Name', 'Company': 'Company', 'Phone': 'Phone', 'Email': 'Email',
+             'Status': 'Active', 'Created': 'CreatedDate'},
+            sort='Name')
+        self.suppliers_pager.frame.pack(fill='x')
+
         self.refresh_suppliers()
 
     # --- Users management (admin only) ---
@@ -3508,7 +3301,8 @@ class PharmacyFrontend:
         if self.current_role != 'admin':
             messagebox.showerror('Access Denied', 'Only administrators can manage users')
             return
-        self.clear_main_frame()
+        if self._switch_view('users'):
+            return
         ttk.Label(self.main_frame, text='USER MANAGEMENT', style='Title.TLabel').pack(pady=10)
 
         toolbar = ttk.Frame(self.main_frame)
@@ -3523,9 +3317,9 @@ class PharmacyFrontend:
         ttk.Entry(toolbar, textvariable=self.users_search_var, width=30).pack(side='right', padx=5)
         # Auto-refresh users table when search cleared
         try:
-            self.users_search_var.trace_add('write', lambda *a: self.refresh_users() if not (self.users_search_var.get() or '').strip() else None)
+            self.users_search_var.trace_add('write', lambda *a: self.search_users() if not (self.users_search_var.get() or '').strip() else None)
         except Exception:
-            self.users_search_var.trace('w', lambda *a: self.refresh_users() if not (self.users_search_var.get() or '').strip() else None)
+            self.users_search_var.trace('w', lambda *a: self.search_users() if not (self.users_search_var.get() or '').strip() else None)
         ttk.Button(toolbar, text='Search', command=self.search_users).pack(side='right', padx=5)
         ttk.Button(toolbar, text='Refresh', command=self.refresh_users).pack(side='right', padx=5)
 
@@ -3540,63 +3334,42 @@ class PharmacyFrontend:
         self.users_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
 
+        self.users_pager = TreePager(
+            self.main_frame, self.users_tree, self.backend.get_users_page, self._user_row,
+            {'Username': 'Username', 'Full Name': 'FullName', 'Phone': 'Phone', 'Email': 'Email',
+             'Role': 'Role', 'Status': 'Active'},
+            sort='Username')
+        self.users_pager.frame.pack(fill='x')
+
         self.refresh_users()
 
     def refresh_users(self):
-        if not hasattr(self, 'users_tree'):
+        if not hasattr(self, 'users_pager') or not self._view_visible('users_tree'):
             return
-        for item in self.users_tree.get_children():
-            self.users_tree.delete(item)
-        for uname, info in self.backend.get_users().items():
-            active = info.get('active', True)
-            active_text = 'Active' if active else 'Inactive'
-            self.users_tree.insert('', 'end', values=(
-                uname,
-                info.get('full_name',''),
-                info.get('phone',''),
-                info.get('email',''),
-                info.get('role',''),
-                active_text
-            ))
-
-    def search_users(self):
-        # Search users by username, full name, role, or status and populate the users table.
-        if not hasattr(self, 'users_tree') or not hasattr(self, 'users_search_var'):
+        try:
+            self.users_pager.reload()
+        except tk.TclError:
             return
 
-        query = self.users_search_var.get().strip()
-        if not query:
-            self.refresh_users()
-            return
+    def _user_row(self, uname, info):
+        active_text = 'Active' if info.get('active', True) else 'Inactive'
+        return (
+            uname,
+            info.get('full_name',''),
+            info.get('phone',''),
+            info.get('email',''),
+            info.get('role',''),
+            active_text
+        ), ()
 
-        # Prefer DB-backed search
+    def search_users(self):
+        # Filter users by username, full name, contact, role, or status (on the server)
+        if not hasattr(self, 'users_pager') or not hasattr(self, 'users_search_var'):
+            return
         try:
-            matches = self.backend.search_users(query)
-            # Populate tree with matches
-            for item in self.users_tree.get_children():
-                self.users_tree.delete(item)
-
-            for uname, info in matches.items():
-                status_text = 'Active' if info.get('active', True) else 'Inactive'
-                self.users_tree.insert('', 'end', values=(uname, info.get('full_name',''), info.get('phone',''), info.get('email',''), info.get('role',''), status_text))
-        except Exception:
-            # Fallback to previous in-Python implementation
-            q = query.lower()
-            matches = []
-            for uname, info in self.backend.get_users().items():
-                full = info.get('full_name','') or ''
-                role = info.get('role','') or ''
-                status = 'active' if info.get('active', True) else 'inactive'
-                phone = info.get('phone','') or ''
-                email = info.get('email','') or ''
-                if (q in uname.lower() or q in full.lower() or q in phone.lower() or q in email.lower() or q in role.lower() or q in status.lower()):
-                    matches.append((uname, full, phone, email, role, status.title()))
-
-            for item in self.users_tree.get_children():
-                self.users_tree.delete(item)
-
-            for uname, full, phone, email, role, status_text in matches:
-                self.users_tree.insert('', 'end', values=(uname, full, phone, email, role, status_text))
+            self.users_pager.set_search(self.users_search_var.get())
+        except tk.TclError:
+            return
 
     def show_add_user_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -3647,8 +3420,7 @@ class PharmacyFrontend:
                 messagebox.showerror('Error', 'Username and password required')
                 return
             self.backend.add_user(uname, fullname, pwd, role=role, active=bool(active_var.get()), email=email_var.get().strip(), phone=phone_var.get().strip())
-            if hasattr(self, 'users_tree'):
-                self.refresh_users()
+            self.refresh_bus.publish('users')
             if close_after:
                 dialog.destroy()
             else:
@@ -3734,7 +3506,7 @@ class PharmacyFrontend:
                 phone=phone_var.get().strip()
             )
             dialog.destroy()
-            self.refresh_users()
+            self.refresh_bus.publish('users')
 
         btns = ttk.Frame(dialog)
         btns.pack(fill='x', pady=10, padx=12)
@@ -3759,7 +3531,7 @@ class PharmacyFrontend:
         if not confirm:
             return
         self.backend.delete_user(uname)
-        self.refresh_users()
+        self.refresh_bus.publish('users')
 
     def toggle_selected_user_status(self):
         if not hasattr(self, 'users_tree'):
@@ -3789,30 +3561,31 @@ class PharmacyFrontend:
         if ok:
             new_status_val = result if isinstance(result, bool) else bool(result)
             messagebox.showinfo('Success', f'User {uname} is now {"Active" if new_status_val else "Inactive"}')
-            self.refresh_users()
+            self.refresh_bus.publish('users')
         else:
             messagebox.showerror('Error', f'Failed to update user status: {result}')
 
     def refresh_suppliers(self):
-        if not hasattr(self, 'suppliers_tree'):
+        if not hasattr(self, 'suppliers_pager') or not self._view_visible('suppliers_tree'):
+            return
+        try:
+            self.suppliers_pager.reload()
+        except tk.TclError:
             return
 
-        for item in self.suppliers_tree.get_children():
-            self.suppliers_tree.delete(item)
-
-        for sid, supplier in self.backend.get_suppliers().items():
-            created = supplier.get('created_date')
-            created_str = created.strftime('%Y-%m-%d') if created else ''
-            status_text = 'Active' if supplier.get('active', True) else 'Inactive'
-            self.suppliers_tree.insert('', 'end', values=(
-                sid,
-                supplier.get('name',''),
-                supplier.get('company',''),
-                supplier.get('phone',''),
-                supplier.get('email',''),
-                status_text,
-                created_str
-            ))
+    def _supplier_row(self, sid, supplier):
+        created = supplier.get('created_date')
+        created_str = created.strftime('%Y-%m-%d') if created else ''
+        status_text = 'Active' if supplier.get('active', True) else 'Inactive'
+        return (
+            sid,
+            supplier.get('name',''),
+            supplier.get('company',''),
+            supplier.get('phone',''),
+            supplier.get('email',''),
+            status_text,
+            created_str
+        ), ()
 
     def show_add_supplier_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -3865,8 +3638,7 @@ class PharmacyFrontend:
             self.backend.add_supplier(name, company, phone, email, active=bool(active_var.get()), user=self.current_user)
             messagebox.showinfo("Success", "Supplier added successfully")
 
-            if hasattr(self, 'suppliers_tree'):
-                self.refresh_suppliers()
+            self.refresh_bus.publish('suppliers')
 
             if close_after:
                 dialog.destroy()
@@ -3914,7 +3686,7 @@ class PharmacyFrontend:
         success = self.backend.delete_supplier(sid, user=self.current_user)
         if success:
             messagebox.showinfo("Success", "Supplier deleted successfully")
-            self.refresh_suppliers()
+            self.refresh_bus.publish('suppliers')
         else:
             messagebox.showerror("Error", "Failed to delete supplier")
 
@@ -3941,7 +3713,7 @@ class PharmacyFrontend:
         success = self.backend.update_supplier(sid, active=new_status)
         if success:
             messagebox.showinfo('Success', f"Supplier {sid} is now {'Active' if new_status else 'Inactive'}")
-            self.refresh_suppliers()
+            self.refresh_bus.publish('suppliers')
         else:
             messagebox.showerror('Error', 'Failed to update supplier status')
 
@@ -3992,7 +3764,7 @@ class PharmacyFrontend:
             if success:
                 messagebox.showinfo("Success", "Supplier updated successfully")
                 dialog.destroy()
-                self.refresh_suppliers()
+                self.refresh_bus.publish('suppliers')
             else:
                 messagebox.showerror("Error", "Failed to update supplier")
 
@@ -4005,28 +3777,12 @@ class PharmacyFrontend:
         dialog.bind('<Escape>', lambda e: dialog.destroy())
 
     def search_suppliers(self):
-        if not hasattr(self, 'suppliers_tree') or not hasattr(self, 'suppliers_search_var'):
+        if not hasattr(self, 'suppliers_pager') or not hasattr(self, 'suppliers_search_var'):
             return
-        query = self.suppliers_search_var.get().strip()
-        if not query:
-            self.refresh_suppliers()
+        try:
+            self.suppliers_pager.set_search(self.suppliers_search_var.get())
+        except tk.TclError:
             return
-        results = self.backend.search_suppliers(query)
-        for item in self.suppliers_tree.get_children():
-            self.suppliers_tree.delete(item)
-        for sid, supplier in results.items():
-            created = supplier.get('created_date')
-            created_str = created.strftime('%Y-%m-%d') if created else ''
-            status_text = 'Active' if supplier.get('active', True) else 'Inactive'
-            self.suppliers_tree.insert('', 'end', values=(
-                sid,
-                supplier.get('name',''),
-                supplier.get('company',''),
-                supplier.get('phone',''),
-                supplier.get('email',''),
-                status_text,
-                created_str
-            ))
     
     def generate_report(self):
         # Generate and display report based on selections
@@ -4046,14 +3802,8 @@ class PharmacyFrontend:
         self.report_text.insert(tk.END, "SALES REPORT\n")
         self.report_text.insert(tk.END, "=" * 50 + "\n\n")
 
-        try:
-            cursor.execute("EXEC GetSalesReport ?", period)
-            rows = cursor.fetchall()
-        except Exception:
-            rows = []
-
+        rows, total_revenue = self.backend.get_sales_report(period)
         total_sales = len(rows)
-        total_revenue = sum(float(r[5] or 0) for r in rows)
 
         self.report_text.insert(tk.END, f"Period: {period.capitalize()}\n")
         self.report_text.insert(tk.END, f"Total Sales: {total_sales}\n")
@@ -4062,26 +3812,18 @@ class PharmacyFrontend:
         self.report_text.insert(tk.END, "Recent Sales:\n")
         self.report_text.insert(tk.END, "-" * 30 + "\n")
 
-        for r in rows[:10]:
-            sale_id = r[0]
-            cust_name = r[2] or 'Walk-in'
-            total = r[5] if len(r) > 5 else 0
-            self.report_text.insert(tk.END, f"{sale_id}: {cust_name} - {self.format_currency(total)}\n")
+        for sale in rows[:10]:
+            cust_name = sale['customer_name'] or 'Walk-in'
+            self.report_text.insert(tk.END, f"{sale['sale_id']}: {cust_name} - {self.format_currency(sale['total'])}\n")
     
     def generate_stock_report(self):
         self.report_text.insert(tk.END, "STOCK REPORT\n")
         self.report_text.insert(tk.END, "=" * 50 + "\n\n")
 
-        try:
-            cursor.execute("EXEC GetStockReportSummary")
-            srow = cursor.fetchone()
-            total_medicines = int(srow[0] or 0)
-            total_value = float(srow[1] or 0.0)
-            low_count = int(srow[2] or 0)
-        except Exception:
-            total_medicines = 0
-            total_value = 0.0
-            low_count = 0
+        summary = self.backend.get_stock_report_summary()
+        total_medicines = summary['total_medicines']
+        total_value = summary['total_value']
+        low_count = summary['low_stock']
 
         self.report_text.insert(tk.END, f"Total Medicines: {total_medicines}\n")
         self.report_text.insert(tk.END, f"Total Stock Value: {self.format_currency(total_value)}\n")
@@ -4089,29 +3831,16 @@ class PharmacyFrontend:
 
         self.report_text.insert(tk.END, "Low Stock Items:\n")
         self.report_text.insert(tk.END, "-" * 30 + "\n")
-        try:
-            cursor.execute("EXEC GetLowStockItems")
-            low_rows = cursor.fetchall()
-        except Exception:
-            low_rows = []
-
-        for r in low_rows:
-            name = r[1] or ''
-            qty = int(r[3] or 0)
-            self.report_text.insert(tk.END, f"{name}: {qty} left\n")
+        for med in self.backend.get_low_stock_medicines().values():
+            self.report_text.insert(tk.END, f"{med.get('name', '')}: {med.get('quantity', 0)} left\n")
     
     def generate_customers_report(self):
         self.report_text.insert(tk.END, "CUSTOMERS REPORT\n")
         self.report_text.insert(tk.END, "=" * 50 + "\n\n")
 
-        try:
-            cursor.execute("EXEC GetCustomersReport")
-            summary = cursor.fetchone()
-            total_customers = int(summary[0] or 0)
-            total_purchases = float(summary[1] or 0.0)
-        except Exception:
-            total_customers = 0
-            total_purchases = 0.0
+        summary, top_rows = self.backend.get_customers_report()
+        total_customers = summary['total_customers']
+        total_purchases = summary['total_purchases']
 
         self.report_text.insert(tk.END, f"Total Customers: {total_customers}\n")
         self.report_text.insert(tk.END, f"Total Customer Spending: {self.format_currency(total_purchases)}\n\n")
@@ -4119,17 +3848,7 @@ class PharmacyFrontend:
         self.report_text.insert(tk.END, "Top Customers:\n")
         self.report_text.insert(tk.END, "-" * 30 + "\n")
 
-        try:
-            if cursor.nextset():
-                top_rows = cursor.fetchall()
-            else:
-                top_rows = []
-        except Exception:
-            top_rows = []
-
-        for r in top_rows:
-            name = r[1] or ''
-            total = r[2] if len(r) > 2 else 0
+        for _cust_id, name, total in top_rows:
             self.report_text.insert(tk.END, f"{name}: {self.format_currency(total)}\n")
     
     def show_settings(self):
@@ -4138,7 +3857,8 @@ class PharmacyFrontend:
         if getattr(self, 'current_role', None) != 'admin':
             messagebox.showerror('Access Denied', 'Only administrators can access Settings')
             return
-        self.clear_main_frame()
+        if self._switch_view('settings'):
+            return
         
         ttk.Label(self.main_frame, text="SETTINGS", style='Title.TLabel').pack(pady=10)
         
@@ -4210,14 +3930,16 @@ class PharmacyFrontend:
             )
             if success:
                 messagebox.showinfo("Success", "Settings saved successfully")
+                # Currency and tax changes show up in most screens
+                self.refresh_bus.publish('settings')
             else:
                 messagebox.showerror("Error", "Failed to save settings")
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Error", f"Failed to save settings: {e}")
 
     def confirm_exit(self):
         if messagebox.askokcancel("Exit", "Are you sure you want to exit the application?"):
+            self.watchdog.stop()
             self.root.quit()
             self.root.destroy()
     
@@ -4227,32 +3949,37 @@ class PharmacyFrontend:
             return
         
         # Reset to defaults using stored procedure
-        try:
-            cursor.execute("EXEC UpdateSettings ?,?,?,?,?,?",
-                'City Pharmacy',
-                '123 Main Street',
-                '555-0123',
-                8.5,
-                'USD',
-                1
-            )
-            conn.commit()
-            
+        if self.backend.update_settings('City Pharmacy', '123 Main Street', '555-0123', 8.5, 'USD', True):
             # No local cache to update; show_settings reads from DB on demand
             messagebox.showinfo("Success", "Settings reset to default")
+            self.refresh_bus.publish('settings')
+            # Rebuild the form so it shows the defaults
+            self._stale_views.add('settings')
             self.show_settings()
-        except Exception as e:
-            conn.rollback()
-            messagebox.showerror("Error", f"Failed to reset settings: {e}")
+        else:
+            messagebox.showerror("Error", "Failed to reset settings")
 
 def main():
-    root = tk.Tk()
-    root.withdraw()
-
-    app = PharmacyFrontend(root)
+    profiler = StartupProfiler(enabled='--profile-startup' in sys.argv[1:])
+    memory_profiler = MemoryProfiler(enabled='--profile-memory' in sys.argv[1:],
+                                     log_path=local_data_path('memory_profile.log'))
+    # Start talking to SQL Server right away; the login window does not need it
+    backend = PharmacyBackend(load_config())
+    connector = BackgroundConnector(backend.connection_factory).start()
+
+    with profiler.phase('tk root'):
+        root = tk.Tk()
+        root.withdraw()
+
+    with profiler.phase('login window'):
+        app = PharmacyFrontend(root, backend=backend, connector=connector, profiler=profiler,
+                               memory_profiler=memory_profiler)
+        root.deiconify()
+        root.update_idletasks()
 
-    root.deiconify()
     root.mainloop()
+    # Closing the window ends the loop without confirm_exit; stop watching it
+    app.watchdog.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -62,6 +62,7 @@ CREATE TABLE Medicines (
    Status          VARCHAR(20),
    CreatedDate     DATETIME DEFAULT GETDATE(),
    SupplierID      INT NULL,
+   RowVer          ROWVERSION,   -- changes on every update; used for optimistic concurrency
 
    FOREIGN KEY (SupplierID) REFERENCES Suppliers(SupplierID)
 );
@@ -77,6 +78,7 @@ CREATE TABLE Sales (
    Total           DECIMAL(10,2),
    Timestamp       DATETIME DEFAULT GETDATE(),
    UserName        VARCHAR(50),
+   IdempotencyKey  VARCHAR(64) NULL,   -- client-generated key so a retried submission is not recorded twice
 
    FOREIGN KEY (CustomerID) REFERENCES Customers(CustomerID),
    FOREIGN KEY (UserName) REFERENCES Users(Username)
@@ -272,69 +274,76 @@ GO
 ------------------------------*/
 CREATE PROCEDURE UpdateMedicine
  @MedicineID INT,
- @Name VARCHAR(100),
- @Category VARCHAR(50),
- @Quantity INT,
- @Price DECIMAL(10,2),
- @MinimumStock INT,
+ @Name VARCHAR(100) = NULL,
+ @Category VARCHAR(50) = NULL,
+ @Quantity INT = NULL,
+ @Price DECIMAL(10,2) = NULL,
+ @MinimumStock INT = NULL,
  @SupplierID INT = NULL,
- @UserName VARCHAR(50)
+ @UserName VARCHAR(50),
+ @ExpectedRowVer BIGINT = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
  BEGIN TRANSACTION;
   BEGIN TRY
-   
-   DECLARE @OldQty INT;
-   SELECT @OldQty = Quantity FROM Medicines WHERE MedicineID = @MedicineID;
-   
-   -- Compute new status based on quantity and minimum stock
-   DECLARE @NewStatus VARCHAR(20);
-   IF @Quantity <= 0
-      SET @NewStatus = 'out of stock';
-   ELSE IF @MinimumStock > 0 AND @Quantity < @MinimumStock
-      SET @NewStatus = 'low stock';
-   ELSE
-      SET @NewStatus = 'ok';
+
+   -- NULL parameters keep the current value. When @ExpectedRowVer is given the update is a
+   -- compare-and-swap: it only applies if the row is unchanged since the caller read it.
+   DECLARE @Changed TABLE (OldQty INT, NewQty INT, Name VARCHAR(100), SupplierID INT, RowVer BIGINT);
 
    -- Update the medicine details (status computed server-side)
    UPDATE Medicines
-   SET Name=@Name,
-      Category=@Category,
-      Quantity=@Quantity,
-      Price=@Price,
-      MinimumStock=@MinimumStock,
-      Status=@NewStatus,
-      SupplierID=@SupplierID
-   WHERE MedicineID=@MedicineID;
-   
-   -- Add stock adjustment if quantity changed
-   IF @OldQty <> @Quantity
+   SET Name = ISNULL(@Name, Name),
+      Category = ISNULL(@Category, Category),
+      Quantity = ISNULL(@Quantity, Quantity),
+      Price = ISNULL(@Price, Price),
+      MinimumStock = ISNULL(@MinimumStock, MinimumStock),
+      SupplierID = ISNULL(@SupplierID, SupplierID),
+      Status = CASE
+                  WHEN ISNULL(ISNULL(@Quantity, Quantity), 0) <= 0 THEN 'out of stock'
+                  WHEN ISNULL(ISNULL(@MinimumStock, MinimumStock), 0) > 0
+                       AND ISNULL(ISNULL(@Quantity, Quantity), 0) < ISNULL(@MinimumStock, MinimumStock) THEN 'low stock'
+                  ELSE 'ok'
+               END
+   OUTPUT ISNULL(deleted.Quantity, 0), ISNULL(inserted.Quantity, 0), inserted.Name, inserted.SupplierID,
+          CAST(inserted.RowVer AS BIGINT)
+   INTO @Changed
+   WHERE MedicineID = @MedicineID
+     AND (@ExpectedRowVer IS NULL OR CAST(RowVer AS BIGINT) = @ExpectedRowVer);
+
+   IF NOT EXISTS (SELECT 1 FROM @Changed)
    BEGIN
-      DECLARE @ChangeQty INT;
-      SET @ChangeQty = @Quantity - @OldQty;
-        EXEC AddStockAdjustment
-           @MedicineID = @MedicineID,
-           @OldQty = @OldQty,
-           @NewQty = @Quantity,
-           @ChangeQty = @ChangeQty,
-           @SupplierID = @SupplierID,
-           @Reason = 'Stock adjustment on medicine update',
-           @UserName = @UserName;
+      IF NOT EXISTS (SELECT 1 FROM Medicines WHERE MedicineID = @MedicineID)
+         THROW 51001, 'Medicine not found.', 1;
+      THROW 51010, 'Medicine was changed by another user. Reload it and try again.', 1;
    END
+
+   DECLARE @OldQty INT, @NewQty INT, @NewName VARCHAR(100), @NewSupplierID INT, @NewRowVer BIGINT;
+   SELECT @OldQty = OldQty, @NewQty = NewQty, @NewName = Name, @NewSupplierID = SupplierID, @NewRowVer = RowVer
+   FROM @Changed;
+
+   -- Add stock adjustment if quantity changed
+   IF @OldQty <> @NewQty
+      INSERT INTO StockAdjustments (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName)
+      VALUES (@MedicineID, @OldQty, @NewQty, @NewQty - @OldQty, @NewSupplierID,
+              'Stock adjustment on medicine update', @UserName);
    
    -- Activity Log
    DECLARE @ActionText VARCHAR(300);
    SET @ActionText =
-         'Updated medicine: ' + @Name
+         'Updated medicine: ' + @NewName
        + ' (ID: ' + CAST(@MedicineID AS VARCHAR(10)) + ')';
    EXEC AddActivityLog 
        @UserName = @UserName,
        @Action = @ActionText;
    COMMIT TRANSACTION;
+
+   -- New row version so the caller can keep editing without re-reading
+   SELECT @NewRowVer AS RowVer;
  END TRY
  BEGIN CATCH
-    ROLLBACK TRANSACTION;
+    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
     THROW;
  END CATCH
 END;
@@ -388,18 +397,34 @@ CREATE PROCEDURE CreateSale
  @Subtotal DECIMAL(10,2),
  @Tax DECIMAL(10,2),
  @Total DECIMAL(10,2),
- @UserName VARCHAR(50)
+ @UserName VARCHAR(50),
+ @IdempotencyKey VARCHAR(64) = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
  BEGIN TRANSACTION;
   BEGIN TRY
 
-    INSERT INTO Sales (CustomerID, Subtotal, Tax, Total, UserName)
-    VALUES (@CustomerID, @Subtotal, @Tax, @Total, @UserName);
+    -- A resubmitted key returns the sale recorded the first time instead of creating another.
+    -- UPDLOCK/HOLDLOCK makes a concurrent submission of the same key wait for the first one.
+    DECLARE @ExistingID INT, @ExistingTotal DECIMAL(10,2);
+    IF @IdempotencyKey IS NOT NULL
+       SELECT @ExistingID = SaleID, @ExistingTotal = Total
+       FROM Sales WITH (UPDLOCK, HOLDLOCK)
+       WHERE IdempotencyKey = @IdempotencyKey;
+
+    IF @ExistingID IS NOT NULL
+    BEGIN
+       SELECT @ExistingID AS SaleID, CAST(1 AS BIT) AS AlreadyExists, @ExistingTotal AS Total;
+       COMMIT TRANSACTION;
+       RETURN;
+    END
+
+    INSERT INTO Sales (CustomerID, Subtotal, Tax, Total, UserName, IdempotencyKey)
+    VALUES (@CustomerID, @Subtotal, @Tax, @Total, @UserName, @IdempotencyKey);
 
     -- return the generated identity value
-   SELECT SCOPE_IDENTITY() AS SaleID;
+   SELECT CAST(SCOPE_IDENTITY() AS INT) AS SaleID, CAST(0 AS BIT) AS AlreadyExists, @Total AS Total;
 
     COMMIT TRANSACTION;
  END TRY
@@ -426,44 +451,26 @@ BEGIN
   BEGIN TRY
 
 
-    -- Read current quantity
-    DECLARE @OldQty INT;
-    SELECT @OldQty = Quantity FROM Medicines WHERE MedicineID = @MedicineID;
-    IF @OldQty IS NULL
-    BEGIN
-       ROLLBACK TRANSACTION;
-       THROW 51001, 'Medicine not found.', 1;
-    END
-    -- Ensure requested quantity does not exceed available stock
-    IF @Quantity > @OldQty
-    BEGIN
-       ROLLBACK TRANSACTION;
-       THROW 51000, 'Insufficient stock for the requested medicine.', 1;
-    END
-
-    DECLARE @NewQty INT = @OldQty - @Quantity;
-
-    -- Insert sale item
-    INSERT INTO SaleItems (SaleID, MedicineID, Quantity, Price)
-    VALUES (@SaleID, @MedicineID, @Quantity, @Price);
-
-    -- Record stock adjustment using centralized proc (it will update Medicines.Quantity)
-    DECLARE @ChangeQty INT = @NewQty - @OldQty; -- negative value
+    -- Decrement stock as a delta in one statement; throws 51000 (insufficient stock)
+    -- or 51001 (medicine not found) instead of reading then writing the quantity
+    DECLARE @Delta INT = -@Quantity;
     DECLARE @Reason VARCHAR(255) = 'Sale: ' + CAST(@SaleID AS VARCHAR(20));
 
-    EXEC AddStockAdjustment
+    EXEC ApplyStockDelta
         @MedicineID = @MedicineID,
-        @OldQty = @OldQty,
-        @NewQty = @NewQty,
-        @ChangeQty = @ChangeQty,
+        @Delta = @Delta,
         @SupplierID = NULL,
         @Reason = @Reason,
         @UserName = @UserName;
 
+    -- Insert sale item
+    INSERT INTO SaleItems (SaleID, MedicineID, Quantity, Price)
+    VALUES (@SaleID, @MedicineID, @Quantity, @Price);
+
     COMMIT TRANSACTION;
  END TRY
  BEGIN CATCH
-    ROLLBACK TRANSACTION;
+    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
     THROW;
  END CATCH
 END;
@@ -617,29 +624,21 @@ BEGIN TRANSACTION;
 
    DECLARE @ReturnID INT = SCOPE_IDENTITY();
 
-    -- Read current medicine quantity and compute new quantity
-    DECLARE @OldQty INT;
-    SELECT @OldQty = Quantity FROM Medicines WHERE MedicineID = @MedicineID;
-    IF @OldQty IS NULL
+    -- Put the returned quantity back as a delta (no read-modify-write of the quantity)
+    IF NOT EXISTS (SELECT 1 FROM Medicines WHERE MedicineID = @MedicineID)
     BEGIN
        ROLLBACK TRANSACTION;
        THROW 51002, 'Medicine not found for return.', 1;
     END
 
-    DECLARE @NewQty INT = @OldQty + @Quantity;
-
-    -- Record stock adjustment using centralized proc (it will update Medicines.Quantity)
-    DECLARE @ChangeQty INT = @NewQty - @OldQty; -- positive for returns
     DECLARE @AdjReason VARCHAR(255) = 'Return: ' + CAST(@ReturnID AS VARCHAR(20));
 
     IF @Reason IS NOT NULL AND LTRIM(RTRIM(@Reason)) <> ''
        SET @AdjReason = @AdjReason + ' - ' + @Reason;
 
-    EXEC AddStockAdjustment
+    EXEC ApplyStockDelta
         @MedicineID = @MedicineID,
-        @OldQty = @OldQty,
-        @NewQty = @NewQty,
-        @ChangeQty = @ChangeQty,
+        @Delta = @Quantity,
         @SupplierID = NULL,
         @Reason = @AdjReason,
         @UserName = @UserName;
@@ -684,7 +683,7 @@ BEGIN TRANSACTION;
     COMMIT TRANSACTION;
  END TRY
  BEGIN CATCH
-    ROLLBACK TRANSACTION;
+    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
     THROW;
  END CATCH
 END;
@@ -744,6 +743,116 @@ BEGIN
 END;
 GO
 
+/* -----------------------------
+   APPLY STOCK DELTA
+   Adds a signed delta to Medicines.Quantity in a single UPDATE (no read-modify-write),
+   refusing to go below zero, recomputes Status and records the StockAdjustments row.
+   Results come back through OUTPUT parameters so callers' result sets are unaffected.
+------------------------------*/
+CREATE PROCEDURE ApplyStockDelta
+ @MedicineID INT,
+ @Delta INT,
+ @SupplierID INT = NULL,
+ @Reason VARCHAR(255),
+ @UserName VARCHAR(50),
+ @OldQty INT = NULL OUTPUT,
+ @NewQty INT = NULL OUTPUT,
+ @AdjustmentID INT = NULL OUTPUT
+AS
+BEGIN
+   SET NOCOUNT ON;
+ BEGIN TRANSACTION;
+ BEGIN TRY
+
+    DECLARE @Changed TABLE (OldQty INT, NewQty INT);
+
+    UPDATE Medicines
+    SET Quantity = ISNULL(Quantity, 0) + @Delta,
+        Status = CASE
+                    WHEN ISNULL(Quantity, 0) + @Delta <= 0 THEN 'out of stock'
+                    WHEN MinimumStock > 0 AND ISNULL(Quantity, 0) + @Delta < MinimumStock THEN 'low stock'
+                    ELSE 'ok'
+                 END
+    OUTPUT ISNULL(deleted.Quantity, 0), inserted.Quantity INTO @Changed
+    WHERE MedicineID = @MedicineID
+      AND ISNULL(Quantity, 0) + @Delta >= 0;
+
+    IF NOT EXISTS (SELECT 1 FROM @Changed)
+    BEGIN
+       DECLARE @Available INT = (SELECT ISNULL(Quantity, 0) FROM Medicines WHERE MedicineID = @MedicineID);
+       IF @Available IS NULL
+          THROW 51001, 'Medicine not found.', 1;
+       DECLARE @Msg NVARCHAR(200) = CONCAT('Insufficient stock for the requested medicine (available ', @Available, ').');
+       THROW 51000, @Msg, 1;
+    END
+
+    SELECT @OldQty = OldQty, @NewQty = NewQty FROM @Changed;
+
+    INSERT INTO StockAdjustments
+    (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName)
+    VALUES
+    (@MedicineID, @OldQty, @NewQty, @Delta, @SupplierID, @Reason, @UserName);
+
+    SET @AdjustmentID = SCOPE_IDENTITY();
+
+    COMMIT TRANSACTION;
+ END TRY
+ BEGIN CATCH
+    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+    THROW;
+ END CATCH
+END;
+GO
+
+/* -----------------------------
+   APPLY STOCK MOVEMENT (STOCK IN / STOCK OUT)
+   Public entry point for manual stock movements: positive @Delta for stock in,
+   negative for stock out. Returns AdjustmentID, MedicineName, OldQty, NewQty.
+------------------------------*/
+CREATE PROCEDURE ApplyStockMovement
+ @MedicineID INT,
+ @Delta INT,
+ @SupplierID INT = NULL,
+ @Reason VARCHAR(255),
+ @UserName VARCHAR(50)
+AS
+BEGIN
+   SET NOCOUNT ON;
+ BEGIN TRANSACTION;
+ BEGIN TRY
+
+    IF @Delta IS NULL OR @Delta = 0
+       THROW 51006, 'Stock movement quantity must not be zero.', 1;
+
+    DECLARE @OldQty INT, @NewQty INT, @AdjustmentID INT;
+    EXEC ApplyStockDelta
+        @MedicineID = @MedicineID,
+        @Delta = @Delta,
+        @SupplierID = @SupplierID,
+        @Reason = @Reason,
+        @UserName = @UserName,
+        @OldQty = @OldQty OUTPUT,
+        @NewQty = @NewQty OUTPUT,
+        @AdjustmentID = @AdjustmentID OUTPUT;
+
+    DECLARE @MedicineName VARCHAR(100) = (SELECT Name FROM Medicines WHERE MedicineID = @MedicineID);
+
+    -- Activity Log (inserted directly so the movement result is the only result set)
+    INSERT INTO ActivityLog (UserName, Action)
+    VALUES (@UserName, LEFT(CONCAT('Stock ', CASE WHEN @Delta > 0 THEN 'in' ELSE 'out' END, ' for ', @MedicineName,
+                                   ' (ID: ', @MedicineID, '): ', @OldQty, ' -> ', @NewQty), 200));
+
+    COMMIT TRANSACTION;
+
+    SELECT @AdjustmentID AS AdjustmentID, @MedicineName AS MedicineName, @OldQty AS OldQty, @NewQty AS NewQty;
+ END TRY
+ BEGIN CATCH
+    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+    THROW;
+ END CATCH
+END;
+GO
+
 /* -----------------------------
    GET MEDICINE BY ID
 ------------------------------*/
@@ -752,7 +861,7 @@ CREATE PROCEDURE GetMedicineByID
 AS
 BEGIN
    SET NOCOUNT ON;
-   SELECT Name, Category, Quantity, MinimumStock, Price, Status, SupplierID, SupplierName
+   SELECT Name, Category, Quantity, MinimumStock, Price, Status, SupplierID, SupplierName, RowVer
    FROM vw_Medicines
    WHERE MedicineID = @MedicineID;
 END;
@@ -1075,7 +1184,7 @@ CREATE PROCEDURE GetAllMedicines
 AS
 BEGIN
    SET NOCOUNT ON;
-   SELECT MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate, SupplierID, SupplierName
+   SELECT MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate, SupplierID, SupplierName, RowVer
    FROM vw_Medicines;
 END;
 GO
@@ -1163,6 +1272,17 @@ BEGIN
 END;
 GO
 
+CREATE PROCEDURE GetSaleByIdempotencyKey
+ @IdempotencyKey VARCHAR(64)
+AS
+BEGIN
+   SET NOCOUNT ON;
+   SELECT SaleID, Total
+   FROM Sales
+   WHERE IdempotencyKey = @IdempotencyKey;
+END;
+GO
+
 CREATE PROCEDURE GetStockAdjustments
 AS
 BEGIN
@@ -1199,7 +1319,8 @@ SELECT
    m.Status, 
    m.CreatedDate,
    m.SupplierID,
-   ISNULL(s.Name, 'unknown') AS SupplierName
+   ISNULL(s.Name, 'unknown') AS SupplierName,
+   CAST(m.RowVer AS BIGINT) AS RowVer
 FROM Medicines m
 LEFT JOIN Suppliers s ON m.SupplierID = s.SupplierID;
 GO
@@ -1338,6 +1459,7 @@ GO
 
 CREATE INDEX IX_Sales_Timestamp ON Sales([Timestamp]);
 CREATE INDEX IX_Sales_CustomerID ON Sales(CustomerID);
+CREATE UNIQUE INDEX UX_Sales_IdempotencyKey ON Sales(IdempotencyKey) WHERE IdempotencyKey IS NOT NULL;
 CREATE INDEX IX_SaleItems_SaleID ON SaleItems(SaleID);
 CREATE INDEX IX_SaleItems_MedicineID ON SaleItems(MedicineID);
 CREATE INDEX IX_Returns_MedicineID ON Returns(MedicineID);
@@ -1349,6 +1471,9 @@ CREATE INDEX IX_StockAdj_UserName ON StockAdjustments(UserName);
 CREATE INDEX IX_Medicines_Quantity ON Medicines(Quantity);
 CREATE INDEX IX_Medicines_Name ON Medicines(Name);
 CREATE INDEX IX_Medicines_Category ON Medicines(Category);
+CREATE INDEX IX_Customers_Name ON Customers(Name);
+CREATE INDEX IX_Suppliers_Name ON Suppliers(Name);
+CREATE INDEX IX_Returns_Timestamp ON Returns([Timestamp]);
 CREATE INDEX IX_Users_Role ON Users(Role);
 CREATE INDEX IX_ActivityLog_LogTime ON ActivityLog(LogTime);
 GO
@@ -1455,6 +1580,167 @@ BEGIN
 END;
 GO
 
+/* -----------------------------
+   PAGED LIST PROCEDURES
+   One page of a list view at a time. @SortColumn is matched against a fixed
+   whitelist and only the mapped column name is spliced into the ORDER BY;
+   everything else (search text, offset, limit) stays parameterized. The key
+   column is always the last sort key so pages are stable across equal values.
+   Callers ask for one row more than they show to learn whether a next page
+   exists without a COUNT(*) over the whole table.
+------------------------------*/
+CREATE PROCEDURE GetMedicinesPage
+ @Offset INT = 0,
+ @Limit INT = 100,
+ @SortColumn VARCHAR(30) = 'Name',
+ @SortDesc BIT = 0,
+ @Search VARCHAR(200) = NULL
+AS
+BEGIN
+   SET NOCOUNT ON;
+   DECLARE @col SYSNAME = CASE @SortColumn
+      WHEN 'MedicineID' THEN 'MedicineID'
+      WHEN 'Category' THEN 'Category'
+      WHEN 'SupplierName' THEN 'SupplierName'
+      WHEN 'Quantity' THEN 'Quantity'
+      WHEN 'MinimumStock' THEN 'MinimumStock'
+      WHEN 'Price' THEN 'Price'
+      WHEN 'CreatedDate' THEN 'CreatedDate'
+      ELSE 'Name' END;
+   DECLARE @dir NVARCHAR(4) = CASE WHEN @SortDesc = 1 THEN N'DESC' ELSE N'ASC' END;
+   DECLARE @q VARCHAR(210) = CASE WHEN TRIM(ISNULL(@Search, '')) = '' THEN NULL
+                                  ELSE '%' + TRIM(@Search) + '%' END;
+   DECLARE @sql NVARCHAR(MAX) = N'
+      SELECT MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate, SupplierID, SupplierName, RowVer
+      FROM vw_Medicines
+      WHERE @q IS NULL OR Name LIKE @q OR Category LIKE @q OR CAST(MedicineID AS VARCHAR(20)) LIKE @q
+      ORDER BY ' + QUOTENAME(@col) + N' ' + @dir + N', MedicineID ' + @dir + N'
+      OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY;';
+   EXEC sp_executesql @sql, N'@q VARCHAR(210), @Offset INT, @Limit INT', @q, @Offset, @Limit;
+END;
+GO
+
+CREATE PROCEDURE GetCustomersPage
+ @Offset INT = 0,
+ @Limit INT = 100,
+ @SortColumn VARCHAR(30) = 'Name',
+ @SortDesc BIT = 0,
+ @Search VARCHAR(200) = NULL
+AS
+BEGIN
+   SET NOCOUNT ON;
+   DECLARE @col SYSNAME = CASE @SortColumn
+      WHEN 'CustomerID' THEN 'CustomerID'
+      WHEN 'Phone' THEN 'Phone'
+      WHEN 'Email' THEN 'Email'
+      WHEN 'TotalPurchases' THEN 'TotalPurchases'
+      WHEN 'CreatedDate' THEN 'CreatedDate'
+      ELSE 'Name' END;
+   DECLARE @dir NVARCHAR(4) = CASE WHEN @SortDesc = 1 THEN N'DESC' ELSE N'ASC' END;
+   DECLARE @q VARCHAR(210) = CASE WHEN TRIM(ISNULL(@Search, '')) = '' THEN NULL
+                                  ELSE '%' + TRIM(@Search) + '%' END;
+   DECLARE @sql NVARCHAR(MAX) = N'
+      SELECT CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases
+      FROM vw_Customers
+      WHERE @q IS NULL OR Name LIKE @q OR Phone LIKE @q OR Email LIKE @q OR CAST(CustomerID AS VARCHAR(20)) LIKE @q
+      ORDER BY ' + QUOTENAME(@col) + N' ' + @dir + N', CustomerID ' + @dir + N'
+      OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY;';
+   EXEC sp_executesql @sql, N'@q VARCHAR(210), @Offset INT, @Limit INT', @q, @Offset, @Limit;
+END;
+GO
+
+CREATE PROCEDURE GetSuppliersPage
+ @Offset INT = 0,
+ @Limit INT = 100,
+ @SortColumn VARCHAR(30) = 'Name',
+ @SortDesc BIT = 0,
+ @Search VARCHAR(200) = NULL
+AS
+BEGIN
+   SET NOCOUNT ON;
+   DECLARE @col SYSNAME = CASE @SortColumn
+      WHEN 'SupplierID' THEN 'SupplierID'
+      WHEN 'Company' THEN 'Company'
+      WHEN 'Phone' THEN 'Phone'
+      WHEN 'Email' THEN 'Email'
+      WHEN 'Active' THEN 'Active'
+      WHEN 'CreatedDate' THEN 'CreatedDate'
+      ELSE 'Name' END;
+   DECLARE @dir NVARCHAR(4) = CASE WHEN @SortDesc = 1 THEN N'DESC' ELSE N'ASC' END;
+   DECLARE @q VARCHAR(210) = CASE WHEN TRIM(ISNULL(@Search, '')) = '' THEN NULL
+                                  ELSE '%' + TRIM(@Search) + '%' END;
+   DECLARE @sql NVARCHAR(MAX) = N'
+      SELECT SupplierID, Name, Company, Phone, Email, Active, CreatedDate
+      FROM vw_Suppliers
+      WHERE @q IS NULL OR Name LIKE @q OR Company LIKE @q OR Phone LIKE @q OR Email LIKE @q OR CAST(SupplierID AS VARCHAR(20)) LIKE @q
+      ORDER BY ' + QUOTENAME(@col) + N' ' + @dir + N', SupplierID ' + @dir + N'
+      OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY;';
+   EXEC sp_executesql @sql, N'@q VARCHAR(210), @Offset INT, @Limit INT', @q, @Offset, @Limit;
+END;
+GO
+
+CREATE PROCEDURE GetUsersPage
+ @Offset INT = 0,
+ @Limit INT = 100,
+ @SortColumn VARCHAR(30) = 'Username',
+ @SortDesc BIT = 0,
+ @Search VARCHAR(200) = NULL
+AS
+BEGIN
+   SET NOCOUNT ON;
+   DECLARE @col SYSNAME = CASE @SortColumn
+      WHEN 'FullName' THEN 'FullName'
+      WHEN 'Phone' THEN 'Phone'
+      WHEN 'Email' THEN 'Email'
+      WHEN 'Role' THEN 'Role'
+      WHEN 'Active' THEN 'Active'
+      ELSE 'Username' END;
+   DECLARE @dir NVARCHAR(4) = CASE WHEN @SortDesc = 1 THEN N'DESC' ELSE N'ASC' END;
+   DECLARE @q VARCHAR(210) = CASE WHEN TRIM(ISNULL(@Search, '')) = '' THEN NULL
+                                  ELSE '%' + TRIM(@Search) + '%' END;
+   DECLARE @sql NVARCHAR(MAX) = N'
+      SELECT Username, FullName, PasswordHash, Role, Active, Email, Phone
+      FROM vw_Users
+      WHERE @q IS NULL OR Username LIKE @q OR FullName LIKE @q OR Email LIKE @q OR Phone LIKE @q OR Role LIKE @q
+         OR (CASE WHEN Active = 1 THEN ''Active'' ELSE ''Inactive'' END) LIKE @q
+      ORDER BY ' + QUOTENAME(@col) + N' ' + @dir + N', Username ' + @dir + N'
+      OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY;';
+   EXEC sp_executesql @sql, N'@q VARCHAR(210), @Offset INT, @Limit INT', @q, @Offset, @Limit;
+END;
+GO
+
+CREATE PROCEDURE GetReturnsPage
+ @Offset INT = 0,
+ @Limit INT = 100,
+ @SortColumn VARCHAR(30) = 'Timestamp',
+ @SortDesc BIT = 1,
+ @Search VARCHAR(200) = NULL
+AS
+BEGIN
+   SET NOCOUNT ON;
+   DECLARE @col SYSNAME = CASE @SortColumn
+      WHEN 'ReturnID' THEN 'ReturnID'
+      WHEN 'MedicineName' THEN 'MedicineName'
+      WHEN 'Quantity' THEN 'Quantity'
+      WHEN 'Amount' THEN 'Amount'
+      WHEN 'SaleID' THEN 'SaleID'
+      WHEN 'CustomerName' THEN 'CustomerName'
+      WHEN 'Reason' THEN 'Reason'
+      ELSE 'Timestamp' END;
+   DECLARE @dir NVARCHAR(4) = CASE WHEN @SortDesc = 1 THEN N'DESC' ELSE N'ASC' END;
+   DECLARE @q VARCHAR(210) = CASE WHEN TRIM(ISNULL(@Search, '')) = '' THEN NULL
+                                  ELSE '%' + TRIM(@Search) + '%' END;
+   DECLARE @sql NVARCHAR(MAX) = N'
+      SELECT ReturnID, SaleID, MedicineID, MedicineName, Quantity, UnitPrice, Amount, CustomerID, CustomerName, Reason, Timestamp, UserName
+      FROM vw_Returns_Detailed
+      WHERE @q IS NULL OR MedicineName LIKE @q OR CustomerName LIKE @q OR Reason LIKE @q
+         OR CAST(ReturnID AS VARCHAR(20)) LIKE @q OR CAST(SaleID AS VARCHAR(20)) LIKE @q
+      ORDER BY ' + QUOTENAME(@col) + N' ' + @dir + N', ReturnID ' + @dir + N'
+      OFFSET @Offset ROWS FETCH NEXT @Limit ROWS ONLY;';
+   EXEC sp_executesql @sql, N'@q VARCHAR(210), @Offset INT, @Limit INT', @q, @Offset, @Limit;
+END;
+GO
+
 CREATE PROCEDURE GetCustomersReport
 AS
 BEGIN
@@ -0,0 +1,31 @@
+"""Headless core of the pharmacy app: configuration, database access, the
+backend and the per-terminal local data. Nothing here imports tkinter or opens
+a connection at import time, so scripts, benchmarks and other front ends can
+use it directly:
+
+    from pharmacy_core import PharmacyBackend, load_config
+    backend = PharmacyBackend(load_config()).connect()
+    medicines, has_more = backend.get_medicines_page()
+
+Config(engine='sqlite') runs the same backend on the embedded SQLite engine
+(pharmacy_core.sqlite_engine) instead of SQL Server. AsyncPharmacyBackend
+(pharmacy_core.aio) offers the same methods as coroutines for asyncio code.
+"""
+from .config import Config, load_config, local_data_path, PAGE_SIZE, STREAM_BATCH_SIZE
+from .db import (DatabaseError, OperationalError, OfflineConnection, connect_database,
+                 is_connection_error, db_error_message)
+from .records import (Record, Medicine, Customer, Sale, SaleItem, Return, StockAdjustment,
+                      ActivityEntry)
+from .localdata import ParkedCartStore, CartJournal, CatalogCache, SaleQueue
+from .tracing import QueryTracer
+from .backend import PharmacyBackend, SaleReplayer
+from .aio import AsyncPharmacyBackend
+
+__all__ = [
+    'Config', 'load_config', 'local_data_path', 'PAGE_SIZE', 'STREAM_BATCH_SIZE',
+    'DatabaseError', 'OperationalError', 'OfflineConnection', 'connect_database',
+    'is_connection_error', 'db_error_message',
+    'Record', 'Medicine', 'Customer', 'Sale', 'SaleItem', 'Return', 'StockAdjustment', 'ActivityEntry',
+    'ParkedCartStore', 'CartJournal', 'CatalogCache', 'SaleQueue', 'QueryTracer',
+    'PharmacyBackend', 'SaleReplayer', 'AsyncPharmacyBackend',
+]
@@ -0,0 +1,162 @@
+"""asyncio facade over PharmacyBackend.
+
+AsyncPharmacyBackend mirrors the backend's public methods as coroutines
+(`await db.get_medicines()`, `await db.create_sale(...)`) and runs each call
+on a bounded pool of worker threads. Every worker uses its own database
+connection (see PharmacyBackend), so independent calls really run in
+parallel and the pool size caps the connections the facade opens:
+
+    async with AsyncPharmacyBackend(backend) as db:
+        data = await db.fetch_many(stats='get_dashboard_stats',
+                                   low_stock=('get_low_stock_medicines', 5),
+                                   sales=db.get_sales_report('week'))
+
+A call that exceeds its timeout, or whose task is cancelled, is cancelled
+on the server as well (PharmacyBackend.cancel_statement) and its worker
+freed. A write cancelled this late may still have committed; sales should be
+resubmitted with the same idempotency key (submit_sale) rather than retried
+blindly.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .backend import PharmacyBackend
+from .config import ASYNC_CALL_TIMEOUT, ASYNC_WORKERS
+
+# Backend methods that make no sense from a worker thread: connection
+# ownership, thread-bound context managers and lazy generators
+_NOT_MIRRORED = {'connect', 'install_connection', 'close', 'release_thread_connection',
+                 'cancel_statement', 'unit_of_work'}
+
+_DEFAULT = object()
+
+
+class _Call:
+    """One backend call on a worker thread; cancel() aborts its statement while it runs."""
+
+    def __init__(self, backend, method, args, kwargs):
+        self.backend = backend
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.ident = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.ident = threading.get_ident()
+        try:
+            return self.method(*self.args, **self.kwargs)
+        finally:
+            # Under the lock, so a late cancel() cannot hit the worker's next call
+            with self._lock:
+                self.ident = None
+
+    def cancel(self):
+        with self._lock:
+            if self.ident is not None:
+                self.backend.cancel_statement(self.ident)
+
+
+class AsyncPharmacyBackend:
+    """Coroutine versions of the PharmacyBackend methods.
+    `backend` defaults to a new PharmacyBackend(); `max_workers` bounds the
+    worker threads (and connections) and `timeout` is the default limit in
+    seconds of one call (None: no limit). Every mirrored method also takes a
+    `timeout=` keyword overriding it for that call.
+    """
+
+    def __init__(self, backend=None, max_workers=ASYNC_WORKERS, timeout=ASYNC_CALL_TIMEOUT):
+        self.backend = backend or PharmacyBackend()
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='pharmacy-async')
+        self._workers = set()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name.startswith('iter_') or name in _NOT_MIRRORED:
+            raise AttributeError(name)
+        if not callable(getattr(self.backend, name)):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    def __dir__(self):
+        mirrored = [n for n in dir(self.backend) if not n.startswith(('_', 'iter_'))
+                    and n not in _NOT_MIRRORED and callable(getattr(self.backend, n, None))]
+        return sorted(set(super().__dir__()) | set(mirrored))
+
+    async def call(self, name, *args, timeout=_DEFAULT, **kwargs):
+        """Run backend method `name` on a worker and return its result.
+        Raises asyncio.TimeoutError after `timeout` seconds; either way the
+        statement running on the server is cancelled."""
+        if self._executor is None:
+            raise RuntimeError('AsyncPharmacyBackend is closed')
+        job = _Call(self.backend, getattr(self.backend, name), args, kwargs)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._track(job))
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # A call still queued never starts; one already running is stopped at the server
+            job.cancel()
+            raise
+
+    def _track(self, job):
+        def run():
+            self._workers.add(threading.get_ident())
+            return job()
+        return run
+
+    async def fetch_many(self, _calls=None, timeout=_DEFAULT, return_exceptions=False, **calls):
+        """Run independent calls in parallel and return {key: result}.
+        Each value is a method name, a (name, *args) tuple or a coroutine from
+        this facade; `timeout` applies to the whole batch. Unless
+        `return_exceptions`, the first failure cancels the other calls and is
+        raised; with it, failures are returned in place of their results.
+        """
+        calls = dict(_calls or {}, **calls)
+        tasks = []
+        for spec in calls.values():
+            if isinstance(spec, str):
+                spec = self.call(spec)
+            elif isinstance(spec, tuple):
+                spec = self.call(*spec)
+            tasks.append(asyncio.ensure_future(spec))
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=return_exceptions),
+                                             timeout)
+        except BaseException:
+            # gather() leaves the siblings of a failed call running
+            for task in tasks:
+                task.cancel()
+            raise
+        return dict(zip(calls, results))
+
+    async def map(self, name, arg_lists, timeout=_DEFAULT, return_exceptions=False):
+        """Call method `name` once per argument tuple in `arg_lists`, in parallel;
+        results come back in the same order."""
+        batch = [self.call(name, *args, timeout=timeout) for args in arg_lists]
+        return await asyncio.gather(*batch, return_exceptions=return_exceptions)
+
+    def close(self):
+        """Stop the workers and close the connections they opened. Queued calls
+        that have not started are cancelled; running ones are waited for."""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        for ident in list(self._workers):
+            self.backend.release_thread_connection(ident)
+        self._workers.clear()
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,1802 @@
+"""PharmacyBackend: every database operation of the app, with no UI code."""
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .config import (PAGE_SIZE, REPEATED_STATEMENT_LIMIT, SALE_SUBMIT_RETRIES, STREAM_BATCH_SIZE,
+                     TXN_BACKOFF_BASE, TXN_BACKOFF_MAX, TXN_MAX_ATTEMPTS, TXN_TIME_BUDGET, load_config,
+                     local_data_path)
+from .db import (DatabaseError, OfflineConnection, connect_database, db_error_message, is_connection_error,
+                 last_result_row, retryable_error_kind)
+from .localdata import CatalogCache, SaleQueue
+from .records import ActivityEntry, Customer, Medicine, Return, Sale, SaleItem, StockAdjustment
+from .tracing import QueryTracer
+
+class PharmacyBackend:
+    """Database-backed operations of the pharmacy, independent of any UI.
+    `config` defaults to load_config(); `connection_factory` (a callable
+    returning a new DB-API connection) defaults to connect_database(config).
+    Nothing connects until connect() or install_connection() is called.
+    Every connection the factory opens is traced by `self.tracer`.
+
+    The backend may be used from several threads at once. The installed
+    connection belongs to the thread that installed it (the UI thread in the
+    app); any other thread gets its own connection and cursor on first use, so
+    `self.conn` and `self.cursor` always refer to the calling thread's. Writes
+    run in a unit_of_work(), which keeps them on one connection until commit.
+    """
+
+    def __init__(self, config=None, connection_factory=None):
+        self.config = config or load_config()
+        # Per-statement timings of this session, with a slow-query log next to the other local data
+        self.tracer = QueryTracer(self.config.slow_query_ms, local_data_path('slow_queries.log'),
+                                  self.config.round_trip_budget, REPEATED_STATEMENT_LIMIT)
+        open_connection = connection_factory or (lambda: connect_database(self.config))
+        self.connection_factory = lambda: self.tracer.wrap(open_connection())
+        # The installed (shared) connection and the thread that owns it; other threads'
+        # connections by thread id, and the per-thread cursor / open unit of work
+        # (also kept by thread id, so cancel_statement() can reach it)
+        self._primary = None
+        self._primary_cursor = None
+        self._owner = None
+        self._thread_conns = {}
+        self._uow_cursors = {}
+        self._conn_lock = threading.Lock()
+        self._local = threading.local()
+        # Keep no persistent settings cache. Provide helpers to always read
+        # settings from the database so the UI never relies on stale in-memory data.
+        # Backwards-compatible `self.settings` remains empty.
+        self.settings = {}
+        # Last-known catalog and a durable queue of sales taken while the
+        # database is unreachable (store-and-forward offline mode)
+        self.catalog_cache = CatalogCache(local_data_path('catalog_cache.json'))
+        self.sale_queue = SaleQueue(local_data_path('sale_queue.jsonl'))
+        # Retry counters of the shared transaction runner, keyed by write path
+        self.txn_stats = {}
+        self._stats_lock = threading.Lock()
+
+    # --- Connection state / offline mode ---
+    @property
+    def offline(self):
+        return isinstance(self._primary, OfflineConnection)
+
+    @property
+    def connected(self):
+        # False until the startup connection (or the offline stand-in) is installed
+        return self._primary is not None
+
+    def _owns_primary(self):
+        return self._owner is None or self._owner == threading.get_ident()
+
+    @property
+    def conn(self):
+        """The calling thread's connection (the one of its open unit of work, if any)."""
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            return uow[0]
+        if self._owns_primary():
+            return self._primary
+        return self._thread_connection()[0]
+
+    @property
+    def cursor(self):
+        """The calling thread's cursor."""
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            return uow[1]
+        if self._owns_primary():
+            return self._primary_cursor
+        return self._thread_connection()[1]
+
+    def _thread_connection(self):
+        # (connection, cursor) of a thread other than the owner, opened on first use
+        ident = threading.get_ident()
+        with self._conn_lock:
+            pair = self._thread_conns.get(ident)
+        if pair is not None:
+            return pair
+        if self.offline:
+            return OfflineConnection(), OfflineConnection()
+        self._close_dead_thread_connections()
+        try:
+            new_conn = self.connection_factory()
+            new_conn.autocommit = True
+            pair = (new_conn, new_conn.cursor())
+        except (DatabaseError, AttributeError):
+            # Unreachable: fail this call like an offline connection; the next call tries again
+            return OfflineConnection(), OfflineConnection()
+        with self._conn_lock:
+            self._thread_conns[ident] = pair
+        return pair
+
+    def _close_dead_thread_connections(self):
+        alive = {t.ident for t in threading.enumerate()}
+        with self._conn_lock:
+            dead = [ident for ident in self._thread_conns if ident not in alive]
+            pairs = [self._thread_conns.pop(ident) for ident in dead]
+        for old, _ in pairs:
+            try:
+                old.close()
+            except Exception:
+                pass
+
+    def release_thread_connection(self, ident=None):
+        """Close the calling worker thread's own connection (call when a worker
+        finishes), or that of the worker thread with id `ident`."""
+        with self._conn_lock:
+            pair = self._thread_conns.pop(threading.get_ident() if ident is None else ident, None)
+        if pair is not None:
+            try:
+                pair[0].close()
+            except Exception:
+                pass
+
+    def close(self):
+        """Close the installed connection and every worker thread's connection."""
+        with self._conn_lock:
+            pairs = list(self._thread_conns.values())
+            self._thread_conns.clear()
+        old, self._primary, self._primary_cursor, self._owner = self._primary, None, None, None
+        for conn in [pair[0] for pair in pairs] + [old]:
+            try:
+                if conn is not None:
+                    conn.close()
+            except Exception:
+                pass
+
+    def cancel_statement(self, ident):
+        """Ask the driver to abort the statement running on thread `ident`
+        (pyodbc Cursor.cancel; the SQLite engine interrupts its connection).
+        The blocked call then fails with an 'Operation canceled' (HY008) error.
+        Returns False when the thread has no connection to cancel on."""
+        with self._conn_lock:
+            pair = self._thread_conns.get(ident)
+            uow_cursor = self._uow_cursors.get(ident)
+        if ident == self._owner:
+            pair = (self._primary, self._primary_cursor)
+        cursors = [c for c in (uow_cursor, pair and pair[1]) if c is not None]
+        cancelled = False
+        for cur in cursors:
+            try:
+                cur.cancel()
+                cancelled = True
+            except Exception:
+                # OfflineConnection / a closed cursor: nothing is running there
+                pass
+        return cancelled
+
+    def connect(self):
+        """Open a connection with the connection factory and use it. Raises DatabaseError."""
+        self.install_connection(self.connection_factory())
+        return self
+
+    def install_connection(self, new_conn):
+        """Replace the calling thread's connection: the shared one when called by
+        its owner (or before one is installed; the caller becomes the owner, as
+        when the server comes back), otherwise that worker thread's own."""
+        if not self._owns_primary():
+            with self._conn_lock:
+                old = self._thread_conns.get(threading.get_ident(), (None,))[0]
+                if isinstance(new_conn, OfflineConnection):
+                    self._thread_conns.pop(threading.get_ident(), None)
+                else:
+                    self._thread_conns[threading.get_ident()] = (new_conn, new_conn.cursor())
+        else:
+            old = self._primary
+            self._primary_cursor = new_conn.cursor()
+            self._primary = new_conn
+            self._owner = threading.get_ident()
+        if old is not None and old is not new_conn:
+            try:
+                old.close()
+            except Exception:
+                pass
+
+    @property
+    def in_transaction(self):
+        return getattr(self._local, 'uow', None) is not None
+
+    @contextmanager
+    def unit_of_work(self):
+        """Run a block as one transaction on the calling thread's connection:
+
+            with backend.unit_of_work() as cur:
+                cur.execute("EXEC ApplyStockMovement ?,?,?,?,?", ...)
+
+        Commits when the block completes and rolls back if it raises. Backend
+        methods called inside the block on this thread use the same connection
+        and join the transaction, as does a nested unit_of_work(); other
+        threads keep using their own connections meanwhile. Most backend
+        methods report failure by their return value: check it and raise to
+        roll the whole block back.
+        """
+        if self.in_transaction:
+            yield self.cursor
+            return
+        conn = self.conn
+        cur = conn.cursor()
+        self._local.uow = (conn, cur)
+        with self._conn_lock:
+            self._uow_cursors[threading.get_ident()] = cur
+        try:
+            conn.autocommit = False
+            yield cur
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self._local.uow = None
+            with self._conn_lock:
+                self._uow_cursors.pop(threading.get_ident(), None)
+            try:
+                conn.autocommit = True
+            except Exception:
+                pass
+
+    def run_transaction(self, work, label='write', budget=None):
+        """Run `work(cursor)` as one unit of work and commit it, returning its result.
+        A deadlock victim or lock timeout is rolled back and rerun with jittered
+        exponential backoff until TXN_MAX_ATTEMPTS or the time budget runs out;
+        any other error (or the last retryable one) is re-raised after rollback.
+        Inside an open unit_of_work() `work` simply joins it (the outer block
+        decides about commit and retries). Retry counts are kept per label in
+        `self.txn_stats`.
+        """
+        if self.in_transaction:
+            return work(self.cursor)
+        budget = TXN_TIME_BUDGET if budget is None else budget
+        with self._stats_lock:
+            stats = self.txn_stats.setdefault(label, {'calls': 0, 'retries': 0, 'deadlocks': 0,
+                                                      'lock_timeouts': 0, 'failures': 0})
+            stats['calls'] += 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.unit_of_work() as cur:
+                    return work(cur)
+            except Exception as e:
+                kind = retryable_error_kind(e)
+                delay = random.uniform(0, min(TXN_BACKOFF_MAX, TXN_BACKOFF_BASE * (2 ** attempt)))
+                if kind is None or attempt >= TXN_MAX_ATTEMPTS or time.monotonic() - started + delay > budget:
+                    with self._stats_lock:
+                        stats['failures'] += 1
+                    raise
+                with self._stats_lock:
+                    stats['retries'] += 1
+                    stats['deadlocks' if kind == 'deadlock' else 'lock_timeouts'] += 1
+                time.sleep(delay)
+
+    def get_transaction_stats(self):
+        """Per-label counts of write transactions, retries and failures."""
+        with self._stats_lock:
+            return {label: dict(counts) for label, counts in self.txn_stats.items()}
+
+    def get_query_stats(self, sort='total_ms', limit=None):
+        """Per-statement timings of this session, worst first (see QueryTracer.snapshot)."""
+        return self.tracer.snapshot(sort, limit)
+
+    def _note_db_failure(self, exc):
+        # Switch to offline mode when the error means the server is unreachable or too slow.
+        # A worker thread only drops its own connection; it reconnects on its next call.
+        if not self.offline and is_connection_error(exc):
+            self.install_connection(OfflineConnection())
+
+    DEFAULT_SETTINGS = {
+        'pharmacy_name': 'City Pharmacy',
+        'address': '',
+        'phone': '',
+        'tax_rate': 0.0,
+        'currency': 'USD',
+        'start_maximized': True
+    }
+
+    def get_cached_settings(self):
+        """Settings as last read from the server (defaults on first run), without
+        touching the database; used before the connection is up."""
+        return dict(self.catalog_cache.get('settings') or self.DEFAULT_SETTINGS)
+
+    def get_settings(self):
+        """Read settings from DB on-demand and return a dict.
+        This avoids keeping an in-memory, possibly stale, copy.
+        """
+        defaults = dict(self.DEFAULT_SETTINGS)
+        try:
+            self.cursor.execute("EXEC GetSettings")
+            row = self.cursor.fetchone()
+            if not row:
+                return defaults
+            settings = {
+                'pharmacy_name': row[0] or defaults['pharmacy_name'],
+                'address': row[1] or defaults['address'],
+                'phone': row[2] or defaults['phone'],
+                'tax_rate': float(row[3]) if row[3] is not None else defaults['tax_rate'],
+                'currency': row[4] or defaults['currency'],
+                'start_maximized': bool(row[5]) if row[5] is not None else defaults['start_maximized']
+            }
+            self.catalog_cache.store('settings', settings)
+            return settings
+        except Exception as e:
+            self._note_db_failure(e)
+            if self.offline:
+                return dict(self.catalog_cache.get('settings') or defaults)
+            return defaults
+
+    def update_settings(self, pharmacy_name, address, phone, tax_rate, currency, start_maximized, user=None):
+        """Persist settings to DB via stored procedure."""
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC UpdateSettings ?,?,?,?,?,?", pharmacy_name, address, phone, tax_rate, currency, 1 if start_maximized else 0),
+                                 label='update_settings')
+            return True
+        except Exception:
+            return False
+    
+    # Helper methods to get data from database
+    # --- Bulk reads ---
+    # Each table has an iter_* generator yielding (key, record) pairs from fetchmany
+    # batches, so exports and background jobs run in constant memory. By default the
+    # generator runs on its own connection: the shared cursor stays usable while the
+    # caller consumes it. The get_* methods build the familiar dict of dicts from the
+    # same generators on the shared self.cursor.
+
+    def _stream_rows(self, sql, *params, dedicated=True, batch_size=None):
+        """Yield the rows of `sql` in fetchmany batches of `batch_size`."""
+        own_conn = None
+        if dedicated:
+            own_conn = self.connection_factory()
+            own_conn.autocommit = True
+            cur = own_conn.cursor()
+        else:
+            cur = self.cursor
+        try:
+            cur.execute(sql, *params)
+            while True:
+                rows = cur.fetchmany(batch_size or STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                for r in rows:
+                    yield r
+        finally:
+            if own_conn is not None:
+                try:
+                    own_conn.close()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _medicine_record(r):
+        # Normalize MedicineID to string so UI code continues to work with string keys
+        # Map columns returned by GetAllMedicines (now includes supplier columns)
+        return str(r[0]), Medicine(
+            r[1] or '',
+            r[2] or '',
+            int(r[3] or 0),
+            float(r[4] or 0),
+            int(r[5] or 0),
+            r[6] or '',
+            r[7] if len(r) > 7 else None,
+            str(r[8]) if (len(r) > 8 and r[8] is not None) else None,
+            r[9] or '' if len(r) > 9 else '',
+            # Row version for compare-and-swap updates (update_medicine expected_version)
+            int(r[10]) if len(r) > 10 and r[10] is not None else None
+        )
+
+    def iter_medicines(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetAllMedicines", dedicated=dedicated):
+            yield self._medicine_record(r)
+
+    def get_medicines(self):
+        """Get all medicines from database view"""
+        try:
+            results = dict(self.iter_medicines(dedicated=False))
+        except Exception as e:
+            self._note_db_failure(e)
+            if self.offline:
+                # Keep selling from the last-known catalog
+                return dict(self.catalog_cache.get('medicines') or {})
+            # Stored procedure missing or failed — return empty set (no inline SQL), and
+            # keep the last-known catalog offline selling depends on
+            return {}
+        self.catalog_cache.store('medicines', results)
+        return results
+
+    @staticmethod
+    def _customer_record(r):
+        # Normalize CustomerID to string for consistent UI keys
+        return str(r[0]), Customer(
+            r[1] or '',
+            r[2] or '',
+            r[3] or '',
+            r[4] if len(r) > 4 else None,
+            float(r[5] or 0) if len(r) > 5 else 0
+        )
+
+    def iter_customers(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetAllCustomers", dedicated=dedicated):
+            yield self._customer_record(r)
+
+    def get_customers(self):
+        """Get all customers from database view"""
+        try:
+            results = dict(self.iter_customers(dedicated=False))
+        except Exception as e:
+            self._note_db_failure(e)
+            if self.offline:
+                return dict(self.catalog_cache.get('customers') or {})
+            return {}
+        self.catalog_cache.store('customers', results)
+        return results
+
+    @staticmethod
+    def _supplier_record(r):
+        # Normalize SupplierID to string so UI code continues to work with string keys
+        return str(r[0]), {
+            'name': r[1] or '',
+            'company': r[2] or '',
+            'phone': r[3] or '',
+            'email': r[4] or '',
+            'active': bool(r[5]) if r[5] is not None else True,
+            'created_date': r[6] if len(r) > 6 else None
+        }
+
+    def iter_suppliers(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetAllSuppliers", dedicated=dedicated):
+            yield self._supplier_record(r)
+
+    def get_suppliers(self):
+        """Get all suppliers from database view"""
+        try:
+            return dict(self.iter_suppliers(dedicated=False))
+        except Exception:
+            return {}
+
+    @staticmethod
+    def _user_record(r):
+        return r[0], {
+            'full_name': r[1] or '',
+            'password': r[2] or '',
+            'role': r[3] or '',
+            'active': bool(r[4]) if r[4] is not None else True,
+            'email': r[5] or '',
+            'phone': r[6] or ''
+        }
+
+    def iter_users(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetAllUsers", dedicated=dedicated):
+            yield self._user_record(r)
+
+    def get_users(self):
+        """Get all users from database view"""
+        try:
+            return dict(self.iter_users(dedicated=False))
+        except Exception as e:
+            self._note_db_failure(e)
+            return {}
+
+    @staticmethod
+    def _sale_record(r):
+        # Normalize SaleID to string for consistent UI keys
+        return str(r[0]), Sale(
+            str(r[1]) if r[1] is not None else None,
+            r[2] or '',
+            (),  # shared empty tuple; get_sales swaps in a list when the sale has lines
+            float(r[3] or 0),
+            float(r[4] or 0),
+            float(r[5] or 0),
+            r[6] if len(r) > 6 else None,
+            r[7] if len(r) > 7 else None,
+            r[8] if len(r) > 8 else None
+        )
+
+    @staticmethod
+    def _sale_item_record(dr):
+        # support both shapes (with MedicineName) and without
+        if len(dr) >= 5:
+            mid, mname, qty, price = dr[1], dr[2], int(dr[3] or 0), float(dr[4] or 0)
+        else:
+            mid, mname, qty, price = dr[1], '', int(dr[2] or 0), float(dr[3] or 0)
+        return str(dr[0]), SaleItem(str(mid), mname, qty, price)
+
+    def iter_sales(self, dedicated=True):
+        """Yield sale headers; their 'items' are left empty (see iter_sale_items)."""
+        for r in self._stream_rows("EXEC GetAllSales", dedicated=dedicated):
+            yield self._sale_record(r)
+
+    def iter_sale_items(self, dedicated=True):
+        """Yield (sale_id, item) pairs for every sale line."""
+        for dr in self._stream_rows("EXEC GetAllSaleDetails", dedicated=dedicated):
+            yield self._sale_item_record(dr)
+
+    def get_sales(self):
+        """Get all sales from database view"""
+        results = {}
+        # Prefer stored procedure if available
+        try:
+            results = dict(self.iter_sales(dedicated=False))
+            # Populate sale items via stored procedure exposing vw_Sales_Details
+            try:
+                for sid_key, item in self.iter_sale_items(dedicated=False):
+                    sale = results.get(sid_key)
+                    if sale is not None:
+                        if not sale.lines:
+                            sale.lines = []
+                        sale.lines.append(item)
+            except Exception:
+                pass
+        except Exception:
+            # Stored procedure failed — return empty results (no inline SQL fallback)
+            return results
+        return results
+
+    @staticmethod
+    def _return_record(r):
+        # When using base table fallback the column order differs; handle both shapes
+        if len(r) >= 12:
+            return str(r[0]), Return(
+                r[1] or None,
+                r[2] or None,
+                r[3] or '',
+                int(r[4] or 0),
+                float(r[5] or 0),
+                float(r[6] or 0),
+                str(r[7]) if r[7] is not None else None,
+                r[8] or '',
+                r[9] or '',
+                r[10] if len(r) > 10 else None,
+                r[11] if len(r) > 11 else None
+            )
+        return str(r[0]), Return(
+            r[5] or None,
+            r[1] or None,
+            '',
+            int(r[2] or 0),
+            float(r[3] or 0),
+            float(r[4] or 0),
+            str(r[6]) if (len(r) > 6 and r[6] is not None) else None,
+            '',
+            r[7] or '' if len(r) > 7 else '',
+            r[8] if len(r) > 8 else None,
+            r[9] if len(r) > 9 else None
+        )
+
+    def iter_returns(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetAllReturns", dedicated=dedicated):
+            yield self._return_record(r)
+
+    def get_returns(self):
+        """Get all returns from the detailed view (includes medicine/customer names)"""
+        try:
+            return dict(self.iter_returns(dedicated=False))
+        except Exception:
+            return {}
+
+    @staticmethod
+    def _stock_adjustment_record(r):
+        if len(r) >= 12:
+            return str(r[0]), StockAdjustment(
+                str(r[1]) if r[1] is not None else None,
+                r[2] or '',
+                int(r[3] or 0),
+                int(r[4] or 0),
+                int(r[5] or 0),
+                str(r[6]) if r[6] is not None else None,
+                r[7] or '',
+                r[8] or '',
+                r[9] or '',
+                r[10] if len(r) > 10 else None,
+                r[11] if len(r) > 11 else None
+            )
+        return str(r[0]), StockAdjustment(
+            str(r[1]) if r[1] is not None else None,
+            '',
+            int(r[2] or 0),
+            int(r[3] or 0),
+            int(r[4] or 0),
+            str(r[5]) if r[5] is not None else None,
+            '',
+            r[6] or '',
+            r[7] or '',
+            None,
+            r[8] if len(r) > 8 else None
+        )
+
+    def iter_stock_adjustments(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetStockAdjustments", dedicated=dedicated):
+            yield self._stock_adjustment_record(r)
+
+    def get_stock_adjustments(self):
+        """Get all stock adjustments from database view"""
+        try:
+            return dict(self.iter_stock_adjustments(dedicated=False))
+        except Exception:
+            return {}
+
+    @staticmethod
+    def _activity_record(r):
+        return int(r[0]) if r[0] else str(r[0]), ActivityEntry(
+            r[1] or '',
+            r[2] or '',
+            r[3] if len(r) > 3 else None
+        )
+
+    def iter_activity_log(self, dedicated=True):
+        for r in self._stream_rows("EXEC GetActivityLog", dedicated=dedicated):
+            yield self._activity_record(r)
+
+    def get_activity_log(self):
+        """Get activity log from database view"""
+        try:
+            return dict(self.iter_activity_log(dedicated=False))
+        except Exception:
+            return {}
+
+    # ---------------- Paged list reads ----------------
+    # The list views ask for one page at a time. Sort keys are the view column names;
+    # each Get*Page procedure maps them through its own whitelist too, so an unknown
+    # key can never reach the ORDER BY. A page is (rows, has_more), rows being the
+    # same (key, record) pairs the iter_* readers yield.
+
+    _PAGE_SORTS = {
+        'GetMedicinesPage': ('MedicineID', 'Name', 'Category', 'SupplierName', 'Quantity',
+                             'MinimumStock', 'Price', 'CreatedDate'),
+        'GetCustomersPage': ('CustomerID', 'Name', 'Phone', 'Email', 'TotalPurchases', 'CreatedDate'),
+        'GetSuppliersPage': ('SupplierID', 'Name', 'Company', 'Phone', 'Email', 'Active', 'CreatedDate'),
+        'GetUsersPage': ('Username', 'FullName', 'Phone', 'Email', 'Role', 'Active'),
+        'GetReturnsPage': ('ReturnID', 'MedicineName', 'Quantity', 'Amount', 'SaleID',
+                           'CustomerName', 'Timestamp', 'Reason'),
+    }
+
+    def _fetch_page(self, proc, to_record, offset, limit, sort, descending, search):
+        allowed = self._PAGE_SORTS[proc]
+        if sort not in allowed:
+            raise ValueError(f"Cannot sort {proc} by {sort!r}")
+        offset = max(0, int(offset or 0))
+        limit = max(1, int(limit or PAGE_SIZE))
+        search = (search or '').strip() or None
+        self.cursor.execute(f"EXEC {proc} ?, ?, ?, ?, ?", offset, limit + 1, sort, 1 if descending else 0, search)
+        rows = self.cursor.fetchall()
+        return [to_record(r) for r in rows[:limit]], len(rows) > limit
+
+    def get_medicines_page(self, offset=0, limit=PAGE_SIZE, sort='Name', descending=False, search=None):
+        """One page of medicines, sorted and filtered on the server."""
+        try:
+            return self._fetch_page('GetMedicinesPage', self._medicine_record,
+                                    offset, limit, sort, descending, search)
+        except ValueError:
+            raise
+        except Exception as e:
+            self._note_db_failure(e)
+            if self.offline:
+                return self._cached_medicines_page(offset, limit, sort, descending, search)
+            return [], False
+
+    _CACHED_MEDICINE_FIELDS = {'Name': 'name', 'Category': 'category', 'SupplierName': 'supplier_name',
+                               'Quantity': 'quantity', 'MinimumStock': 'minimum_stock', 'Price': 'price',
+                               'CreatedDate': 'created_date'}
+
+    def _cached_medicines_page(self, offset, limit, sort, descending, search):
+        # Offline: page the last-known catalog in memory so the view still works
+        q = (search or '').strip().lower()
+        rows = [(mid, med) for mid, med in (self.catalog_cache.get('medicines') or {}).items()
+                if not q or q in mid.lower() or q in (med.get('name') or '').lower()
+                or q in (med.get('category') or '').lower()]
+        field = self._CACHED_MEDICINE_FIELDS.get(sort)
+
+        def key(kv):
+            mid, med = kv
+            if field is None:
+                return int(mid) if mid.isdigit() else 0
+            value = med.get(field)
+            if field in ('quantity', 'minimum_stock', 'price'):
+                return value or 0
+            return str(value or '').lower()
+
+        rows.sort(key=key, reverse=descending)
+        offset = max(0, int(offset or 0))
+        limit = max(1, int(limit or PAGE_SIZE))
+        return rows[offset:offset + limit], len(rows) > offset + limit
+
+    def get_customers_page(self, offset=0, limit=PAGE_SIZE, sort='Name', descending=False, search=None):
+        """One page of customers, sorted and filtered on the server."""
+        try:
+            return self._fetch_page('GetCustomersPage', self._customer_record,
+                                    offset, limit, sort, descending, search)
+        except ValueError:
+            raise
+        except Exception as e:
+            self._note_db_failure(e)
+            return [], False
+
+    def get_suppliers_page(self, offset=0, limit=PAGE_SIZE, sort='Name', descending=False, search=None):
+        """One page of suppliers, sorted and filtered on the server."""
+        try:
+            return self._fetch_page('GetSuppliersPage', self._supplier_record,
+                                    offset, limit, sort, descending, search)
+        except ValueError:
+            raise
+        except Exception as e:
+            self._note_db_failure(e)
+            return [], False
+
+    def get_users_page(self, offset=0, limit=PAGE_SIZE, sort='Username', descending=False, search=None):
+        """One page of users, sorted and filtered on the server."""
+        try:
+            return self._fetch_page('GetUsersPage', self._user_record,
+                                    offset, limit, sort, descending, search)
+        except ValueError:
+            raise
+        except Exception as e:
+            self._note_db_failure(e)
+            return [], False
+
+    def get_returns_page(self, offset=0, limit=PAGE_SIZE, sort='Timestamp', descending=True, search=None):
+        """One page of returns (newest first by default), sorted and filtered on the server."""
+        try:
+            return self._fetch_page('GetReturnsPage', self._return_record,
+                                    offset, limit, sort, descending, search)
+        except ValueError:
+            raise
+        except Exception as e:
+            self._note_db_failure(e)
+            return [], False
+    
+    def add_medicine(self, name, category, quantity, price, medicine_id=None, minimum_stock=10, supplier_id=None, user=None):
+        # Add a new medicine to inventory (database only)
+        qty = int(quantity) if quantity else 0
+        min_stock = int(minimum_stock or 10)
+
+        # Determine status based on quantities and minimum stock
+        status = 'ok'
+        if qty <= 0:
+            status = 'out of stock'
+        elif qty < min_stock:
+            status = 'low stock'
+        # Add to database and return the generated MedicineID as a string.
+        try:
+            # Pass supplier_id (INT) to stored procedure; allow NULL
+            try:
+                supp_param = int(supplier_id) if supplier_id is not None else None
+            except Exception:
+                supp_param = None
+            # Status is now computed server-side in AddMedicine; do not pass local status
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC AddMedicine ?,?,?,?,?,?,?", name, category, qty, price, min_stock, supp_param, user)),
+                                       label='add_medicine')
+
+            new_med_id = None
+            if row and len(row) > 0:
+                try:
+                    new_med_id = int(row[0])
+                except Exception:
+                    new_med_id = None
+
+            return str(new_med_id) if new_med_id is not None else None
+        except Exception:
+            return None
+    
+    def update_medicine(self, medicine_id, name=None, category=None, quantity=None, price=None, minimum_stock=None, supplier_id=None, record_adjustment=False, user=None, reason=None, expected_version=None):
+        """Update medicine details (database only). Fields left as None keep
+        their current value, so editing e.g. the price never rewrites stock.
+        Pass `expected_version` (the medicine's 'row_version') to make the
+        update a compare-and-swap: it fails if another terminal changed the
+        medicine since it was read (see medicine_changed_since).
+        Returns (True, new row_version), so the caller can keep editing
+        without re-reading the medicine, or (False, None).
+        """
+        supp_param = None
+        if supplier_id is not None:
+            try:
+                supp_param = int(supplier_id)
+            except Exception:
+                supp_param = None
+        try:
+            # Status is computed inside the database `UpdateMedicine` stored procedure
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute(
+                "EXEC UpdateMedicine ?,?,?,?,?,?,?,?,?", int(medicine_id), name, category,
+                int(quantity) if quantity is not None else None, price,
+                int(minimum_stock) if minimum_stock is not None else None,
+                supp_param, user, expected_version)), label='update_medicine')
+            return True, (int(row[0]) if row and row[0] is not None else None)
+        except Exception:
+            return False, None
+
+    def apply_stock_delta(self, medicine_id, delta, supplier_id=None, reason='', user=None):
+        """Atomically add `delta` (positive = stock in, negative = stock out) to a
+        medicine's quantity and record the stock adjustment, in one round-trip.
+        Returns ({'adjustment_id', 'name', 'old_qty', 'new_qty'}, None) or (None, error).
+        """
+        try:
+            delta = int(delta)
+        except (TypeError, ValueError):
+            return None, 'Invalid quantity'
+        try:
+            supp_param = int(supplier_id) if supplier_id is not None else None
+        except (TypeError, ValueError):
+            supp_param = None
+        try:
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute(
+                "EXEC ApplyStockMovement ?,?,?,?,?", int(medicine_id), delta, supp_param, reason or '', user)),
+                label='apply_stock_delta')
+        except Exception as e:
+            self._note_db_failure(e)
+            return None, db_error_message(e)
+        if row is None:
+            return None, 'Stock movement did not return a result'
+        return {
+            'adjustment_id': row[0],
+            'name': row[1] or '',
+            'old_qty': int(row[2] or 0),
+            'new_qty': int(row[3] or 0)
+        }, None
+
+    def get_medicine(self, medicine_id):
+        """One medicine by id (a single-row GetMedicineByID lookup), or None."""
+        try:
+            self.cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
+            r = self.cursor.fetchone()
+        except Exception as e:
+            self._note_db_failure(e)
+            return None
+        if not r:
+            return None
+        # GetMedicineByID: Name, Category, Quantity, MinimumStock, Price, Status, SupplierID, SupplierName, RowVer
+        return Medicine(r[0] or '', r[1] or '', int(r[2] or 0), float(r[4] or 0), int(r[3] or 0), r[5] or '',
+                        None, str(r[6]) if r[6] is not None else None, r[7] or '',
+                        int(r[8]) if r[8] is not None else None)
+
+    def medicine_changed_since(self, medicine_id, version):
+        # True when the medicine's current row version differs from `version`
+        # (used to explain a failed compare-and-swap update)
+        if version is None:
+            return False
+        try:
+            self.cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
+            row = self.cursor.fetchone()
+        except Exception:
+            return False
+        return row is not None and len(row) > 8 and row[8] is not None and int(row[8]) != int(version)
+    
+    def delete_medicine(self, medicine_id, user = None):
+        # Delete medicine from inventory (database only)
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC DeleteMedicineCascade ?,?", int(medicine_id), user),
+                                 label='delete_medicine')
+            #self.add_activity(f'Deleted medicine {medicine_id}')
+            return True
+        except Exception:
+            return False
+    
+    def add_customer(self, name, phone, email, user=None):
+        # Add a new customer (database only)
+        # Let the database generate the integer CustomerID (IDENTITY).
+            # Client-side validation: require non-empty phone and email
+            if not phone or str(phone).strip() == '' or not email or str(email).strip() == '':
+                return None
+            try:
+                # Pass the values as provided (not forcing empty strings)
+                row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC AddCustomer ?,?,?,?", name, phone, email, user)),
+                                           label='add_customer')
+            except Exception as e:
+                print("AddCustomer failed:", e)
+                return None
+
+            if not row:
+                return None
+
+            try:
+                new_id = int(row[0])
+            except Exception:
+                return None
+
+            return str(new_id)
+
+    def update_customer(self, customer_id, name=None, phone=None, email=None, user=None):
+        # Update customer details (database only)
+        def work(cur):
+            # Get current customer data via stored procedure
+            # ensure we pass integer CustomerID to the DB
+            int_cid = int(customer_id)
+            cur.execute("EXEC GetCustomerByID ?", int_cid)
+            row = cur.fetchone()
+            if not row:
+                return False
+            
+            db_name = name if name is not None else row[0]
+            db_phone = phone if phone is not None else row[1]
+            db_email = email if email is not None else row[2]
+            
+            cur.execute("EXEC UpdateCustomer ?,?,?,?,?", int_cid, db_name, db_phone, db_email, user)
+            #self.add_activity(f'Updated customer {customer_id}')
+            return True
+
+        try:
+            return self.run_transaction(work, label='update_customer')
+        except Exception:
+            return False
+
+    def delete_customer(self, customer_id, user=None):
+        # Delete a customer (database only)
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC DeleteCustomer ?,?", int(customer_id), user),
+                                 label='delete_customer')
+            #self.add_activity(f'Deleted customer {customer_id}')
+            return True
+        except Exception:
+            return False
+    
+    def _sale_totals(self, items):
+        # Calculate (subtotal, tax, total) for a list of sale items
+        subtotal = sum(item['quantity'] * item['price'] for item in items)
+        # Read settings at call time to avoid KeyError when settings haven't been loaded
+        settings = self.get_settings()
+        tax_rate = float(settings.get('tax_rate', 0.0))
+        tax = (subtotal * tax_rate) / 100
+        return subtotal, tax, subtotal + tax
+
+    def create_sale(self, customer_id, items, user=None, idempotency_key=None):
+        """Create a new sale transaction using identity-based SaleID in the DB.
+        `idempotency_key` identifies this submission: resubmitting the same key
+        returns the originally recorded sale instead of creating a duplicate,
+        which is what makes the automatic retry after a timeout safe.
+        Returns (sale_id, total) or (None, error message).
+        """
+        sale_id, result, _ = self._create_sale(customer_id, items, user, idempotency_key)
+        return sale_id, result
+
+    def _create_sale(self, customer_id, items, user, idempotency_key):
+        # create_sale, also returning the database exception behind a failure (None when the
+        # server rejected the sale itself), so SaleReplayer can tell a conflict from a failure
+        key = idempotency_key or uuid.uuid4().hex
+        started = time.perf_counter()
+        # Calculate totals
+        subtotal, tax, total = self._sale_totals(items)
+
+        # Pre-check stock availability to avoid the DB stored procedure throwing
+        precheck_error = None
+        try:
+            for item in items:
+                med_id = item['medicine_id']
+                qty = int(item['quantity'])
+                try:
+                    self.cursor.execute("EXEC GetMedicineByID ?", int(med_id))
+                    row = self.cursor.fetchone()
+                except Exception as e:
+                    self._note_db_failure(e)
+                    if self.offline or is_connection_error(e):
+                        return None, 'Database unavailable', e
+                    row = None
+                if not row:
+                    precheck_error = f'Invalid medicine id: {med_id}'
+                    break
+                # GetMedicineByID returns (Name, Category, Quantity, MinimumStock, Price, Status)
+                available = int(row[2] or 0)
+                if available < qty:
+                    precheck_error = f'Insufficient stock for {med_id} (available {available})'
+                    break
+        except Exception:
+            pass
+        if precheck_error:
+            # The stock may be gone because this very sale was already recorded
+            # (e.g. the first attempt timed out after committing)
+            existing = self.find_sale_by_key(key) if idempotency_key else None
+            if existing:
+                return existing + (None,)
+            return None, precheck_error, None
+
+        # Ensure CustomerID is passed as INT or NULL (UI uses string keys)
+        cust_param = None
+        try:
+            if customer_id is not None:
+                cust_param = int(customer_id)
+        except Exception:
+            cust_param = None
+
+        for attempt in range(SALE_SUBMIT_RETRIES + 1):
+            sale_id, result, created, exc = self._persist_sale(cust_param, items, user, key, subtotal, tax, total)
+            if sale_id is not None:
+                if created:
+                    # Log activity for the created sale (best-effort; don't break sale flow if logging fails)
+                    self.add_activity(f'Sale {sale_id} created: {result}', user)
+                    self.tracer.observe('sale_commit', (time.perf_counter() - started) * 1000.0)
+                return sale_id, result, None
+            if exc is None or not is_connection_error(exc):
+                return None, result, exc
+            # Timed out or lost the link: the outcome is unknown, so resubmit with the same key
+            if attempt < SALE_SUBMIT_RETRIES and self._reconnect_after(exc):
+                continue
+            self._note_db_failure(exc)
+            return None, result, exc
+        return None, 'Database unavailable', None
+
+    def _persist_sale(self, cust_param, items, user, key, subtotal, tax, total):
+        # One attempt at writing the sale in a single transaction (deadlocks are retried by the runner).
+        # Returns (sale_id, total_or_error, created, exception).
+        def work(cur):
+            cur.execute("EXEC CreateSale ?,?,?,?,?,?", cust_param, subtotal, tax, total, user, key)
+            row = cur.fetchone()
+            if not row:
+                raise ValueError('Failed to create sale header')
+            try:
+                sale_id = int(row[0])
+            except Exception:
+                sale_id = row[0]
+            if len(row) > 1 and row[1]:
+                # Already recorded under this key; don't add the items again
+                return sale_id, float(row[2] if row[2] is not None else total), False
+
+            # For each sale item: add sale item and update medicine qty (all within one transaction)
+            for item in items:
+                # AddSaleItem itself decreases the medicine quantity in the DB
+                # Pass the current user so stock adjustments record who performed the sale
+                cur.execute("EXEC AddSaleItem ?,?,?,?,?", sale_id, int(item['medicine_id']), item['quantity'],
+                            item.get('price', 0), user or None)
+            return sale_id, total, True
+
+        try:
+            sale_id, result, created = self.run_transaction(work, label='create_sale')
+        except Exception as e:
+            return None, (str(e) or 'Database error during sale persistence'), False, e
+        # Sale created successfully in database
+        return sale_id, result, created, None
+
+    def _reconnect_after(self, exc):
+        # After a statement timeout the connection is usually still usable; after
+        # a link failure open a new one. Returns False if the server is unreachable.
+        if str(getattr(exc, 'args', [''])[0]) in ('HYT00', 'HYT01'):
+            return True
+        try:
+            self.install_connection(self.connection_factory())
+            return True
+        except (DatabaseError, AttributeError):
+            return False
+
+    def find_sale_by_key(self, key):
+        """Return (sale_id, total) of the sale recorded under `key`, or None."""
+        try:
+            self.cursor.execute("EXEC GetSaleByIdempotencyKey ?", key)
+            row = self.cursor.fetchone()
+        except Exception as e:
+            self._note_db_failure(e)
+            return None
+        if not row:
+            return None
+        return int(row[0]), float(row[1] or 0)
+
+    def submit_sale(self, customer_id, items, user=None, idempotency_key=None):
+        """Create a sale, falling back to the local offline queue when the
+        database is unreachable. Returns (sale_id, total_or_error, queued).
+        Queued sales get a local "OFFLINE-..." reference instead of a SaleID.
+        The same key is used for the queued copy, so a sale whose first attempt
+        did reach the server is not recorded twice when the queue is replayed.
+        """
+        key = idempotency_key or uuid.uuid4().hex
+        if not self.offline:
+            sale_id, result = self.create_sale(customer_id, items, user=user, idempotency_key=key)
+            if sale_id is not None or not self.offline:
+                return sale_id, result, False
+
+        # Database unreachable: sell from the cached catalog and queue the sale
+        medicines = self.catalog_cache.get('medicines') or {}
+        for item in items:
+            med = medicines.get(str(item['medicine_id']))
+            if med is None:
+                return None, f"Invalid medicine id: {item['medicine_id']}", False
+            available = int(med.get('quantity', 0) or 0)
+            if available < int(item['quantity']):
+                return None, f"Insufficient stock for {item['medicine_id']} (available {available})", False
+
+        subtotal, tax, total = self._sale_totals(items)
+        try:
+            self.sale_queue.enqueue(customer_id, items, user, total, key=key)
+        except OSError as e:
+            return None, f'Could not save the sale locally: {e}', False
+        for item in items:
+            self.catalog_cache.adjust_stock(item['medicine_id'], -int(item['quantity']))
+        return f'OFFLINE-{key[:8].upper()}', total, True
+
+    def add_return(self, medicine_id, quantity, sale_id=None, customer_id=None, reason='', user=None):
+        # Register a returned item in database
+        try:
+            qty = int(quantity)
+            if qty <= 0:
+                return None, 'Quantity must be positive'
+        except Exception:
+            return None, 'Invalid quantity'
+
+        # Get medicine price and current quantity from database
+        try:
+            self.cursor.execute("EXEC GetMedicineByID ?", int(medicine_id))
+            mrow = self.cursor.fetchone()
+            if mrow is None:
+                return None, 'Invalid medicine id'
+            # (Name, Category, Quantity, MinimumStock, Price, Status)
+            unit_price = float(mrow[4] or 0) if len(mrow) > 4 else 0.0
+        except Exception:
+            return None, 'Database error retrieving medicine'
+
+        refund_amount = unit_price * qty
+
+        # Create return in database (stored procedure adds the quantity back as a delta and returns the new ReturnID)
+        try:
+            # Ensure SaleID and CustomerID are passed as INT or NULL (UI may supply string ids)
+            sale_param = None
+            cust_param = None
+            try:
+                if sale_id is not None:
+                    sale_param = int(sale_id)
+            except Exception:
+                sale_param = None
+            try:
+                if customer_id is not None:
+                    cust_param = int(customer_id)
+            except Exception:
+                cust_param = None
+
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC AddReturn ?,?,?,?,?,?,?,?", int(medicine_id), qty, unit_price, refund_amount, sale_param, cust_param, reason or '', user)),
+                                       label='add_return')
+
+            if row is not None:
+                return_id = row[0]
+            else:
+                # Do not generate a local ReturnID here; require DB to return it.
+                return_id = None
+        except Exception as e:
+            return None, str(e)
+
+        # Stock adjustment is now recorded by the AddReturn stored procedure.
+
+        #self.add_activity(f'Created return {return_id}', user)
+
+        # Return the DB-provided ID (may be None if DB didn't return one)
+        return return_id, None
+
+    def add_activity(self, action, user=None):
+        """Record an activity entry in database.
+        Returns the LogID (int) when known, otherwise None.
+        """
+        log_id = None
+        # Persist to database
+        try:
+            row = self.run_transaction(lambda cur: cur.execute("EXEC AddActivityLog ?,?", user or None, action).fetchone(),
+                                       label='add_activity')
+            if row is not None:
+                try:
+                    log_id = int(row[0])
+                except Exception:
+                    log_id = row[0]
+        except Exception:
+            pass
+
+        # Return log_id (None if DB failed to provide one)
+
+        return log_id
+    
+    def get_low_stock_medicines(self, threshold=10):
+        # Prefer using the database stored procedure which returns low-stock items
+        results = {}
+        try:
+            self.cursor.execute("EXEC GetLowStockItems")
+            rows = self.cursor.fetchall()
+        except Exception:
+            rows = None
+
+        # If the stored procedure is not available or fails, fall back to in-Python filter
+        if rows is None:
+            try:
+                medicines = self.get_medicines()
+                return {mid: med for mid, med in medicines.items() if med.get('quantity', 0) < threshold}
+            except Exception:
+                return {}
+
+        for r in rows:
+            try:
+                mid = str(r[0])
+                results[mid] = {
+                    'name': r[1] or '',
+                    'category': r[2] or '',
+                    'quantity': int(r[3] or 0),
+                    'price': float(r[5] or 0) if len(r) > 5 else float(r[4] or 0),
+                    'minimum_stock': int(r[4] or 0) if len(r) > 4 else 0,
+                    'status': 'low stock',
+                    'created_date': None
+                }
+            except Exception:
+                # Skip malformed rows
+                continue
+
+        return results
+    
+    def get_today_sales(self):
+        return self.get_sales_report('today')
+
+    def get_sales_report(self, period='today'):
+        """Sales of the period ('today', 'week' or 'month'), newest first, and their total."""
+        today_sales = []
+        total_amount = 0.0
+        try:
+            self.cursor.execute("EXEC GetSalesReport ?", period)
+            rows = self.cursor.fetchall()
+        except Exception:
+            rows = []
+
+        for r in rows:
+            try:
+                sale = {
+                    'sale_id': str(r[0]),
+                    'customer_id': str(r[1]) if r[1] is not None else None,
+                    'customer_name': r[2] or '',
+                    'subtotal': float(r[3]) if len(r) > 3 and r[3] is not None else 0.0,
+                    'tax': float(r[4]) if len(r) > 4 and r[4] is not None else 0.0,
+                    'total': float(r[5]) if len(r) > 5 and r[5] is not None else 0.0,
+                    'timestamp': r[6] if len(r) > 6 else None,
+                    'items': []
+                }
+                total_amount += sale['total']
+                today_sales.append(sale)
+            except Exception:
+                continue
+
+        return today_sales, total_amount
+
+    def get_stock_report_summary(self):
+        """Medicine count, total stock value and number of low-stock medicines."""
+        try:
+            self.cursor.execute("EXEC GetStockReportSummary")
+            row = self.cursor.fetchone()
+            return {'total_medicines': int(row[0] or 0), 'total_value': float(row[1] or 0.0),
+                    'low_stock': int(row[2] or 0)}
+        except Exception:
+            return {'total_medicines': 0, 'total_value': 0.0, 'low_stock': 0}
+
+    def get_customers_report(self):
+        """Customer count and total spending, plus the top 10 customers as
+        (customer_id, name, total_purchases) tuples."""
+        summary = {'total_customers': 0, 'total_purchases': 0.0}
+        top = []
+        try:
+            self.cursor.execute("EXEC GetCustomersReport")
+            row = self.cursor.fetchone()
+            summary = {'total_customers': int(row[0] or 0), 'total_purchases': float(row[1] or 0.0)}
+            if self.cursor.nextset():
+                top = [(str(r[0]), r[1] or '', float(r[2] or 0)) for r in self.cursor.fetchall()]
+        except Exception:
+            pass
+        return summary, top
+
+    def get_dashboard_stats(self):
+        """Return aggregated values used by the dashboard:
+        - total_medicines
+        - low_stock (medicines where Quantity < MinimumStock)
+        - today_sales_count
+        - today_revenue
+
+        Prefer an efficient SQL query; fall back to in-Python computation if the query fails.
+        """
+        stats = {
+            'total_medicines': 0,
+            'low_stock': 0,
+            'today_sales_count': 0,
+            'today_revenue': 0.0
+        }
+
+        try:
+            # Use stored procedure to fetch dashboard aggregates
+            self.cursor.execute("EXEC GetDashboardStats")
+            row = self.cursor.fetchone()
+            if row:
+                stats['total_medicines'] = int(row[0] or 0)
+                stats['low_stock'] = int(row[1] or 0)
+                stats['today_sales_count'] = int(row[2] or 0)
+                try:
+                    stats['today_revenue'] = float(row[3] or 0.0)
+                except Exception:
+                    stats['today_revenue'] = 0.0
+            return stats
+        except Exception:
+            # Fall back to existing Python helpers (less efficient)
+            try:
+                meds = self.get_medicines()
+                stats['total_medicines'] = len(meds)
+                stats['low_stock'] = len([m for m in meds.values() if int(m.get('quantity', 0)) < int(m.get('minimum_stock', 0) or 0)])
+            except Exception:
+                stats['total_medicines'] = 0
+                stats['low_stock'] = 0
+
+            try:
+                today_sales, total_amount = self.get_today_sales()
+                stats['today_sales_count'] = len(today_sales)
+                stats['today_revenue'] = total_amount
+            except Exception:
+                stats['today_sales_count'] = 0
+                stats['today_revenue'] = 0.0
+
+            return stats
+    
+    def search_medicines(self, query):
+        # Prefer database-backed search procedure when available for efficiency
+        results = {}
+        try:
+            try:
+                self.cursor.execute("EXEC SearchMedicines ?", query or '')
+                rows = self.cursor.fetchall()
+            except Exception:
+                rows = None
+
+            if rows is None:
+                # Fallback to in-Python filter when stored procedure unavailable
+                q = (query or '').lower()
+                medicines = self.get_medicines()
+                for mid, med in medicines.items():
+                    try:
+                        if (q in med.get('name','').lower() or
+                            q in med.get('category','').lower() or
+                            q in mid.lower()):
+                            results[mid] = med
+                    except Exception:
+                        continue
+                return results
+
+            for r in rows:
+                mid_key = str(r[0])
+                results[mid_key] = {
+                    'name': r[1] or '',
+                    'category': r[2] or '',
+                    'quantity': int(r[3] or 0),
+                    'price': float(r[4] or 0),
+                    'minimum_stock': int(r[5] or 0),
+                    'status': r[6] or '',
+                    'created_date': r[7] if len(r) > 7 else None
+                }
+            return results
+        except Exception:
+            # Final fallback to existing Python search
+            q = (query or '').lower()
+            medicines = self.get_medicines()
+            for mid, med in medicines.items():
+                try:
+                    if (q in med.get('name','').lower() or q in med.get('category','').lower() or q in mid.lower()):
+                        results[mid] = med
+                except Exception:
+                    continue
+            return results
+    
+    def search_customers(self, query):
+        # Use DB stored procedure when possible
+        results = {}
+        try:
+            try:
+                self.cursor.execute("EXEC SearchCustomers ?", query or '')
+                rows = self.cursor.fetchall()
+            except Exception:
+                rows = None
+
+            if rows is None:
+                q = (query or '').lower()
+                customers = self.get_customers()
+                for cid, cust in customers.items():
+                    try:
+                        if (q in cust.get('name','').lower() or
+                            q in cust.get('phone','').lower() or
+                            q in cust.get('email','').lower() or
+                            q in cid.lower()):
+                            results[cid] = cust
+                    except Exception:
+                        continue
+                return results
+
+            for r in rows:
+                cid = str(r[0])
+                results[cid] = {
+                    'name': r[1] or '',
+                    'phone': r[2] or '',
+                    'email': r[3] or '',
+                    'created_date': r[4] if len(r) > 4 else None,
+                    'total_purchases': float(r[5] or 0) if len(r) > 5 else 0
+                }
+            return results
+        except Exception:
+            # Fallback
+            q = (query or '').lower()
+            customers = self.get_customers()
+            for cid, cust in customers.items():
+                try:
+                    if (q in cust.get('name','').lower() or q in cust.get('phone','').lower() or q in cust.get('email','').lower() or q in cid.lower()):
+                        results[cid] = cust
+                except Exception:
+                    continue
+            return results
+
+    # --- Suppliers management ---
+    def add_supplier(self, name, company='', phone='', email='', active=True, supplier_id=None, user=None):
+        # Add a new supplier (DB will generate numeric SupplierID via IDENTITY)
+        try:
+            # Stored procedure signature: AddSupplier @Name, @Company, @Phone, @Email, @Active, @UserName
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC AddSupplier ?,?,?,?,?,?", name, company or '', phone or '', email or '', 1 if active else 0, user)),
+                                       label='add_supplier')
+
+            if row is not None:
+                try:
+                    new_id = int(row[0])
+                except Exception:
+                    new_id = row[0]
+            else:
+                new_id = None
+        except Exception:
+            return None
+
+        supplier_key = str(new_id) if new_id is not None else None
+        #self.add_activity(f'Added supplier {supplier_key}', user=None)
+        return supplier_key
+
+    def record_stock_adjustment(self, medicine_id, old_qty, new_qty, supplier_id=None, reason='', user=None):
+        # Record an audit entry for a stock adjustment in database
+        adj_id = None
+        try:
+            try:
+                change = int((new_qty or 0) - (old_qty or 0))
+            except Exception:
+                change = 0
+
+            # Call DB procedure which now returns the generated AdjustmentID
+            # Ensure supplier_id is passed as INT or NULL
+            supp_param = None
+            try:
+                if supplier_id is not None:
+                    supp_param = int(supplier_id)
+            except Exception:
+                supp_param = None
+
+            row = self.run_transaction(lambda cur: cur.execute("EXEC AddStockAdjustment ?,?,?,?,?,?,?", int(medicine_id), old_qty, new_qty, change, supp_param, reason or '', user or None).fetchone(),
+                                       label='record_stock_adjustment')
+
+            if row is not None:
+                adj_id = row[0]
+            # Do not generate local IDs here; force DB to provide the ID.
+        except Exception:
+            # On error, do not synthesize a local AdjustmentID. Leave adj_id as None.
+            pass
+
+        # Log stock adjustment
+        try:
+            delta = int(new_qty - old_qty)
+        except Exception:
+            delta = 0
+        self.add_activity(f'Stock adjustment {adj_id} for {medicine_id} ({delta:+d})', user)
+
+        return str(adj_id)    # --- User management ---
+    def _hash_password(self, username, password):
+        try:
+            return str(password)
+        except Exception:
+            return None
+
+    def add_user(self, username, full_name, password, role='cashier', active=True, email=None, phone=None):
+        # Add a new user with a role (admin/manager/cashier). Password stored hashed.
+        uname = str(username).strip()
+        if not uname:
+            return None
+        pwd_hash = self._hash_password(uname, password)
+
+        # Persist to database
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC AddUser ?,?,?,?,?,?,?", uname, full_name, pwd_hash, role, 1 if active else 0, email or '', phone or ''),
+                                 label='add_user')
+        except Exception:
+            return None
+
+        #self.add_activity(f'Added user {uname}', user=uname)
+
+        return uname
+
+    def authenticate_user(self, username, password):
+        uname = str(username).strip()
+        users = self.get_users()
+        if self.offline:
+            # Only users who have signed in on this terminal before can sign in offline
+            return self.catalog_cache.check_credentials(uname, password)
+        if uname not in users:
+            return False, None
+        expected = users[uname].get('password')
+        got = self._hash_password(uname, password)
+        if expected and got and expected == got:
+            role = users[uname].get('role')
+            self.catalog_cache.remember_credentials(uname, password, role)
+            return True, role
+        return False, None
+
+    def update_user(self, username, full_name=None, password=None, role=None, active=None, email=None, phone=None):
+        users = self.get_users()
+        if username not in users:
+            return False
+        
+        # Prepare values for update
+        pwd_hash = self._hash_password(username, password) if password is not None else None
+        
+        # Update in database
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC UpdateUser ?,?,?,?,?,?,?", username, full_name, pwd_hash, role, 1 if active else 0 if active is not None else None, email, phone),
+                                 label='update_user')
+        except Exception:
+            return False
+
+        #self.add_activity(f'Updated user {username}', user=username)
+
+        return True
+
+    def toggle_user_status(self, username):
+        """
+        Toggle the active status of a user. Returns (True, new_status) on success,
+        or (False, error_message) on failure.
+        """
+        users = self.get_users()
+        if username not in users:
+            return False, 'User not found'
+
+        # Toggle in database
+        try:
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC ToggleUserStatus ?", username)),
+                                       label='toggle_user_status')
+            if row is not None:
+                new_active = bool(row[0])
+                self.add_activity(f'User {username} status toggled to {"Active" if new_active else "Inactive"}', user=username)
+                return True, new_active
+            else:
+                return False, 'Toggle did not return status'
+        except Exception as e:
+            return False, str(e)
+
+    def delete_user(self, username):
+        users = self.get_users()
+        if username in users:
+            try:
+                self.run_transaction(lambda cur: cur.execute("EXEC DeleteUser ?", username), label='delete_user')
+            except Exception:
+                return False
+            #self.add_activity(f'Deleted user {username}', user=username)
+            return True
+        return False
+
+    def update_supplier(self, supplier_id, name=None, company=None, phone=None, email=None, active=None, user=None):
+        # Update supplier details (supports company and active status)
+        suppliers = self.get_suppliers()
+        if supplier_id not in suppliers:
+            return False
+        
+        # Get current values
+        supplier = suppliers[supplier_id]
+        final_name = name if name is not None else supplier.get('name', '')
+        final_company = company if company is not None else supplier.get('company', '')
+        final_phone = phone if phone is not None else supplier.get('phone', '')
+        final_email = email if email is not None else supplier.get('email', '')
+        final_active = active if active is not None else supplier.get('active', True)
+        
+        # Persist to DB via stored procedure
+        try:
+            self.run_transaction(lambda cur: cur.execute("EXEC UpdateSupplier ?,?,?,?,?,?,?", int(supplier_id), final_name, final_company, final_phone, final_email, 1 if final_active else 0, user),
+                                 label='update_supplier')
+        except Exception:
+            return False
+        
+        #self.add_activity(f'Updated supplier {supplier_id}', user=None)
+        return True
+    
+    def delete_supplier(self, supplier_id, user=None):
+        # Delete a supplier
+        suppliers = self.get_suppliers()
+        if supplier_id in suppliers:
+            try:
+                self.run_transaction(lambda cur: cur.execute("EXEC DeleteSupplier ?,?", int(supplier_id), user),
+                                     label='delete_supplier')
+            except Exception:
+                return False
+            #self.add_activity(f'Deleted supplier {supplier_id}', user=None)
+            return True
+        return False
+
+    def toggle_supplier_status(self, supplier_id, user=None):
+        """
+        Toggle the active status of a supplier. Returns (True, new_status) on success,
+        or (False, error_message) on failure.
+        """
+        suppliers = self.get_suppliers()
+        if supplier_id not in suppliers:
+            return False, 'Supplier not found'
+
+        try:
+            row = self.run_transaction(lambda cur: last_result_row(cur.execute("EXEC ToggleSupplierStatus ?,?", int(supplier_id), user)),
+                                       label='toggle_supplier_status')
+            if row is not None:
+                new_active = bool(row[0])
+                #self.add_activity(f'Supplier {supplier_id} status toggled to {"Active" if new_active else "Inactive"}', user=None)
+                return True, new_active
+            else:
+                return False, 'Toggle did not return status'
+        except Exception as e:
+            return False, str(e)
+
+    def search_suppliers(self, query):
+        # Use DB-side search when available
+        results = {}
+        try:
+            try:
+                self.cursor.execute("EXEC SearchSuppliers ?", query or '')
+                rows = self.cursor.fetchall()
+            except Exception:
+                rows = None
+
+            if rows is None:
+                q = (query or '').lower()
+                suppliers = self.get_suppliers()
+                for sid, sup in suppliers.items():
+                    try:
+                        if (q in sup.get('name','').lower() or
+                            q in sup.get('company','').lower() or
+                            q in sup.get('phone','').lower() or
+                            q in sup.get('email','').lower() or
+                            q in sid.lower()):
+                            results[sid] = sup
+                    except Exception:
+                        continue
+                return results
+
+            for r in rows:
+                sid = str(r[0])
+                results[sid] = {
+                    'name': r[1] or '',
+                    'company': r[2] or '',
+                    'phone': r[3] or '',
+                    'email': r[4] or '',
+                    'active': bool(r[5]) if r[5] is not None else True,
+                    'created_date': r[6] if len(r) > 6 else None
+                }
+            return results
+        except Exception:
+            q = (query or '').lower()
+            suppliers = self.get_suppliers()
+            for sid, sup in suppliers.items():
+                try:
+                    if (q in sup.get('name','').lower() or q in sup.get('company','').lower() or q in sup.get('phone','').lower() or q in sup.get('email','').lower() or q in sid.lower()):
+                        results[sid] = sup
+                except Exception:
+                    continue
+            return results
+
+    def search_users(self, query):
+        # Search users via DB procedure when available
+        results = {}
+        try:
+            try:
+                self.cursor.execute("EXEC SearchUsers ?", query or '')
+                rows = self.cursor.fetchall()
+            except Exception:
+                rows = None
+
+            if rows is None:
+                q = (query or '').lower()
+                users = self.get_users()
+                for uname, info in users.items():
+                    try:
+                        if (q in uname.lower() or q in info.get('full_name','').lower() or q in info.get('email','').lower() or q in info.get('phone','').lower()):
+                            results[uname] = info
+                    except Exception:
+                        continue
+                return results
+
+            for r in rows:
+                uname = r[0]
+                results[uname] = {
+                    'full_name': r[1] or '',
+                    'password': r[2] or '',
+                    'role': r[3] or '',
+                    'active': bool(r[4]) if r[4] is not None else True,
+                    'email': r[5] or '',
+                    'phone': r[6] or ''
+                }
+            return results
+        except Exception:
+            q = (query or '').lower()
+            users = self.get_users()
+            for uname, info in users.items():
+                try:
+                    if (q in uname.lower() or q in info.get('full_name','').lower() or q in info.get('email','').lower() or q in info.get('phone','').lower()):
+                        results[uname] = info
+                except Exception:
+                    continue
+            return results
+
+class SaleReplayer:
+    """Sends queued offline sales to the server once it is reachable again.
+    A background thread probes for connectivity by opening a fresh connection,
+    which the Tk thread adopts (take_connection) to leave offline mode. The
+    queue itself is replayed on a worker thread (replay_in_background), on
+    that thread's own connection, so the UI never waits on a replayed sale;
+    rejected sales appear in sale_queue.conflicts for the UI to report. Each
+    sale is replayed with its queued idempotency key, so replaying twice is
+    harmless.
+    """
+
+    PROBE_INTERVAL = 15  # seconds between reconnect attempts while offline
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._ready_conn = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._replay_thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._probe_loop, name='sale-replayer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.PROBE_INTERVAL):
+            if not self.backend.offline:
+                continue
+            with self._lock:
+                if self._ready_conn is not None:
+                    continue
+            try:
+                new_conn = self.backend.connection_factory()
+            except (DatabaseError, AttributeError):
+                continue
+            with self._lock:
+                self._ready_conn = new_conn
+
+    def take_connection(self):
+        with self._lock:
+            new_conn, self._ready_conn = self._ready_conn, None
+        return new_conn
+
+    @property
+    def replaying(self):
+        return self._replay_thread is not None and self._replay_thread.is_alive()
+
+    def replay_in_background(self):
+        """Replay the queue on a worker thread unless one is already running.
+        Returns True when a replay was started."""
+        if self.replaying or not self.backend.sale_queue.pending:
+            return False
+        self._replay_thread = threading.Thread(target=self._replay_all, name='sale-replay', daemon=True)
+        self._replay_thread.start()
+        return True
+
+    def _replay_all(self):
+        try:
+            self.replay_pending(limit=None)
+        finally:
+            self.backend.release_thread_connection()
+
+    def replay_pending(self, limit=5):
+        """Replay up to `limit` queued sales (all when None) on the calling
+        thread. Stops at the first sale that could not reach a verdict (link
+        lost, deadlock or lock-timeout retries exhausted), which stays queued
+        for the next round. Returns the number of new conflicts."""
+        queue = self.backend.sale_queue
+        conflicts = 0
+        for key, sale in queue.snapshot(limit):
+            if self.backend.offline or self._stop.is_set():
+                break
+            sale_id, result, exc = self.backend._create_sale(sale.get('customer_id'), sale.get('items', []),
+                                                             sale.get('user'), key)
+            if sale_id is not None:
+                queue.mark_done(key, sale_id)
+            elif self.backend.offline or (exc is not None and (is_connection_error(exc)
+                                                                or retryable_error_kind(exc))):
+                # Transient failure: keep the sale queued and try again later
+                break
+            else:
+                # Rejected by the server (e.g. stock sold elsewhere meanwhile)
+                queue.mark_conflict(key, result)
+                conflicts += 1
+        return conflicts
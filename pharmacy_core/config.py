@@ -0,0 +1,107 @@
+"""Configuration of the headless core.
+
+Connection settings start from the defaults below, are overridden by the
+[database] section of an INI file and then by PHARMACY_* environment
+variables (see load_config). The remaining constants tune retries, batching
+and paging.
+"""
+import configparser
+import os
+import sys
+
+# Database connection setup (override with PHARMACY_CONNECTION_STRING or pharmacy.ini)
+DEFAULT_CONNECTION_STRING = 'DRIVER={SQL Server};SERVER=DESKTOP-HE9I4KD\\SQLEXPRESS;DATABASE=PharmacyDB;Trusted_Connection=yes;'
+# Seconds to wait for the login / for a single statement before treating the server as unreachable
+CONNECT_TIMEOUT = 5
+QUERY_TIMEOUT = 15
+# How many times a sale whose outcome is unknown (timeout / lost link) is resubmitted with its key
+SALE_SUBMIT_RETRIES = 2
+# Milliseconds a statement waits for a row lock before failing with error 1222 (retried below)
+LOCK_TIMEOUT_MS = 5000
+# Retry policy for write transactions that lose a deadlock or time out waiting for a lock
+TXN_MAX_ATTEMPTS = 5
+TXN_TIME_BUDGET = 10.0    # seconds one write may spend, retries included
+TXN_BACKOFF_BASE = 0.05   # seconds; doubled per attempt, with full jitter
+TXN_BACKOFF_MAX = 1.0
+# Rows fetched per round-trip by the streaming iter_* readers
+STREAM_BATCH_SIZE = 500
+# Rows shown per page in the list views (the server is asked for one more to detect a next page)
+PAGE_SIZE = 100
+# Statements slower than this (ms, fetches included) go to the slow-query log; 0 turns the log off
+SLOW_QUERY_MS = 250
+# Round-trips one UI action may make before it is flagged, and how often one statement
+# may repeat within an action before it is flagged as a query in a loop (N+1)
+ROUND_TRIP_BUDGET = 20
+REPEATED_STATEMENT_LIMIT = 5
+# Port of the localhost Prometheus metrics endpoint; 0 (the default) leaves it off
+METRICS_PORT = 0
+# Worker threads (and so database connections) of the asyncio facade, and the seconds
+# one awaited backend call may take before it is cancelled (None: no limit)
+ASYNC_WORKERS = 4
+ASYNC_CALL_TIMEOUT = 30.0
+
+def local_data_path(*parts):
+    """Return a path inside the per-user local data directory.
+    The directory can be overridden with the PHARMACY_DATA_DIR environment
+    variable and is created on first use.
+    """
+    base = os.environ.get('PHARMACY_DATA_DIR')
+    if not base:
+        if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+            base = os.path.join(os.environ['LOCALAPPDATA'], 'PharmacyManagement')
+        else:
+            base = os.path.join(os.path.expanduser('~'), '.pharmacy_management')
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, *parts)
+
+class Config:
+    """Connection settings used by connect_database(). `engine` is 'sqlserver'
+    (pyodbc, the default) or 'sqlite' (the embedded engine, storing its data in
+    `sqlite_path`, by default pharmacy.db in the local data folder).
+    `slow_query_ms` is the threshold of the slow-query log and
+    `round_trip_budget` the round-trips allowed per UI action. A non-zero
+    `metrics_port` serves Prometheus metrics on 127.0.0.1:<port>/metrics."""
+
+    def __init__(self, connection_string=DEFAULT_CONNECTION_STRING, connect_timeout=CONNECT_TIMEOUT,
+                 query_timeout=QUERY_TIMEOUT, lock_timeout_ms=LOCK_TIMEOUT_MS, engine='sqlserver',
+                 sqlite_path=None, slow_query_ms=SLOW_QUERY_MS, round_trip_budget=ROUND_TRIP_BUDGET,
+                 metrics_port=METRICS_PORT):
+        self.engine = engine
+        self.sqlite_path = sqlite_path
+        self.connection_string = connection_string
+        self.connect_timeout = connect_timeout
+        self.query_timeout = query_timeout
+        self.lock_timeout_ms = lock_timeout_ms
+        self.slow_query_ms = slow_query_ms
+        self.round_trip_budget = round_trip_budget
+        self.metrics_port = metrics_port
+
+# [database] option -> (environment variable, type)
+_OPTIONS = {
+    'engine': ('PHARMACY_ENGINE', str),
+    'sqlite_path': ('PHARMACY_SQLITE_PATH', str),
+    'connection_string': ('PHARMACY_CONNECTION_STRING', str),
+    'connect_timeout': ('PHARMACY_CONNECT_TIMEOUT', int),
+    'query_timeout': ('PHARMACY_QUERY_TIMEOUT', int),
+    'lock_timeout_ms': ('PHARMACY_LOCK_TIMEOUT_MS', int),
+    'slow_query_ms': ('PHARMACY_SLOW_QUERY_MS', float),
+    'round_trip_budget': ('PHARMACY_ROUND_TRIP_BUDGET', int),
+    'metrics_port': ('PHARMACY_METRICS_PORT', int),
+}
+
+def load_config(path=None, environ=None):
+    """Build a Config from an INI file and the environment.
+    The file is `path`, else $PHARMACY_CONFIG, else pharmacy.ini in the local
+    data folder; a missing file just leaves the defaults in place.
+    """
+    environ = os.environ if environ is None else environ
+    config = Config()
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(path or environ.get('PHARMACY_CONFIG') or local_data_path('pharmacy.ini'), encoding='utf-8')
+    for name, (env_name, kind) in _OPTIONS.items():
+        raw = environ.get(env_name)
+        if raw is None and parser.has_option('database', name):
+            raw = parser.get('database', name)
+        if raw is not None:
+            setattr(config, name, kind(raw))
+    return config
@@ -0,0 +1,111 @@
+"""SQL Server access helpers shared by the backend.
+
+pyodbc is optional at import time: without it this module (and the backend)
+still import, e.g. for use with an injected connection factory, and only
+connect_database() fails.
+"""
+from .config import Config, local_data_path
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+if pyodbc is not None:
+    DatabaseError = pyodbc.Error
+    OperationalError = pyodbc.OperationalError
+else:
+    class DatabaseError(Exception):
+        """Stand-in for pyodbc.Error when the driver is not installed."""
+
+    class OperationalError(DatabaseError):
+        """Stand-in for pyodbc.OperationalError when the driver is not installed."""
+
+# SQLSTATEs that mean the server is unreachable or too slow (as opposed to a failed statement)
+_CONNECTION_SQLSTATES = ('08001', '08003', '08004', '08007', '08S01', 'HYT00', 'HYT01')
+
+def connect_database(config=None):
+    """Open a new connection to SQL Server, or to the embedded SQLite database
+    when config.engine is 'sqlite'. Raises DatabaseError on failure."""
+    config = config or Config()
+    if config.engine == 'sqlite':
+        from .sqlite_engine import connect_sqlite
+        return connect_sqlite(config.sqlite_path or local_data_path('pharmacy.db'), config.lock_timeout_ms)
+    if pyodbc is None:
+        raise OperationalError('IM002', 'pyodbc is not installed')
+    new_conn = pyodbc.connect(config.connection_string, timeout=config.connect_timeout)
+    new_conn.timeout = config.query_timeout
+    # Fail lock waits well before the query timeout so they surface as a retryable error
+    new_conn.execute(f"SET LOCK_TIMEOUT {int(config.lock_timeout_ms)}")
+    return new_conn
+
+def is_connection_error(exc):
+    # True when the exception means the database could not be reached
+    if isinstance(exc, OperationalError):
+        return True
+    try:
+        return isinstance(exc, DatabaseError) and str(exc.args[0]) in _CONNECTION_SQLSTATES
+    except (IndexError, AttributeError):
+        return False
+
+def last_result_row(cur):
+    # Procedures that call other procedures (e.g. AddActivityLog) emit those result
+    # sets first; the calling procedure's own result is the last one.
+    row = cur.fetchone()
+    while cur.nextset():
+        row = cur.fetchone()
+    return row
+
+def db_error_message(exc):
+    # Strip the ODBC driver prefixes/suffixes from a SQL Server error so the
+    # message raised by a stored procedure can be shown to the user as-is
+    try:
+        text = str(exc.args[1]) if len(exc.args) > 1 else str(exc)
+    except (AttributeError, IndexError):
+        text = str(exc)
+    text = text.rsplit(']', 1)[-1].strip()
+    for suffix in (' (SQLExecDirectW)', ' (SQLExecute)'):
+        text = text.replace(suffix, '')
+    # Drop the trailing "(<error number>)" SQL Server appends
+    if text.endswith(')') and '(' in text:
+        head, _, tail = text.rpartition(' (')
+        if tail[:-1].isdigit():
+            text = head
+    return text.strip() or str(exc)
+
+def retryable_error_kind(exc):
+    """Return 'deadlock' or 'lock_timeout' when rerunning the whole transaction
+    is safe (it was rolled back by the server), otherwise None."""
+    if not isinstance(exc, DatabaseError):
+        return None
+    args = getattr(exc, 'args', ())
+    message = ' '.join(str(a) for a in args)
+    if (args and str(args[0]) == '40001') or '(1205)' in message:
+        return 'deadlock'
+    if '(1222)' in message:
+        return 'lock_timeout'
+    return None
+
+class OfflineConnection:
+    """Stand-in for the connection while SQL Server is unreachable.
+    Every statement fails with a connection error and commit/rollback are
+    no-ops, so existing error handling degrades gracefully.
+    """
+    autocommit = True
+
+    def cursor(self):
+        return self
+
+    def execute(self, *args, **kwargs):
+        raise OperationalError('08S01', 'Database is offline')
+
+    fetchone = fetchall = fetchmany = nextset = execute
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,456 @@
+"""State kept in the per-terminal local data folder: parked carts, the cart
+journal, the offline catalog cache and the queue of sales taken offline.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from .records import Record
+
+def _write_json_atomic(path, data, default=None):
+    # Write to a temp file, fsync and swap it in so a crash never leaves a half-written file.
+    # The temp file is unique, so concurrent writers never share (and truncate) one
+    text = data if isinstance(data, str) else json.dumps(data, default=default)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path) or '.',
+                                     prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False) as f:
+        try:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+class ParkedCartStore:
+    """Suspended (parked) carts for this terminal.
+    Carts are held in memory and mirrored to a local JSON file so they
+    survive an application restart. Default labels ("Cart N") come from a
+    counter saved with the carts, so a label is never handed out twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.carts = {}
+        self.next_number = 1
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = []
+        if isinstance(data, dict):
+            entries = data.get('carts') or []
+            try:
+                self.next_number = max(1, int(data.get('next_number', 1)))
+            except (TypeError, ValueError):
+                pass
+        else:
+            # Files written before the counter: a bare list of carts
+            entries = data if isinstance(data, list) else []
+        for entry in entries:
+            try:
+                self.carts[entry['id']] = entry
+            except (KeyError, TypeError):
+                continue
+        # Never reuse a number still shown on a parked cart
+        for entry in self.carts.values():
+            label = str(entry.get('label', ''))
+            if label.startswith('Cart ') and label[5:].isdigit():
+                self.next_number = max(self.next_number, int(label[5:]) + 1)
+
+    def _save(self):
+        try:
+            _write_json_atomic(self.path, {'next_number': self.next_number, 'carts': list(self.carts.values())})
+        except OSError:
+            # Parked carts stay usable in memory even if the disk write fails
+            pass
+
+    def park(self, items, customer='Walk-in Customer', label=None, user=None):
+        # Store a copy of the cart items and return the new parked-cart id
+        cart_id = uuid.uuid4().hex[:8]
+        if not label:
+            label = f'Cart {self.next_number}'
+            self.next_number += 1
+        entry = {
+            'id': cart_id,
+            'label': label,
+            'customer': customer or 'Walk-in Customer',
+            'items': [dict(it) for it in items],
+            'user': user,
+            'parked_at': datetime.now().isoformat(timespec='seconds')
+        }
+        self.carts[cart_id] = entry
+        self._save()
+        return cart_id
+
+    def list(self):
+        # Oldest first so the customer who has waited longest is at the top
+        return sorted(self.carts.values(), key=lambda e: e.get('parked_at', ''))
+
+    def resume(self, cart_id):
+        # Remove the parked cart and return it (None if unknown)
+        entry = self.carts.pop(cart_id, None)
+        if entry is not None:
+            self._save()
+        return entry
+
+    def discard(self, cart_id):
+        return self.resume(cart_id) is not None
+
+class CartJournal:
+    """Append-only journal of mutations to the active cart.
+    Every record is flushed to the OS immediately so it survives an
+    application crash; fsync (power-loss safety) is batched through
+    `sync_if_due`, which the UI calls from a Tk timer. The journal is
+    replayed on startup and compacted once a sale commits.
+    """
+
+    SYNC_INTERVAL = 0.25   # seconds between batched fsyncs
+    SYNC_MAX_PENDING = 32  # force an fsync once this many records are unsynced
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _open(self):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        return self._fh
+
+    def append(self, op, **fields):
+        fields['op'] = op
+        try:
+            fh = self._open()
+            fh.write(json.dumps(fields, separators=(',', ':')) + '\n')
+            fh.flush()
+        except (OSError, TypeError, ValueError):
+            # Journaling is best-effort; never block the cashier on a disk error
+            return
+        self._pending += 1
+        if self._pending >= self.SYNC_MAX_PENDING:
+            self.sync()
+
+    def sync(self):
+        if self._fh is None or not self._pending:
+            return
+        try:
+            os.fsync(self._fh.fileno())
+        except OSError:
+            pass
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync_if_due(self):
+        if self._pending and time.monotonic() - self._last_sync >= self.SYNC_INTERVAL:
+            self.sync()
+
+    def replay(self):
+        """Rebuild the cart from the journal. Returns (items, customer)."""
+        items = []
+        customer = None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return items, customer
+
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # A torn final record from a crash mid-write; ignore it
+                continue
+            op = rec.get('op')
+            mid = rec.get('medicine_id')
+            existing = next((it for it in items if it.get('medicine_id') == mid), None)
+            if op == 'add':
+                if existing:
+                    existing['quantity'] += int(rec.get('quantity', 0))
+                else:
+                    existing = {
+                        'medicine_id': mid,
+                        'name': rec.get('name', ''),
+                        'quantity': int(rec.get('quantity', 0)),
+                        'price': float(rec.get('price', 0))
+                    }
+                    items.append(existing)
+            elif op == 'remove' and existing:
+                items.remove(existing)
+            elif op == 'clear':
+                items = []
+            elif op == 'load':
+                items = [dict(it) for it in rec.get('items', [])]
+                customer = rec.get('customer')
+            elif op == 'customer':
+                customer = rec.get('customer')
+
+        items = [it for it in items if int(it.get('quantity', 0)) > 0]
+        for it in items:
+            it['total'] = it['quantity'] * it['price']
+        return items, customer
+
+    def compact(self, items=(), customer=None):
+        # Replace the journal with a single snapshot record (or nothing when the cart is empty)
+        self.close()
+        try:
+            if items:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    rec = {'op': 'load', 'items': [dict(it) for it in items], 'customer': customer}
+                    f.write(json.dumps(rec, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            else:
+                open(self.path, 'w', encoding='utf-8').close()
+        except OSError:
+            pass
+
+    def close(self):
+        if self._fh is not None:
+            self.sync()
+            try:
+                self._fh.close()
+            except OSError:
+                pass
+            self._fh = None
+
+class CatalogCache:
+    """Last-known copy of the catalog (settings, medicines, customers) and of
+    the credentials of users who signed in on this terminal, used to keep
+    selling while SQL Server is unreachable.
+    Storing a section that did not change writes nothing; changed settings
+    and credentials are written at once, large sections at most every
+    SAVE_INTERVAL seconds.
+    Safe to share between threads: the data and counters change under a lock
+    and saves are serialized, each writing a snapshot taken under that lock.
+    """
+
+    SAVE_INTERVAL = 60
+    _IMMEDIATE = ('settings', 'credentials')
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # Lookups served / not served, for the metrics endpoint
+        self.hits = 0
+        self.misses = 0
+        # Digest of each section as it would be saved, to notice a store() that changes nothing
+        self._digests = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                self.data = loaded
+        except (OSError, ValueError):
+            self.data = {}
+        for section, value in self.data.items():
+            self._digests[section] = self._digest(value)
+
+    @staticmethod
+    def _json_default(o):
+        # Backend records are saved as plain dicts; datetimes are not needed offline
+        if isinstance(o, Record):
+            return o.to_dict()
+        return None
+
+    def _digest(self, value):
+        # Fresh Record objects and the plain dicts reloaded from disk give the same digest
+        try:
+            text = json.dumps(value, default=self._json_default, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, section):
+        with self._lock:
+            value = self.data.get(section)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def store(self, section, data):
+        digest = self._digest(data)
+        with self._lock:
+            if digest is not None and self._digests.get(section) == digest:
+                # Unchanged (settings re-read for every sale, the same catalog fetched again)
+                return
+            self.data[section] = data
+            self._digests[section] = digest
+            self._dirty = True
+            due = section in self._IMMEDIATE or time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        # One writer at a time, so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                try:
+                    text = json.dumps(self.data, default=self._json_default)
+                except (TypeError, ValueError):
+                    return
+                self._dirty = False
+            try:
+                _write_json_atomic(self.path, text)
+            except OSError:
+                with self._lock:
+                    self._dirty = True
+                return
+            with self._lock:
+                self._last_save = time.monotonic()
+
+    def adjust_stock(self, medicine_id, delta):
+        # Track stock sold offline so the cached quantities stay realistic
+        with self._lock:
+            med = (self.data.get('medicines') or {}).get(str(medicine_id))
+            if med is None:
+                return
+            med['quantity'] = int(med.get('quantity', 0) or 0) + int(delta)
+            # Now differs from what the server last sent; its next copy must be stored
+            self._digests.pop('medicines', None)
+            self._dirty = True
+        self.save()
+
+    def _derive(self, password, salt):
+        return hashlib.pbkdf2_hmac('sha256', str(password).encode('utf-8'), bytes.fromhex(salt), 100000).hex()
+
+    def remember_credentials(self, username, password, role):
+        with self._lock:
+            creds = dict(self.data.get('credentials') or {})
+        salt = os.urandom(16).hex()
+        creds[str(username)] = {'salt': salt, 'hash': self._derive(password, salt), 'role': role}
+        self.store('credentials', creds)
+
+    def check_credentials(self, username, password):
+        with self._lock:
+            entry = (self.data.get('credentials') or {}).get(str(username))
+        if not entry:
+            return False, None
+        try:
+            if self._derive(password, entry['salt']) == entry['hash']:
+                return True, entry.get('role')
+        except (KeyError, ValueError):
+            pass
+        return False, None
+
+class SaleQueue:
+    """Durable queue of sales taken while the database was offline.
+    Stored as JSON lines: a 'sale' record per queued sale, followed later by
+    a 'done' or 'conflict' record once it has been replayed. Every append is
+    fsynced because each record is a completed sale. The Tk thread queues
+    sales while the replayer marks them, so changes happen under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}    # key -> sale record, in queue order
+        self.conflicts = []  # sales the server rejected on replay
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            key = rec.get('key')
+            op = rec.get('op')
+            if op == 'sale':
+                self.pending[key] = rec
+            elif op == 'done':
+                self.pending.pop(key, None)
+            elif op == 'conflict':
+                sale = self.pending.pop(key, None)
+                if sale is not None:
+                    sale['error'] = rec.get('error', '')
+                    self.conflicts.append(sale)
+
+    def _append(self, rec):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(rec, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def enqueue(self, customer_id, items, user, total, key=None):
+        """Queue a sale and return its idempotency key. Raises OSError if it cannot be saved."""
+        rec = {
+            'op': 'sale',
+            'key': key or uuid.uuid4().hex,
+            'customer_id': customer_id,
+            'items': [dict(it) for it in items],
+            'user': user,
+            'total': total,
+            'queued_at': datetime.now().isoformat(timespec='seconds')
+        }
+        with self._lock:
+            self._append(rec)
+            self.pending[rec['key']] = rec
+        return rec['key']
+
+    def snapshot(self, limit=None):
+        """[(key, sale)] of the first `limit` queued sales (all when None)."""
+        with self._lock:
+            items = list(self.pending.items())
+        return items[:limit] if limit is not None else items
+
+    def mark_done(self, key, sale_id=None):
+        with self._lock:
+            self._append({'op': 'done', 'key': key, 'sale_id': sale_id})
+            self.pending.pop(key, None)
+            self._compact_if_idle()
+
+    def mark_conflict(self, key, error):
+        with self._lock:
+            self._append({'op': 'conflict', 'key': key, 'error': str(error)})
+            sale = self.pending.pop(key, None)
+            if sale is not None:
+                sale['error'] = str(error)
+                self.conflicts.append(sale)
+            self._compact_if_idle()
+
+    def _compact_if_idle(self):
+        # Once everything is replayed keep only the conflicts (for review)
+        if self.pending:
+            return
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for sale in self.conflicts:
+                    f.write(json.dumps(sale, separators=(',', ':')) + '\n')
+                    f.write(json.dumps({'op': 'conflict', 'key': sale['key'], 'error': sale.get('error', '')},
+                                       separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
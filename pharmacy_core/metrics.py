@@ -0,0 +1,204 @@
+"""Prometheus text-format metrics on a localhost HTTP endpoint.
+
+Off unless Config.metrics_port is set. MetricsServer serves GET /metrics
+from a daemon thread; each request asks its collectors (callables returning
+MetricFamily objects) for fresh values. backend_metrics() collects what the
+backend knows (statement timings, sale commit latency, connections, caches,
+transactions, memory); the app adds its own UI collector.
+"""
+import os
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .tracing import HISTOGRAM_BOUNDS_MS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricFamily:
+    """One metric name with its HELP/TYPE lines and labelled samples."""
+
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.samples = []
+
+    def add(self, value, suffix='', **labels):
+        self.samples.append((self.name + suffix, labels, value))
+        return self
+
+    def add_histogram(self, buckets, total_seconds, **labels):
+        """`buckets` are per-bucket counts over HISTOGRAM_BOUNDS_MS plus the open bucket."""
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS_MS, buckets):
+            seen += count
+            self.add(seen, '_bucket', le=f'{bound / 1000.0:g}', **labels)
+        seen += buckets[-1]
+        self.add(seen, '_bucket', le='+Inf', **labels)
+        self.add(round(total_seconds, 6), '_sum', **labels)
+        self.add(seen, '_count', **labels)
+        return self
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(families):
+    """Prometheus text exposition of `families`; families sharing a name (e.g.
+    cache hits from several collectors) are merged under one HELP/TYPE."""
+    merged = {}
+    for family in families:
+        if family.name in merged:
+            merged[family.name].samples.extend(family.samples)
+        else:
+            merged[family.name] = MetricFamily(family.name, family.kind, family.help_text)
+            merged[family.name].samples = list(family.samples)
+    lines = []
+    for family in merged.values():
+        lines.append(f'# HELP {family.name} {family.help_text}')
+        lines.append(f'# TYPE {family.name} {family.kind}')
+        for name, labels, value in family.samples:
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def process_memory_bytes():
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class _Counters(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = _Counters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return None
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def backend_metrics(backend):
+    """MetricFamily list describing `backend` (a PharmacyBackend)."""
+    tracer = backend.tracer
+    # Copies taken under the tracer's lock; statements other threads still have open are
+    # counted once they finish (flushing from the scrape thread would cut them short)
+    exported = tracer.export()
+    duration = MetricFamily('pharmacy_query_duration_seconds', 'histogram',
+                            'Statement time including fetches, by procedure')
+    errors = MetricFamily('pharmacy_query_errors_total', 'counter', 'Statements that raised, by procedure')
+    rows = MetricFamily('pharmacy_query_rows_total', 'counter', 'Rows fetched, by procedure')
+    for name, buckets, total_ms, error_count, row_count in sorted(exported['statements']):
+        duration.add_histogram(buckets, total_ms / 1000.0, statement=name)
+        errors.add(error_count, statement=name)
+        rows.add(row_count, statement=name)
+    operations = MetricFamily('pharmacy_operation_duration_seconds', 'histogram',
+                              'End-to-end time of backend operations (sale_commit: a sale until it is committed)')
+    for name, buckets, total_ms, _, _ in sorted(exported['timings']):
+        operations.add_histogram(buckets, total_ms / 1000.0, operation=name)
+
+    connections = MetricFamily('pharmacy_db_connections', 'gauge', 'Database connections currently open')
+    connections.add(tracer.open_connections())
+    opened = MetricFamily('pharmacy_db_connections_opened_total', 'counter', 'Database connections opened')
+    opened.add(tracer.connections_opened)
+    offline = MetricFamily('pharmacy_offline', 'gauge', '1 while the terminal is working offline')
+    offline.add(1 if backend.offline else 0)
+    queued = MetricFamily('pharmacy_offline_sales_queued', 'gauge', 'Sales waiting in the offline queue')
+    queued.add(len(backend.sale_queue.pending))
+
+    cache_hits = MetricFamily('pharmacy_cache_hits_total', 'counter', 'Lookups answered from a cache')
+    cache_misses = MetricFamily('pharmacy_cache_misses_total', 'counter', 'Lookups the cache could not answer')
+    cache_hits.add(backend.catalog_cache.hits, cache='catalog')
+    cache_misses.add(backend.catalog_cache.misses, cache='catalog')
+
+    txn = MetricFamily('pharmacy_transactions_total', 'counter', 'Write transactions, by write path')
+    retries = MetricFamily('pharmacy_transaction_retries_total', 'counter',
+                           'Transactions rerun after a deadlock or lock timeout, by write path and cause')
+    failures = MetricFamily('pharmacy_transaction_failures_total', 'counter', 'Transactions that failed')
+    for label, stats in sorted(backend.get_transaction_stats().items()):
+        txn.add(stats['calls'], path=label)
+        retries.add(stats['deadlocks'], path=label, cause='deadlock')
+        retries.add(stats['lock_timeouts'], path=label, cause='lock_timeout')
+        failures.add(stats['failures'], path=label)
+
+    families = [duration, errors, rows, operations, connections, opened, offline, queued,
+                cache_hits, cache_misses, txn, retries, failures]
+    memory = process_memory_bytes()
+    if memory is not None:
+        families.append(MetricFamily('pharmacy_process_resident_memory_bytes', 'gauge',
+                                     'Resident memory of the process').add(memory))
+    return families
+
+
+class MetricsServer:
+    """Serves GET /metrics on 127.0.0.1:`port` from a daemon thread.
+    `collectors` are callables returning lists of MetricFamily."""
+
+    def __init__(self, port, collectors=()):
+        self.port = port
+        self.collectors = list(collectors)
+        self.collector_errors = 0
+        self._server = None
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        families = []
+        errors = MetricFamily('pharmacy_metrics_collector_errors_total', 'counter',
+                              'Collectors that failed during this process')
+        for collector in list(self.collectors):
+            try:
+                families.extend(collector())
+            except Exception:
+                # A broken collector must not take the endpoint down, but it must not go unnoticed
+                self.collector_errors += 1
+                print(f'Metrics collector {collector!r} failed:\n{traceback.format_exc()}', file=sys.stderr)
+        families.append(errors.add(self.collector_errors))
+        return render(families)
+
+    def start(self):
+        """Bind and start serving. Raises OSError when the port is taken."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = server.collect().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,172 @@
+"""Compact row records returned by the backend getters."""
+
+class Record:
+    """Base for the compact row records returned by the backend getters.
+    Records use __slots__ (no per-instance dict), which makes them several
+    times smaller and cheaper to build than a dict per row. They keep the
+    dict-style access the UI code uses: rec['name'], rec.get('name'),
+    'name' in rec, keys()/items(), and dict(rec). Records compare equal by
+    type and values, and equal to a dict with the same keys and values.
+    A key that would shadow one of these methods (a sale's 'items') is kept
+    in a differently named slot and mapped in `_aliases`.
+    """
+    __slots__ = ()
+    _aliases = {}    # dict key -> slot name
+
+    def _slot(self, key):
+        slot = self._aliases.get(key, key)
+        return slot if slot in self.__slots__ else None
+
+    def _key(self, slot):
+        for key, name in self._aliases.items():
+            if name == slot:
+                return key
+        return slot
+
+    def __getitem__(self, key):
+        slot = self._slot(key)
+        if slot is None:
+            raise KeyError(key)
+        return getattr(self, slot)
+
+    def __setitem__(self, key, value):
+        slot = self._slot(key)
+        if slot is None:
+            raise KeyError(key)
+        setattr(self, slot, value)
+
+    def __contains__(self, key):
+        return self._slot(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def get(self, key, default=None):
+        slot = self._slot(key)
+        return default if slot is None else getattr(self, slot)
+
+    def keys(self):
+        return tuple(self._key(name) for name in self.__slots__)
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def items(self):
+        return [(self._key(name), getattr(self, name)) for name in self.__slots__]
+
+    def to_dict(self):
+        return {self._key(name): getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.values() == other.values()
+
+    # Mutable, like the dicts they replace
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(f'{self._key(name)}={getattr(self, name)!r}' for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class Medicine(Record):
+    __slots__ = ('name', 'category', 'quantity', 'price', 'minimum_stock', 'status', 'created_date',
+                 'supplier_id', 'supplier_name', 'row_version')
+
+    def __init__(self, name, category, quantity, price, minimum_stock, status, created_date,
+                 supplier_id, supplier_name, row_version):
+        self.name = name
+        self.category = category
+        self.quantity = quantity
+        self.price = price
+        self.minimum_stock = minimum_stock
+        self.status = status
+        self.created_date = created_date
+        self.supplier_id = supplier_id
+        self.supplier_name = supplier_name
+        self.row_version = row_version
+
+class Customer(Record):
+    __slots__ = ('name', 'phone', 'email', 'created_date', 'total_purchases')
+
+    def __init__(self, name, phone, email, created_date, total_purchases):
+        self.name = name
+        self.phone = phone
+        self.email = email
+        self.created_date = created_date
+        self.total_purchases = total_purchases
+
+class Sale(Record):
+    # The line items are sale['items'] / sale.lines: an `items` slot would hide Record.items()
+    __slots__ = ('customer_id', 'customer_name', 'lines', 'subtotal', 'tax', 'total', 'timestamp',
+                 'user', 'user_fullname')
+    _aliases = {'items': 'lines'}
+
+    def __init__(self, customer_id, customer_name, items, subtotal, tax, total, timestamp, user, user_fullname):
+        self.customer_id = customer_id
+        self.customer_name = customer_name
+        self.lines = items
+        self.subtotal = subtotal
+        self.tax = tax
+        self.total = total
+        self.timestamp = timestamp
+        self.user = user
+        self.user_fullname = user_fullname
+
+class SaleItem(Record):
+    __slots__ = ('medicine_id', 'medicine_name', 'quantity', 'price')
+
+    def __init__(self, medicine_id, medicine_name, quantity, price):
+        self.medicine_id = medicine_id
+        self.medicine_name = medicine_name
+        self.quantity = quantity
+        self.price = price
+
+class Return(Record):
+    __slots__ = ('sale_id', 'medicine_id', 'medicine_name', 'quantity', 'unit_price', 'amount',
+                 'customer_id', 'customer_name', 'reason', 'timestamp', 'user')
+
+    def __init__(self, sale_id, medicine_id, medicine_name, quantity, unit_price, amount,
+                 customer_id, customer_name, reason, timestamp, user):
+        self.sale_id = sale_id
+        self.medicine_id = medicine_id
+        self.medicine_name = medicine_name
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.amount = amount
+        self.customer_id = customer_id
+        self.customer_name = customer_name
+        self.reason = reason
+        self.timestamp = timestamp
+        self.user = user
+
+class StockAdjustment(Record):
+    __slots__ = ('medicine_id', 'medicine_name', 'old_quantity', 'new_quantity', 'change', 'supplier_id',
+                 'supplier_name', 'reason', 'user', 'user_fullname', 'timestamp')
+
+    def __init__(self, medicine_id, medicine_name, old_quantity, new_quantity, change, supplier_id,
+                 supplier_name, reason, user, user_fullname, timestamp):
+        self.medicine_id = medicine_id
+        self.medicine_name = medicine_name
+        self.old_quantity = old_quantity
+        self.new_quantity = new_quantity
+        self.change = change
+        self.supplier_id = supplier_id
+        self.supplier_name = supplier_name
+        self.reason = reason
+        self.user = user
+        self.user_fullname = user_fullname
+        self.timestamp = timestamp
+
+class ActivityEntry(Record):
+    __slots__ = ('user', 'action', 'timestamp')
+
+    def __init__(self, user, action, timestamp):
+        self.user = user
+        self.action = action
+        self.timestamp = timestamp
@@ -0,0 +1,1015 @@
+"""Embedded SQLite storage engine.
+
+A drop-in replacement for the SQL Server connection: `connect_sqlite(path)`
+returns a DB-API style connection whose cursors accept the same
+"EXEC <Procedure> ?, ?" statements the backend sends to SQL Server. Each
+procedure of pharmacy.sql is implemented here in Python over an equivalent
+SQLite schema, returning the same result sets in the same order (including
+the LogID row a nested AddActivityLog emits), raising the same messages and
+following the same transaction rules, so PharmacyBackend runs unchanged.
+
+Select it with `engine = sqlite` in pharmacy.ini (or PHARMACY_ENGINE=sqlite);
+the database file defaults to pharmacy.db in the local data folder.
+The database runs in WAL mode so the backend's dedicated streaming
+connections read while the shared connection writes.
+"""
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from .db import DatabaseError, OperationalError
+
+SCHEMA_VERSION = 1
+
+# Applied to every connection. WAL lets readers run alongside the single writer;
+# synchronous=NORMAL is durable across application crashes in WAL mode and only
+# risks the last transactions on power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",      # KiB, i.e. 16 MB of page cache
+    "PRAGMA mmap_size = 67108864",
+)
+
+# Same tables, views and indexes as pharmacy.sql. Text columns compare without
+# case like SQL Server's default collation; GETDATE() defaults are local time.
+# RowVer is bumped by a trigger on every update, standing in for ROWVERSION.
+_NOW = "(strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))"
+SCHEMA = f"""
+CREATE TABLE Users (
+   Username        VARCHAR(50) COLLATE NOCASE PRIMARY KEY,
+   FullName        VARCHAR(100) COLLATE NOCASE,
+   PasswordHash    VARCHAR(255),
+   Role            VARCHAR(20) COLLATE NOCASE,
+   Active          BIT DEFAULT 1,
+   Email           VARCHAR(100) COLLATE NOCASE,
+   Phone           VARCHAR(20) COLLATE NOCASE
+);
+CREATE TABLE Suppliers (
+   SupplierID      INTEGER PRIMARY KEY AUTOINCREMENT,
+   Name            VARCHAR(100) COLLATE NOCASE,
+   Company         VARCHAR(100) COLLATE NOCASE,
+   Phone           VARCHAR(20) COLLATE NOCASE,
+   Email           VARCHAR(100) COLLATE NOCASE,
+   Active          BIT DEFAULT 1,
+   CreatedDate     DATETIME DEFAULT {_NOW}
+);
+CREATE TABLE Customers (
+   CustomerID      INTEGER PRIMARY KEY AUTOINCREMENT,
+   Name            VARCHAR(100) COLLATE NOCASE,
+   Phone           VARCHAR(20) COLLATE NOCASE NOT NULL UNIQUE,
+   Email           VARCHAR(100) COLLATE NOCASE NOT NULL UNIQUE,
+   CreatedDate     DATETIME DEFAULT {_NOW},
+   TotalPurchases  DECIMAL(10,2) DEFAULT 0
+);
+CREATE TABLE Medicines (
+   MedicineID      INTEGER PRIMARY KEY AUTOINCREMENT,
+   Name            VARCHAR(100) COLLATE NOCASE NOT NULL UNIQUE,
+   Category        VARCHAR(50) COLLATE NOCASE,
+   Quantity        INT DEFAULT 0,
+   Price           DECIMAL(10,2),
+   MinimumStock    INT DEFAULT 10,
+   Status          VARCHAR(20),
+   CreatedDate     DATETIME DEFAULT {_NOW},
+   SupplierID      INT NULL REFERENCES Suppliers(SupplierID),
+   RowVer          BIGINT NOT NULL DEFAULT 1
+);
+CREATE TABLE Sales (
+   SaleID          INTEGER PRIMARY KEY AUTOINCREMENT,
+   CustomerID      INT NULL REFERENCES Customers(CustomerID),
+   Subtotal        DECIMAL(10,2),
+   Tax             DECIMAL(10,2),
+   Total           DECIMAL(10,2),
+   Timestamp       DATETIME DEFAULT {_NOW},
+   UserName        VARCHAR(50) COLLATE NOCASE REFERENCES Users(Username),
+   IdempotencyKey  VARCHAR(64) NULL
+);
+CREATE TABLE SaleItems (
+   SaleItemID      INTEGER PRIMARY KEY AUTOINCREMENT,
+   SaleID          INT REFERENCES Sales(SaleID),
+   MedicineID      INT REFERENCES Medicines(MedicineID),
+   Quantity        INT,
+   Price           DECIMAL(10,2)
+);
+CREATE TABLE Returns (
+   ReturnID        INTEGER PRIMARY KEY AUTOINCREMENT,
+   MedicineID      INT REFERENCES Medicines(MedicineID),
+   Quantity        INT,
+   UnitPrice       DECIMAL(10,2),
+   Amount          DECIMAL(10,2),
+   SaleID          INT REFERENCES Sales(SaleID),
+   CustomerID      INT REFERENCES Customers(CustomerID),
+   Reason          VARCHAR(255) COLLATE NOCASE,
+   Timestamp       DATETIME DEFAULT {_NOW},
+   UserName        VARCHAR(50) COLLATE NOCASE REFERENCES Users(Username)
+);
+CREATE TABLE StockAdjustments (
+   AdjustmentID    INTEGER PRIMARY KEY AUTOINCREMENT,
+   MedicineID      INT REFERENCES Medicines(MedicineID),
+   OldQty          INT,
+   NewQty          INT,
+   ChangeQty       INT,
+   SupplierID      INT REFERENCES Suppliers(SupplierID),
+   Reason          VARCHAR(255),
+   UserName        VARCHAR(50) COLLATE NOCASE REFERENCES Users(Username),
+   Timestamp       DATETIME DEFAULT {_NOW}
+);
+CREATE TABLE Settings (
+   pharmacy_name   VARCHAR(100) DEFAULT 'My Pharmacy',
+   address         VARCHAR(255) DEFAULT '123 Main St',
+   phone           VARCHAR(20) DEFAULT '555-0123',
+   tax_rate        DECIMAL(5,2) DEFAULT 8.5,
+   currency        VARCHAR(10) DEFAULT 'USD',
+   start_maximized BIT DEFAULT 1
+);
+CREATE TABLE ActivityLog (
+   LogID           INTEGER PRIMARY KEY AUTOINCREMENT,
+   UserName        VARCHAR(50) COLLATE NOCASE,
+   Action          VARCHAR(200) COLLATE NOCASE,
+   LogTime         DATETIME DEFAULT {_NOW}
+);
+
+CREATE TRIGGER Medicines_RowVer AFTER UPDATE ON Medicines
+WHEN NEW.RowVer = OLD.RowVer
+BEGIN
+   UPDATE Medicines SET RowVer = OLD.RowVer + 1 WHERE MedicineID = OLD.MedicineID;
+END;
+
+CREATE VIEW vw_Medicines AS
+SELECT m.MedicineID, m.Name, m.Category, m.Quantity, m.Price, m.MinimumStock, m.Status, m.CreatedDate,
+       m.SupplierID, IFNULL(s.Name, 'unknown') AS SupplierName, m.RowVer
+FROM Medicines m
+LEFT JOIN Suppliers s ON m.SupplierID = s.SupplierID;
+
+CREATE VIEW vw_Customers AS
+SELECT CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases FROM Customers;
+
+CREATE VIEW vw_Suppliers AS
+SELECT SupplierID, Name, Company, Phone, Email, Active, CreatedDate FROM Suppliers;
+
+CREATE VIEW vw_Users AS
+SELECT Username, FullName, PasswordHash, Role, Active, Email, Phone FROM Users;
+
+CREATE VIEW vw_ActivityLog AS
+SELECT LogID, UserName, Action, LogTime FROM ActivityLog;
+
+CREATE VIEW vw_Sales_Details AS
+SELECT si.SaleItemID, si.SaleID, si.MedicineID, IFNULL(m.Name, '') AS MedicineName,
+       si.Quantity, si.Price, (si.Quantity * si.Price) AS LineTotal
+FROM SaleItems si
+LEFT JOIN Medicines m ON si.MedicineID = m.MedicineID;
+
+CREATE VIEW vw_Sales_WithInfo AS
+SELECT s.SaleID, s.CustomerID, IFNULL(c.Name, 'Walk-in Customer') AS CustomerName,
+       s.Subtotal, s.Tax, s.Total, s.Timestamp, s.UserName, IFNULL(u.FullName, '') AS UserFullName
+FROM Sales s
+LEFT JOIN Customers c ON s.CustomerID = c.CustomerID
+LEFT JOIN Users u ON s.UserName = u.Username;
+
+CREATE VIEW vw_Returns_Detailed AS
+SELECT r.ReturnID, r.SaleID, r.MedicineID, IFNULL(m.Name, '') AS MedicineName, r.Quantity,
+       r.UnitPrice, r.Amount, r.CustomerID, IFNULL(c.Name, 'Walk-in Customer') AS CustomerName,
+       r.Reason, r.Timestamp, r.UserName
+FROM Returns r
+LEFT JOIN Medicines m ON r.MedicineID = m.MedicineID
+LEFT JOIN Customers c ON r.CustomerID = c.CustomerID;
+
+CREATE VIEW vw_StockAdjustments_Detailed AS
+SELECT sa.AdjustmentID, sa.MedicineID, IFNULL(m.Name, '') AS MedicineName, sa.OldQty, sa.NewQty,
+       sa.ChangeQty, sa.SupplierID, IFNULL(sup.Name, 'unknown') AS SupplierName, sa.Reason,
+       sa.UserName, IFNULL(u.FullName, '') AS UserFullName, sa.Timestamp
+FROM StockAdjustments sa
+LEFT JOIN Medicines m ON sa.MedicineID = m.MedicineID
+LEFT JOIN Suppliers sup ON sa.SupplierID = sup.SupplierID
+LEFT JOIN Users u ON sa.UserName = u.Username;
+
+CREATE INDEX IX_Sales_Timestamp ON Sales(Timestamp);
+CREATE INDEX IX_Sales_CustomerID ON Sales(CustomerID);
+CREATE UNIQUE INDEX UX_Sales_IdempotencyKey ON Sales(IdempotencyKey) WHERE IdempotencyKey IS NOT NULL;
+CREATE INDEX IX_SaleItems_SaleID ON SaleItems(SaleID);
+CREATE INDEX IX_SaleItems_MedicineID ON SaleItems(MedicineID);
+CREATE INDEX IX_Returns_MedicineID ON Returns(MedicineID);
+CREATE INDEX IX_Returns_SaleID ON Returns(SaleID);
+CREATE INDEX IX_Returns_CustomerID ON Returns(CustomerID);
+CREATE INDEX IX_StockAdj_MedicineID ON StockAdjustments(MedicineID);
+CREATE INDEX IX_StockAdj_SupplierID ON StockAdjustments(SupplierID);
+CREATE INDEX IX_StockAdj_UserName ON StockAdjustments(UserName);
+CREATE INDEX IX_Medicines_Quantity ON Medicines(Quantity);
+CREATE INDEX IX_Medicines_Category ON Medicines(Category);
+CREATE INDEX IX_Customers_Name ON Customers(Name);
+CREATE INDEX IX_Suppliers_Name ON Suppliers(Name);
+CREATE INDEX IX_Returns_Timestamp ON Returns(Timestamp);
+CREATE INDEX IX_Users_Role ON Users(Role);
+CREATE INDEX IX_ActivityLog_LogTime ON ActivityLog(LogTime);
+
+-- Seed admin user for initial login (username: admin, password: admin123)
+INSERT INTO Users (Username, FullName, PasswordHash, Role, Active, Email, Phone) VALUES
+('admin', 'Administrator', 'admin123', 'admin', 1, 'admin@example.com', '123456789');
+INSERT INTO Settings DEFAULT VALUES;
+"""
+
+
+def _convert_datetime(value):
+    # DATETIME columns come back as datetime objects, as they do from pyodbc
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+sqlite3.register_converter('DATETIME', _convert_datetime)
+
+
+class ProcedureError(Exception):
+    """Raised inside a procedure in place of T-SQL's THROW <number>, <message>."""
+
+    def __init__(self, number, message):
+        super().__init__(number, message)
+        self.number = number
+        self.message = message
+
+
+def _database_error(exc):
+    # Shape errors like the SQL Server ODBC driver does, so db_error_message,
+    # retryable_error_kind and is_connection_error treat them the same way
+    if isinstance(exc, ProcedureError):
+        return DatabaseError('42000', f'[42000] [SQLite]{exc.message} ({exc.number})')
+    text = str(exc)
+    if isinstance(exc, sqlite3.IntegrityError):
+        return DatabaseError('23000', f'[23000] [SQLite]{text} (2627)')
+    if isinstance(exc, sqlite3.OperationalError) and ('locked' in text or 'busy' in text):
+        return DatabaseError('HY000', '[HY000] [SQLite]Lock request time out period exceeded. (1222)')
+    if isinstance(exc, sqlite3.OperationalError) and 'interrupted' in text:
+        return DatabaseError('HY008', '[HY008] [SQLite]Operation canceled')
+    return DatabaseError('HY000', f'[HY000] [SQLite]{text}')
+
+
+def _stock_status(quantity, minimum_stock):
+    # Same rule the procedures use to keep Medicines.Status in step with stock
+    quantity = quantity or 0
+    if quantity <= 0:
+        return 'out of stock'
+    if minimum_stock and minimum_stock > 0 and quantity < minimum_stock:
+        return 'low stock'
+    return 'ok'
+
+
+def _money(value):
+    # DECIMAL(10,2) parameters are rounded to cents on the way in
+    return None if value is None else round(float(value), 2)
+
+
+def _like(text):
+    text = (text or '').strip()
+    return f'%{text}%' if text else None
+
+
+# ---------------- Procedures ----------------
+# name -> (function, writes). Functions take a _Call followed by the procedure's
+# parameters in declaration order; defaults mirror the T-SQL defaults.
+
+PROCEDURES = {}
+
+
+def procedure(name, writes=True):
+    def register(fn):
+        PROCEDURES[name] = (fn, writes)
+        return fn
+    return register
+
+
+class _Call:
+    """State of one EXEC: the SQLite connection and the result sets produced,
+    nested procedure calls included."""
+
+    def __init__(self, db, lazy=False):
+        self.db = db
+        self.lazy = lazy
+        self.results = []
+
+    def run(self, sql, params=()):
+        return self.db.execute(sql, params)
+
+    def scalar(self, sql, params=()):
+        row = self.db.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def select(self, sql, params=()):
+        cur = self.db.execute(sql, params)
+        rows = cur if self.lazy else cur.fetchall()
+        self.results.append((cur.description, rows))
+
+    def emit(self, columns, *row):
+        self.results.append((tuple((c, None, None, None, None, None, None) for c in columns), [tuple(row)]))
+
+    def call(self, name, *args):
+        return PROCEDURES[name][0](self, *args)
+
+
+@procedure('AddActivityLog')
+def _add_activity_log(c, user, action):
+    log_id = c.run("INSERT INTO ActivityLog (UserName, Action) VALUES (?, ?)", (user, action)).lastrowid
+    c.emit(('LogID',), log_id)
+
+
+@procedure('GetActivityLog', writes=False)
+def _get_activity_log(c):
+    c.select("SELECT LogID, UserName, Action, LogTime FROM vw_ActivityLog")
+
+
+@procedure('GetSettings', writes=False)
+def _get_settings(c):
+    c.select("SELECT pharmacy_name, address, phone, tax_rate, currency, start_maximized FROM Settings LIMIT 1")
+
+
+@procedure('UpdateSettings')
+def _update_settings(c, pharmacy_name, address, phone, tax_rate, currency, start_maximized):
+    params = (pharmacy_name, address, phone, _money(tax_rate), currency, start_maximized)
+    if c.scalar("SELECT 1 FROM Settings LIMIT 1"):
+        c.run("""UPDATE Settings SET pharmacy_name = ?, address = ?, phone = ?, tax_rate = ?,
+                 currency = ?, start_maximized = ?""", params)
+    else:
+        c.run("""INSERT INTO Settings (pharmacy_name, address, phone, tax_rate, currency, start_maximized)
+                 VALUES (?, ?, ?, ?, ?, ?)""", params)
+
+
+# --- Medicines and stock ---
+
+@procedure('AddStockAdjustment')
+def _add_stock_adjustment(c, medicine_id, old_qty, new_qty, change_qty, supplier_id, reason, user):
+    adj_id = c.run("""INSERT INTO StockAdjustments (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                   (medicine_id, old_qty, new_qty, change_qty, supplier_id, reason, user)).lastrowid
+    min_stock = c.scalar("SELECT MinimumStock FROM Medicines WHERE MedicineID = ?", (medicine_id,))
+    c.run("UPDATE Medicines SET Quantity = ?, Status = ? WHERE MedicineID = ?",
+          (new_qty, _stock_status(new_qty, min_stock), medicine_id))
+    c.emit(('AdjustmentID',), adj_id)
+
+
+@procedure('ApplyStockDelta')
+def _apply_stock_delta(c, medicine_id, delta, supplier_id=None, reason=None, user=None):
+    # Returns (old_qty, new_qty, adjustment_id) in place of the OUTPUT parameters.
+    # Every write runs under BEGIN IMMEDIATE, so nothing can change the quantity
+    # between this read and the update.
+    row = c.run("SELECT IFNULL(Quantity, 0), MinimumStock FROM Medicines WHERE MedicineID = ?",
+                (medicine_id,)).fetchone()
+    if row is None:
+        raise ProcedureError(51001, 'Medicine not found.')
+    old_qty, min_stock = row
+    new_qty = old_qty + delta
+    if new_qty < 0:
+        raise ProcedureError(51000, f'Insufficient stock for the requested medicine (available {old_qty}).')
+    c.run("UPDATE Medicines SET Quantity = ?, Status = ? WHERE MedicineID = ?",
+          (new_qty, _stock_status(new_qty, min_stock), medicine_id))
+    adj_id = c.run("""INSERT INTO StockAdjustments (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                   (medicine_id, old_qty, new_qty, delta, supplier_id, reason, user)).lastrowid
+    return old_qty, new_qty, adj_id
+
+
+@procedure('ApplyStockMovement')
+def _apply_stock_movement(c, medicine_id, delta, supplier_id=None, reason=None, user=None):
+    if not delta:
+        raise ProcedureError(51006, 'Stock movement quantity must not be zero.')
+    old_qty, new_qty, adj_id = c.call('ApplyStockDelta', medicine_id, delta, supplier_id, reason, user)
+    name = c.scalar("SELECT Name FROM Medicines WHERE MedicineID = ?", (medicine_id,))
+    # Logged directly so the movement result is the only result set
+    action = f"Stock {'in' if delta > 0 else 'out'} for {name or ''} (ID: {medicine_id}): {old_qty} -> {new_qty}"
+    c.run("INSERT INTO ActivityLog (UserName, Action) VALUES (?, ?)", (user, action[:200]))
+    c.emit(('AdjustmentID', 'MedicineName', 'OldQty', 'NewQty'), adj_id, name, old_qty, new_qty)
+
+
+@procedure('AddMedicine')
+def _add_medicine(c, name, category, quantity, price, minimum_stock, supplier_id=None, user=None):
+    medicine_id = c.run("""INSERT INTO Medicines (Name, Category, Quantity, Price, MinimumStock, Status, SupplierID)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (name, category, quantity, _money(price), minimum_stock,
+                         _stock_status(quantity, minimum_stock), supplier_id)).lastrowid
+    c.call('AddStockAdjustment', medicine_id, 0, quantity, quantity, supplier_id,
+           'Initial stock on medicine addition', user)
+    c.call('AddActivityLog', user,
+           f'Added new medicine: {name} (ID: {medicine_id}) with initial stock of {quantity}')
+    c.emit(('MedicineID',), medicine_id)
+
+
+@procedure('UpdateMedicine')
+def _update_medicine(c, medicine_id, name=None, category=None, quantity=None, price=None,
+                     minimum_stock=None, supplier_id=None, user=None, expected_rowver=None):
+    # NULL parameters keep the current value; a given @ExpectedRowVer makes it a compare-and-swap
+    row = c.run("""SELECT Name, Category, Quantity, Price, MinimumStock, SupplierID, RowVer
+                   FROM Medicines WHERE MedicineID = ?""", (medicine_id,)).fetchone()
+    if row is None:
+        raise ProcedureError(51001, 'Medicine not found.')
+    if expected_rowver is not None and int(row[6]) != int(expected_rowver):
+        raise ProcedureError(51010, 'Medicine was changed by another user. Reload it and try again.')
+    old_qty = row[2] or 0
+    new = (name if name is not None else row[0],
+           category if category is not None else row[1],
+           quantity if quantity is not None else row[2],
+           _money(price) if price is not None else row[3],
+           minimum_stock if minimum_stock is not None else row[4],
+           supplier_id if supplier_id is not None else row[5])
+    c.run("""UPDATE Medicines SET Name = ?, Category = ?, Quantity = ?, Price = ?, MinimumStock = ?,
+             SupplierID = ?, Status = ? WHERE MedicineID = ?""",
+          new + (_stock_status(new[2], new[4]), medicine_id))
+    new_qty = new[2] or 0
+    if old_qty != new_qty:
+        c.run("""INSERT INTO StockAdjustments (MedicineID, OldQty, NewQty, ChangeQty, SupplierID, Reason, UserName)
+                 VALUES (?, ?, ?, ?, ?, 'Stock adjustment on medicine update', ?)""",
+              (medicine_id, old_qty, new_qty, new_qty - old_qty, new[5], user))
+    c.call('AddActivityLog', user, f'Updated medicine: {new[0]} (ID: {medicine_id})')
+    c.emit(('RowVer',), c.scalar("SELECT RowVer FROM Medicines WHERE MedicineID = ?", (medicine_id,)))
+
+
+@procedure('DeleteMedicineCascade')
+def _delete_medicine_cascade(c, medicine_id, user):
+    for table in ('StockAdjustments', 'Returns', 'SaleItems', 'Medicines'):
+        c.run(f"DELETE FROM {table} WHERE MedicineID = ?", (medicine_id,))
+    c.call('AddActivityLog', user, f'Deleted medicine with ID: {medicine_id}')
+
+
+@procedure('GetMedicineByID', writes=False)
+def _get_medicine_by_id(c, medicine_id):
+    c.select("""SELECT Name, Category, Quantity, MinimumStock, Price, Status, SupplierID, SupplierName, RowVer
+                FROM vw_Medicines WHERE MedicineID = ?""", (medicine_id,))
+
+
+@procedure('GetAllMedicines', writes=False)
+def _get_all_medicines(c):
+    c.select("""SELECT MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate,
+                       SupplierID, SupplierName, RowVer
+                FROM vw_Medicines""")
+
+
+@procedure('GetLowStockItems', writes=False)
+def _get_low_stock_items(c):
+    c.select("""SELECT MedicineID, Name, Category, Quantity, MinimumStock, Price FROM vw_Medicines
+                WHERE Quantity < IFNULL(MinimumStock, 0) ORDER BY (MinimumStock - Quantity) DESC""")
+
+
+@procedure('SearchMedicines', writes=False)
+def _search_medicines(c, query):
+    c.select("""SELECT MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate
+                FROM vw_Medicines
+                WHERE Name LIKE ?1 OR Category LIKE ?1 OR CAST(MedicineID AS TEXT) LIKE ?1
+                ORDER BY Name""", (_like(query) or '%',))
+
+
+@procedure('GetStockAdjustments', writes=False)
+def _get_stock_adjustments(c):
+    c.select("""SELECT AdjustmentID, MedicineID, MedicineName, OldQty, NewQty, ChangeQty, SupplierID,
+                       SupplierName, Reason, UserName, UserFullName, Timestamp
+                FROM vw_StockAdjustments_Detailed""")
+
+
+@procedure('GetStockReportSummary', writes=False)
+def _get_stock_report_summary(c):
+    c.select("""SELECT COUNT(*),
+                       IFNULL(SUM(CAST(Quantity AS INTEGER) * Price), 0),
+                       SUM(CASE WHEN Quantity < IFNULL(MinimumStock, 0) THEN 1 ELSE 0 END)
+                FROM Medicines""")
+
+
+# --- Sales ---
+
+@procedure('CreateSale')
+def _create_sale(c, customer_id, subtotal, tax, total, user, idempotency_key=None):
+    # A resubmitted key returns the sale recorded the first time
+    if idempotency_key is not None:
+        row = c.run("SELECT SaleID, Total FROM Sales WHERE IdempotencyKey = ?", (idempotency_key,)).fetchone()
+        if row is not None:
+            c.emit(('SaleID', 'AlreadyExists', 'Total'), row[0], 1, row[1])
+            return
+    total = _money(total)
+    sale_id = c.run("""INSERT INTO Sales (CustomerID, Subtotal, Tax, Total, UserName, IdempotencyKey)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (customer_id, _money(subtotal), _money(tax), total, user, idempotency_key)).lastrowid
+    c.emit(('SaleID', 'AlreadyExists', 'Total'), sale_id, 0, total)
+
+
+@procedure('AddSaleItem')
+def _add_sale_item(c, sale_id, medicine_id, quantity, price, user=None):
+    c.call('ApplyStockDelta', medicine_id, -quantity, None, f'Sale: {sale_id}', user)
+    c.run("INSERT INTO SaleItems (SaleID, MedicineID, Quantity, Price) VALUES (?, ?, ?, ?)",
+          (sale_id, medicine_id, quantity, _money(price)))
+
+
+@procedure('GetAllSales', writes=False)
+def _get_all_sales(c):
+    c.select("""SELECT SaleID, CustomerID, CustomerName, Subtotal, Tax, Total, Timestamp, UserName, UserFullName
+                FROM vw_Sales_WithInfo""")
+
+
+@procedure('GetAllSaleDetails', writes=False)
+def _get_all_sale_details(c):
+    c.select("SELECT SaleID, MedicineID, MedicineName, Quantity, Price FROM vw_Sales_Details")
+
+
+@procedure('GetSaleByID', writes=False)
+def _get_sale_by_id(c, sale_id):
+    c.select("""SELECT SaleID, CustomerID, CustomerName, Subtotal, Tax, Total, Timestamp, UserName, UserFullName
+                FROM vw_Sales_WithInfo WHERE SaleID = ?""", (sale_id,))
+    c.select("SELECT SaleItemID, MedicineID, Quantity, Price FROM SaleItems WHERE SaleID = ?", (sale_id,))
+
+
+@procedure('GetSaleByIdempotencyKey', writes=False)
+def _get_sale_by_idempotency_key(c, key):
+    c.select("SELECT SaleID, Total FROM Sales WHERE IdempotencyKey = ?", (key,))
+
+
+@procedure('GetSalesReport', writes=False)
+def _get_sales_report(c, period='today'):
+    period = (period or '').lower()
+    if period == 'today':
+        start = "date('now', 'localtime')"
+    elif period == 'week':
+        start = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '-7 days')"
+    else:
+        start = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '-30 days')"
+    c.select(f"""SELECT SaleID, CustomerID, CustomerName, Subtotal, Tax, Total, Timestamp
+                 FROM vw_Sales_WithInfo WHERE Timestamp >= {start} ORDER BY Timestamp DESC""")
+
+
+@procedure('GetDashboardStats', writes=False)
+def _get_dashboard_stats(c):
+    c.select("""SELECT (SELECT COUNT(*) FROM Medicines),
+                       (SELECT COUNT(*) FROM Medicines WHERE Quantity < IFNULL(MinimumStock, 0)),
+                       (SELECT COUNT(*) FROM Sales WHERE Timestamp >= date('now', 'localtime')),
+                       (SELECT IFNULL(SUM(Total), 0) FROM Sales WHERE Timestamp >= date('now', 'localtime'))""")
+
+
+# --- Returns ---
+
+@procedure('AddReturn')
+def _add_return(c, medicine_id, quantity, unit_price, amount, sale_id, customer_id, reason, user):
+    if quantity is None or quantity <= 0:
+        raise ProcedureError(51003, 'Return quantity must be positive.')
+    if sale_id is not None:
+        sold = c.scalar("SELECT IFNULL(SUM(Quantity), 0) FROM SaleItems WHERE SaleID = ? AND MedicineID = ?",
+                        (sale_id, medicine_id))
+        if not sold:
+            raise ProcedureError(51004, 'No sold quantity found for this sale and medicine.')
+        if quantity > sold:
+            raise ProcedureError(51005, 'Return quantity exceeds the sold quantity for this sale item.')
+    if c.scalar("SELECT 1 FROM Medicines WHERE MedicineID = ?", (medicine_id,)) is None:
+        raise ProcedureError(51002, 'Medicine not found for return.')
+    return_id = c.run("""INSERT INTO Returns (MedicineID, Quantity, UnitPrice, Amount, SaleID, CustomerID, Reason, UserName)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                      (medicine_id, quantity, _money(unit_price), _money(amount), sale_id, customer_id,
+                       reason, user)).lastrowid
+    adj_reason = f'Return: {return_id}'
+    if reason and reason.strip():
+        adj_reason += f' - {reason}'
+    c.call('ApplyStockDelta', medicine_id, quantity, None, adj_reason, user)
+    if sale_id is not None:
+        # Take the returned quantity off the sale and recalculate its totals
+        c.run("""UPDATE SaleItems SET Quantity = CASE WHEN Quantity > ?1 THEN Quantity - ?1 ELSE 0 END
+                 WHERE SaleID = ?2 AND MedicineID = ?3""", (quantity, sale_id, medicine_id))
+        c.run("DELETE FROM SaleItems WHERE SaleID = ? AND MedicineID = ? AND Quantity = 0", (sale_id, medicine_id))
+        subtotal = c.scalar("SELECT IFNULL(SUM(Quantity * Price), 0) FROM SaleItems WHERE SaleID = ?", (sale_id,))
+        tax_rate = c.scalar("SELECT IFNULL(tax_rate, 0) FROM Settings LIMIT 1") or 0
+        tax = round(subtotal * tax_rate / 100.0, 2)
+        c.run("UPDATE Sales SET Subtotal = ?, Tax = ?, Total = ? WHERE SaleID = ?",
+              (_money(subtotal), tax, _money(subtotal + tax), sale_id))
+    c.call('AddActivityLog', user, f'Added return with ID: {return_id}')
+    c.emit(('ReturnID',), return_id)
+
+
+@procedure('GetAllReturns', writes=False)
+def _get_all_returns(c):
+    c.select("""SELECT ReturnID, SaleID, MedicineID, MedicineName, Quantity, UnitPrice, Amount, CustomerID,
+                       CustomerName, Reason, Timestamp, UserName
+                FROM vw_Returns_Detailed""")
+
+
+# --- Customers ---
+
+@procedure('AddCustomer')
+def _add_customer(c, name, phone, email, user):
+    if not (phone or '').strip() or not (email or '').strip():
+        raise ProcedureError(51006, 'Phone and Email are required and cannot be empty.')
+    customer_id = c.run("INSERT INTO Customers (Name, Phone, Email) VALUES (?, ?, ?)",
+                        (name, phone, email)).lastrowid
+    c.call('AddActivityLog', user, f'Added new customer: {name}')
+    c.emit(('CustomerID',), customer_id)
+
+
+@procedure('UpdateCustomer')
+def _update_customer(c, customer_id, name, phone, email, user):
+    c.run("UPDATE Customers SET Name = ?, Phone = ?, Email = ? WHERE CustomerID = ?",
+          (name, phone, email, customer_id))
+    c.call('AddActivityLog', user, f'Updated customer: {name} (ID: {customer_id})')
+
+
+@procedure('DeleteCustomer')
+def _delete_customer(c, customer_id, user):
+    c.run("UPDATE Sales SET CustomerID = NULL WHERE CustomerID = ?", (customer_id,))
+    c.run("UPDATE Returns SET CustomerID = NULL WHERE CustomerID = ?", (customer_id,))
+    c.run("DELETE FROM Customers WHERE CustomerID = ?", (customer_id,))
+    c.call('AddActivityLog', user, f'Deleted customer with ID: {customer_id}')
+
+
+@procedure('GetAllCustomers', writes=False)
+def _get_all_customers(c):
+    c.select("SELECT CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases FROM vw_Customers")
+
+
+@procedure('GetCustomerByID', writes=False)
+def _get_customer_by_id(c, customer_id):
+    c.select("""SELECT CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases
+                FROM Customers WHERE CustomerID = ?""", (customer_id,))
+
+
+@procedure('SearchCustomers', writes=False)
+def _search_customers(c, query):
+    c.select("""SELECT CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases FROM vw_Customers
+                WHERE Name LIKE ?1 OR Phone LIKE ?1 OR Email LIKE ?1 OR CAST(CustomerID AS TEXT) LIKE ?1
+                ORDER BY Name""", (_like(query) or '%',))
+
+
+@procedure('GetCustomersReport', writes=False)
+def _get_customers_report(c):
+    c.select("SELECT COUNT(*), IFNULL(SUM(TotalPurchases), 0) FROM Customers")
+    c.select("SELECT CustomerID, Name, TotalPurchases FROM Customers ORDER BY TotalPurchases DESC LIMIT 10")
+
+
+# --- Suppliers ---
+
+@procedure('AddSupplier')
+def _add_supplier(c, name, company, phone, email, active, user):
+    supplier_id = c.run("INSERT INTO Suppliers (Name, Company, Phone, Email, Active) VALUES (?, ?, ?, ?, ?)",
+                        (name, company, phone, email, active)).lastrowid
+    c.call('AddActivityLog', user, f'Added new supplier: {name}')
+    c.emit(('SupplierID',), supplier_id)
+
+
+@procedure('UpdateSupplier')
+def _update_supplier(c, supplier_id, name, company, phone, email, active, user):
+    c.run("UPDATE Suppliers SET Name = ?, Company = ?, Phone = ?, Email = ?, Active = ? WHERE SupplierID = ?",
+          (name, company, phone, email, active, supplier_id))
+    c.call('AddActivityLog', user, f'Updated supplier: {name} (ID: {supplier_id})')
+
+
+@procedure('ToggleSupplierStatus')
+def _toggle_supplier_status(c, supplier_id, user):
+    c.run("UPDATE Suppliers SET Active = CASE WHEN Active = 1 THEN 0 ELSE 1 END WHERE SupplierID = ?",
+          (supplier_id,))
+    c.call('AddActivityLog', user, f'Toggled active status for supplier ID: {supplier_id}')
+    c.select("SELECT Active FROM Suppliers WHERE SupplierID = ?", (supplier_id,))
+
+
+@procedure('DeleteSupplier')
+def _delete_supplier(c, supplier_id, user):
+    c.run("UPDATE Medicines SET SupplierID = NULL WHERE SupplierID = ?", (supplier_id,))
+    c.run("UPDATE StockAdjustments SET SupplierID = NULL WHERE SupplierID = ?", (supplier_id,))
+    c.run("DELETE FROM Suppliers WHERE SupplierID = ?", (supplier_id,))
+    c.call('AddActivityLog', user, f'Deleted supplier with ID: {supplier_id}')
+
+
+@procedure('GetAllSuppliers', writes=False)
+def _get_all_suppliers(c):
+    c.select("SELECT SupplierID, Name, Company, Phone, Email, Active, CreatedDate FROM vw_Suppliers")
+
+
+@procedure('SearchSuppliers', writes=False)
+def _search_suppliers(c, query):
+    c.select("""SELECT SupplierID, Name, Company, Phone, Email, Active, CreatedDate FROM vw_Suppliers
+                WHERE Name LIKE ?1 OR Company LIKE ?1 OR Phone LIKE ?1 OR Email LIKE ?1
+                   OR CAST(SupplierID AS TEXT) LIKE ?1
+                ORDER BY Name""", (_like(query) or '%',))
+
+
+# --- Users ---
+
+@procedure('AddUser')
+def _add_user(c, username, full_name, password_hash, role, active=1, email=None, phone=None):
+    c.run("""INSERT INTO Users (Username, FullName, PasswordHash, Role, Active, Email, Phone)
+             VALUES (?, ?, ?, ?, ?, ?, ?)""", (username, full_name, password_hash, role, active, email, phone))
+    c.call('AddActivityLog', 'admin', f'Added new user: {username}')
+
+
+@procedure('UpdateUser')
+def _update_user(c, username, full_name=None, password_hash=None, role=None, active=None, email=None, phone=None):
+    c.run("""UPDATE Users SET FullName = COALESCE(?, FullName), PasswordHash = COALESCE(?, PasswordHash),
+                 Role = COALESCE(?, Role), Active = COALESCE(?, Active), Email = COALESCE(?, Email),
+                 Phone = COALESCE(?, Phone)
+             WHERE Username = ?""", (full_name, password_hash, role, active, email, phone, username))
+    c.call('AddActivityLog', 'admin', f'Updated user: {username}')
+
+
+@procedure('ToggleUserStatus')
+def _toggle_user_status(c, username):
+    c.run("UPDATE Users SET Active = CASE WHEN Active = 1 THEN 0 ELSE 1 END WHERE Username = ?", (username,))
+    c.call('AddActivityLog', 'admin', f'Toggled active status for user: {username}')
+    c.select("SELECT Active FROM Users WHERE Username = ?", (username,))
+
+
+@procedure('DeleteUser')
+def _delete_user(c, username):
+    # Keep history rows valid by pointing them at a placeholder user
+    if c.scalar("SELECT 1 FROM Users WHERE Username = 'removed'") is None:
+        c.run("""INSERT INTO Users (Username, FullName, PasswordHash, Role, Active, Email, Phone)
+                 VALUES ('removed', 'Removed User', '', 'system', 0, '', '')""")
+    for table in ('Sales', 'Returns', 'StockAdjustments', 'ActivityLog'):
+        c.run(f"UPDATE {table} SET UserName = 'removed' WHERE UserName = ?", (username,))
+    c.run("DELETE FROM Users WHERE Username = ?", (username,))
+    c.call('AddActivityLog', 'admin', f'Deleted user: {username}')
+
+
+@procedure('GetAllUsers', writes=False)
+def _get_all_users(c):
+    c.select("SELECT Username, FullName, PasswordHash, Role, Active, Email, Phone FROM vw_Users")
+
+
+@procedure('SearchUsers', writes=False)
+def _search_users(c, query):
+    c.select("""SELECT Username, FullName, PasswordHash, Role, Active, Email, Phone FROM vw_Users
+                WHERE Username LIKE ?1 OR FullName LIKE ?1 OR Email LIKE ?1 OR Phone LIKE ?1
+                ORDER BY Username""", (_like(query) or '%',))
+
+
+# --- Paged list reads ---
+# As in pharmacy.sql: the sort column is looked up in a whitelist (anything else
+# falls back to the default) and the key column breaks ties.
+
+def _page(c, view, columns, search_columns, sorts, default_sort, key, offset, limit, sort_column, sort_desc, search):
+    col = sort_column if sort_column in sorts else default_sort
+    direction = 'DESC' if sort_desc else 'ASC'
+    where = ' OR '.join(f'{s} LIKE ?1' for s in search_columns)
+    c.select(f"""SELECT {columns} FROM {view}
+                 WHERE ?1 IS NULL OR {where}
+                 ORDER BY "{col}" {direction}, {key} {direction}
+                 LIMIT ?3 OFFSET ?2""", (_like(search), offset or 0, limit if limit is not None else 100))
+
+
+@procedure('GetMedicinesPage', writes=False)
+def _get_medicines_page(c, offset=0, limit=100, sort_column='Name', sort_desc=0, search=None):
+    _page(c, 'vw_Medicines',
+          'MedicineID, Name, Category, Quantity, Price, MinimumStock, Status, CreatedDate, SupplierID, SupplierName, RowVer',
+          ('Name', 'Category', 'CAST(MedicineID AS TEXT)'),
+          ('MedicineID', 'Name', 'Category', 'SupplierName', 'Quantity', 'MinimumStock', 'Price', 'CreatedDate'),
+          'Name', 'MedicineID', offset, limit, sort_column, sort_desc, search)
+
+
+@procedure('GetCustomersPage', writes=False)
+def _get_customers_page(c, offset=0, limit=100, sort_column='Name', sort_desc=0, search=None):
+    _page(c, 'vw_Customers', 'CustomerID, Name, Phone, Email, CreatedDate, TotalPurchases',
+          ('Name', 'Phone', 'Email', 'CAST(CustomerID AS TEXT)'),
+          ('CustomerID', 'Name', 'Phone', 'Email', 'TotalPurchases', 'CreatedDate'),
+          'Name', 'CustomerID', offset, limit, sort_column, sort_desc, search)
+
+
+@procedure('GetSuppliersPage', writes=False)
+def _get_suppliers_page(c, offset=0, limit=100, sort_column='Name', sort_desc=0, search=None):
+    _page(c, 'vw_Suppliers', 'SupplierID, Name, Company, Phone, Email, Active, CreatedDate',
+          ('Name', 'Company', 'Phone', 'Email', 'CAST(SupplierID AS TEXT)'),
+          ('SupplierID', 'Name', 'Company', 'Phone', 'Email', 'Active', 'CreatedDate'),
+          'Name', 'SupplierID', offset, limit, sort_column, sort_desc, search)
+
+
+@procedure('GetUsersPage', writes=False)
+def _get_users_page(c, offset=0, limit=100, sort_column='Username', sort_desc=0, search=None):
+    _page(c, 'vw_Users', 'Username, FullName, PasswordHash, Role, Active, Email, Phone',
+          ('Username', 'FullName', 'Email', 'Phone', 'Role',
+           "(CASE WHEN Active = 1 THEN 'Active' ELSE 'Inactive' END)"),
+          ('Username', 'FullName', 'Phone', 'Email', 'Role', 'Active'),
+          'Username', 'Username', offset, limit, sort_column, sort_desc, search)
+
+
+@procedure('GetReturnsPage', writes=False)
+def _get_returns_page(c, offset=0, limit=100, sort_column='Timestamp', sort_desc=1, search=None):
+    _page(c, 'vw_Returns_Detailed',
+          'ReturnID, SaleID, MedicineID, MedicineName, Quantity, UnitPrice, Amount, CustomerID, CustomerName, '
+          'Reason, Timestamp, UserName',
+          ('MedicineName', 'CustomerName', 'Reason', 'CAST(ReturnID AS TEXT)', 'CAST(SaleID AS TEXT)'),
+          ('ReturnID', 'MedicineName', 'Quantity', 'Amount', 'SaleID', 'CustomerName', 'Reason', 'Timestamp'),
+          'Timestamp', 'ReturnID', offset, limit, sort_column, sort_desc, search)
+
+
+# ---------------- DB-API surface ----------------
+
+_EXEC = re.compile(r'^\s*EXEC(?:UTE)?\s+(?:dbo\.)?(\w+)\s*(.*?)\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+
+
+class SQLiteCursor:
+    """Cursor with the subset of the pyodbc API the backend uses: execute()
+    returning the cursor, fetchone/fetchmany/fetchall, nextset and description."""
+
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+        self._results = []
+        self._rows = iter(())
+        self.description = None
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        self._results = self.connection._execute(sql, params)
+        self._next_result()
+        return self
+
+    def _next_result(self):
+        if self._results:
+            self.description, rows = self._results.pop(0)
+            self._rows = iter(rows)
+            return True
+        self.description, self._rows = None, iter(())
+        return False
+
+    def _fetch(self, fn):
+        try:
+            return fn()
+        except sqlite3.Error as e:
+            raise _database_error(e) from e
+
+    def fetchone(self):
+        return self._fetch(lambda: next(self._rows, None))
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        return self._fetch(lambda: [row for _, row in zip(range(size), self._rows)])
+
+    def fetchall(self):
+        return self._fetch(lambda: list(self._rows))
+
+    def nextset(self):
+        return self._next_result()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def cancel(self):
+        # pyodbc's Cursor.cancel; safe to call from another thread
+        self.connection.interrupt()
+
+    def close(self):
+        self._results = []
+        self._rows = iter(())
+
+
+class SQLiteConnection:
+    """A pyodbc-like connection over one sqlite3 connection.
+
+    With autocommit on, every EXEC is its own transaction. With autocommit off
+    (PharmacyBackend.run_transaction) the first writing procedure opens a
+    BEGIN IMMEDIATE transaction that lasts until commit() or rollback(); reads
+    before that do not take the write lock. Each procedure also runs inside a
+    savepoint, so one that fails leaves no partial changes behind.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._autocommit = True
+        self.timeout = 0
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        # Like ODBC, switching autocommit back on commits the open transaction
+        if value and not self._autocommit:
+            self.commit()
+        self._autocommit = bool(value)
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def _check_open(self):
+        if self._db is None:
+            raise OperationalError('08003', '[08003] [SQLite]Connection is closed')
+
+    def _execute(self, sql, params):
+        self._check_open()
+        match = _EXEC.match(sql)
+        try:
+            if match is None:
+                # Plain SQL (ad hoc queries, benchmarks): run as-is, one result set
+                cur = self._db.execute(sql, params)
+                return [(cur.description, cur)] if cur.description else []
+            return self._call(match.group(1), match.group(2), params)
+        except ProcedureError as e:
+            raise _database_error(e) from None
+        except sqlite3.Error as e:
+            raise _database_error(e) from e
+
+    def _call(self, name, arg_text, params):
+        entry = PROCEDURES.get(name)
+        if entry is None:
+            raise ProcedureError(2812, f"Could not find stored procedure '{name}'.")
+        fn, writes = entry
+        if arg_text.count('?') != len(params):
+            raise ProcedureError(8144, f'Procedure or function {name} has too many arguments specified.')
+        db = self._db
+        call = _Call(db, lazy=not writes)
+        if not writes:
+            # Reads stream straight from their SQLite statements; nothing to undo
+            self._invoke(name, fn, call, params)
+            return call.results
+        began = not db.in_transaction
+        if began:
+            db.execute("BEGIN IMMEDIATE")
+        savepoint = f'sp_{uuid.uuid4().hex[:8]}'
+        db.execute(f"SAVEPOINT {savepoint}")
+        try:
+            self._invoke(name, fn, call, params)
+            db.execute(f"RELEASE {savepoint}")
+        except BaseException:
+            db.execute(f"ROLLBACK TO {savepoint}")
+            db.execute(f"RELEASE {savepoint}")
+            if began and self._autocommit:
+                db.execute("ROLLBACK")
+            raise
+        if began and self._autocommit:
+            db.execute("COMMIT")
+        return call.results
+
+    @staticmethod
+    def _invoke(name, fn, call, params):
+        try:
+            fn(call, *params)
+        except TypeError as e:
+            raise ProcedureError(8144, f'Procedure or function {name}: {e}') from e
+
+    def interrupt(self):
+        """Abort whatever statement is running on this connection (any thread)."""
+        self._check_open()
+        self._db.interrupt()
+
+    def commit(self):
+        self._check_open()
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        self._check_open()
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _ensure_schema(db, path):
+    # Create the schema once per file (per process); concurrent first
+    # connections serialize on the write lock and re-check the version
+    key = os.path.abspath(path) if path != ':memory:' else None
+    with _init_lock:
+        if key is not None and key in _initialized:
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                for statement in _split_script(SCHEMA):
+                    db.execute(statement)
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if key is not None:
+            _initialized.add(key)
+
+
+def _split_script(script):
+    # executescript() would commit our transaction; split on complete statements instead
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        if line.lstrip().startswith('--'):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+
+def connect_sqlite(path=':memory:', lock_timeout_ms=5000):
+    """Open a connection to the SQLite database at `path`, creating the schema
+    (with the seed admin user and default settings) on first use. Note that
+    every ':memory:' connection is a separate, empty database."""
+    try:
+        db = sqlite3.connect(path, timeout=max(lock_timeout_ms, 0) / 1000.0, isolation_level=None,
+                             detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        for pragma in PRAGMAS:
+            db.execute(pragma)
+        _ensure_schema(db, path)
+    except sqlite3.Error as e:
+        raise OperationalError('08001', f'[08001] [SQLite]{e}') from e
+    return SQLiteConnection(db)
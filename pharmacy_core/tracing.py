@@ -0,0 +1,459 @@
+"""Per-statement query tracing.
+
+QueryTracer.wrap() puts a thin proxy around a DB-API connection whose cursors
+time every statement: the execute call, the fetches that follow it and the
+rows they return. Statements are grouped by name (the procedure of an EXEC,
+otherwise the verb and table) into latency histograms, and each one slower
+than the threshold is appended to the slow-query log. Only the shape of the
+parameters (their types) is recorded, never their values.
+
+QueryTracer.action() scopes the statements of one user action (a click, a
+view being shown) on the current thread, so actions that make more round-trips
+than their budget or run the same statement in a loop (N+1) are flagged.
+"""
+import re
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (ms) of the latency histogram buckets; slower calls land in the last, open bucket
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Slow statements kept in memory for the diagnostics panel
+RECENT_SLOW = 200
+
+_EXEC_RE = re.compile(r'^\s*EXEC(?:UTE)?\s+([\w.\[\]]+)', re.IGNORECASE)
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+([\w.\[\]]+)', re.IGNORECASE)
+
+
+def statement_name(sql):
+    """'EXEC GetSalesPage ?, ?' -> 'GetSalesPage'; 'SELECT ... FROM Sales' -> 'SELECT Sales'."""
+    match = _EXEC_RE.match(sql)
+    if match:
+        return match.group(1).replace('[', '').replace(']', '')
+    words = sql.split(None, 1)
+    verb = words[0].upper() if words else '?'
+    table = _TABLE_RE.search(sql)
+    return f"{verb} {table.group(1).replace('[', '').replace(']', '')}" if table else verb
+
+
+def param_shape(params):
+    """The parameter types of one execute call, e.g. '(int, str, None)'."""
+    if len(params) == 1 and isinstance(params[0], (tuple, list)):
+        params = params[0]
+    return '(' + ', '.join('None' if p is None else type(p).__name__ for p in params) + ')'
+
+
+class StatementStats:
+    """Counters and latency histogram of one statement name."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.fetch_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.shapes = {}
+
+    def add(self, wall_ms, fetch_ms, rows, shape, error):
+        self.calls += 1
+        self.errors += 1 if error else 0
+        self.rows += rows
+        self.total_ms += wall_ms
+        self.fetch_ms += fetch_ms
+        self.max_ms = max(self.max_ms, wall_ms)
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS_MS) and wall_ms > HISTOGRAM_BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def percentile(self, pct):
+        # Upper bound of the bucket holding the pct-th call (the max for the open bucket)
+        if not self.calls:
+            return 0.0
+        target = pct / 100.0 * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return float(HISTOGRAM_BOUNDS_MS[index]) if index < len(HISTOGRAM_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'fetch_ms': round(self.fetch_ms, 3),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 3),
+            'histogram': list(zip([str(b) for b in HISTOGRAM_BOUNDS_MS] + ['inf'], self.buckets)),
+            'shapes': dict(self.shapes),
+        }
+
+
+class ActionTrace:
+    """The statements run during one action (see QueryTracer.action)."""
+
+    def __init__(self, name, budget, repeat_limit):
+        self.name = name
+        self.budget = budget
+        self.repeat_limit = repeat_limit
+        self.statements = Counter()
+        self.elapsed_ms = 0.0
+
+    @property
+    def round_trips(self):
+        return sum(self.statements.values())
+
+    @property
+    def over_budget(self):
+        return bool(self.budget) and self.round_trips > self.budget
+
+    def repeated(self):
+        """[(statement, count)] of the statements run `repeat_limit` times or more."""
+        if not self.repeat_limit:
+            return []
+        return [(name, n) for name, n in self.statements.most_common() if n >= self.repeat_limit]
+
+    @property
+    def flagged(self):
+        return self.over_budget or bool(self.repeated())
+
+
+class QueryTracer:
+    """Collects the statement timings of every connection it wrapped (thread-safe).
+    Statements slower than `slow_ms` (0 disables the log) are appended to
+    `log_path` and kept in `recent_slow`. Actions making more than
+    `round_trip_budget` round-trips, or repeating one statement `repeat_limit`
+    times, are logged there too and kept in `recent_flagged`."""
+
+    def __init__(self, slow_ms=250, log_path=None, round_trip_budget=20, repeat_limit=5):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.round_trip_budget = round_trip_budget
+        self.repeat_limit = repeat_limit
+        self.stats = {}
+        self.timings = {}      # end-to-end operation timings reported with observe()
+        self.actions = {}
+        self.recent_slow = deque(maxlen=RECENT_SLOW)
+        self.recent_flagged = deque(maxlen=RECENT_SLOW)
+        self.started = datetime.now()
+        # Re-entrant: a cursor garbage collected while this thread holds it records from __del__
+        self._lock = threading.RLock()
+        self._cursors = weakref.WeakSet()
+        self._connections = weakref.WeakSet()
+        self.connections_opened = 0
+        self._local = threading.local()
+
+    def wrap(self, conn):
+        traced = TracedConnection(conn, self)
+        with self._lock:
+            self._connections.add(traced)
+            self.connections_opened += 1
+        return traced
+
+    def open_connections(self):
+        """Wrapped connections not yet closed (or garbage collected)."""
+        with self._lock:
+            return len(self._connections)
+
+    def observe(self, name, elapsed_ms):
+        """Add one end-to-end timing of operation `name` (e.g. a sale commit)."""
+        with self._lock:
+            stats = self.timings.get(name)
+            if stats is None:
+                stats = self.timings[name] = StatementStats(name)
+            stats.add(elapsed_ms, 0.0, 0, '', None)
+
+    def record(self, name, shape, exec_ms, fetch_ms, rows, error=None):
+        wall_ms = exec_ms + fetch_ms
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = StatementStats(name)
+            stats.add(wall_ms, fetch_ms, rows, shape, error)
+            slow = self.slow_ms and wall_ms >= self.slow_ms
+            if slow:
+                entry = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'name': name, 'shape': shape,
+                         'wall_ms': round(wall_ms, 1), 'exec_ms': round(exec_ms, 1),
+                         'fetch_ms': round(fetch_ms, 1), 'rows': rows, 'error': error}
+                self.recent_slow.append(entry)
+        if slow and self.log_path:
+            self._write_slow(entry)
+
+    def _write_slow(self, entry):
+        line = (f"{entry['time']}  {entry['wall_ms']:>9.1f} ms  (exec {entry['exec_ms']:.1f}, "
+                f"fetch {entry['fetch_ms']:.1f})  rows={entry['rows']}  {entry['name']} {entry['shape']}")
+        if entry['error']:
+            line += f"  error={entry['error']}"
+        self._write_log(line)
+
+    def _write_log(self, line):
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError:
+            pass
+
+    # --- Round-trips per action ---
+
+    @contextmanager
+    def action(self, name, budget=None):
+        """Count the statements run on this thread until the block exits:
+
+            with tracer.action('show_dashboard') as action:
+                ...
+            action.round_trips, action.statements
+
+        Nested actions count into the innermost one only. `budget` overrides
+        round_trip_budget for this action."""
+        trace = ActionTrace(name, self.round_trip_budget if budget is None else budget, self.repeat_limit)
+        stack = self._local.__dict__.setdefault('actions', [])
+        stack.append(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            stack.pop()
+            trace.elapsed_ms = (time.perf_counter() - started) * 1000.0
+            if trace.statements:
+                self._end_action(trace)
+
+    def _count(self, name):
+        stack = self._local.__dict__.get('actions')
+        if stack:
+            stack[-1].statements[name] += 1
+
+    def _end_action(self, trace):
+        trips = trace.round_trips
+        repeated = trace.repeated()
+        with self._lock:
+            stats = self.actions.get(trace.name)
+            if stats is None:
+                stats = self.actions[trace.name] = {'name': trace.name, 'runs': 0, 'round_trips': 0, 'last': 0,
+                                                    'max': 0, 'over_budget': 0, 'repeats': 0, 'worst': {}}
+            stats['runs'] += 1
+            stats['round_trips'] += trips
+            stats['last'] = trips
+            stats['over_budget'] += 1 if trace.over_budget else 0
+            stats['repeats'] += 1 if repeated else 0
+            if trips >= stats['max']:
+                stats['max'] = trips
+                stats['worst'] = dict(trace.statements)
+            if trace.flagged:
+                entry = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'name': trace.name,
+                         'round_trips': trips, 'budget': trace.budget, 'repeated': repeated,
+                         'elapsed_ms': round(trace.elapsed_ms, 1)}
+                self.recent_flagged.append(entry)
+        if trace.flagged and self.log_path:
+            line = f"{entry['time']}  ROUND-TRIPS {trace.name}: {trips} (budget {trace.budget or 'off'})"
+            if repeated:
+                line += '  repeated: ' + ', '.join(f'{n} x{c}' for n, c in repeated)
+            self._write_log(line)
+
+    def action_stats(self):
+        """Round-trips per action name, most expensive run first. Each entry has
+        runs, round_trips (total), last, max, over_budget and repeats (runs
+        flagged), and worst: the statement counts of the most expensive run."""
+        with self._lock:
+            rows = [dict(a, worst=dict(a['worst'])) for a in self.actions.values()]
+        rows.sort(key=lambda a: a['max'], reverse=True)
+        return rows
+
+    def flagged_actions(self):
+        with self._lock:
+            return list(reversed(self.recent_flagged))
+
+    def flush(self):
+        """Close the statements still open on this thread's live cursors (and
+        on those of threads that have ended) so they are counted. Other threads'
+        statements may still be fetching and are left alone; they are counted
+        when they finish."""
+        idents = {t.ident for t in threading.enumerate()}
+        idents.discard(threading.get_ident())
+        with self._lock:
+            cursors = [c for c in self._cursors if c._thread not in idents]
+        for cursor in cursors:
+            cursor._finish()
+
+    def export(self):
+        """Copies of the statement and operation stats, taken under the lock
+        and without flushing, so any thread (e.g. a metrics scrape) may call it:
+        {'statements': [...], 'timings': [...]}, each a list of tuples
+        (name, buckets, total_ms, errors, rows)."""
+        with self._lock:
+            return {
+                'statements': [(s.name, list(s.buckets), s.total_ms, s.errors, s.rows)
+                               for s in self.stats.values()],
+                'timings': [(t.name, list(t.buckets), t.total_ms, t.errors, t.rows)
+                            for t in self.timings.values()],
+            }
+
+    def snapshot(self, sort='total_ms', limit=None):
+        """Per-statement stats as dicts, worst first by `sort`."""
+        self.flush()
+        with self._lock:
+            rows = [s.as_dict() for s in self.stats.values()]
+        rows.sort(key=lambda r: r[sort], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self.recent_slow))
+
+    def reset(self):
+        self.flush()
+        with self._lock:
+            self.stats.clear()
+            self.timings.clear()
+            self.actions.clear()
+            self.recent_slow.clear()
+            self.recent_flagged.clear()
+            self.started = datetime.now()
+
+
+class TracedConnection:
+    """Connection proxy whose cursors report to a QueryTracer."""
+
+    def __init__(self, conn, tracer):
+        self._conn = conn
+        self._tracer = tracer
+
+    def cursor(self):
+        return TracedCursor(self._conn.cursor(), self._tracer)
+
+    def execute(self, sql, *params):
+        cursor = self.cursor()
+        return cursor.execute(sql, *params)
+
+    def close(self):
+        with self._tracer._lock:
+            self._tracer._connections.discard(self)
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # autocommit, timeout, ... belong to the wrapped connection
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+
+class TracedCursor:
+    """Cursor proxy timing each statement from execute until the next one
+    (or close / the last result set), fetches included."""
+
+    def __init__(self, cur, tracer):
+        self._cur = cur
+        self._tracer = tracer
+        self._open = None      # [name, shape, exec_ms, fetch_ms, rows] of the current statement
+        self._thread = threading.get_ident()    # the thread that ran the current statement
+        self._lock = threading.Lock()
+        with tracer._lock:
+            tracer._cursors.add(self)
+
+    def _finish(self):
+        with self._lock:
+            current, self._open = self._open, None
+        if current is not None:
+            self._tracer.record(*current)
+
+    def _run(self, method, sql, params, shape):
+        self._finish()
+        name = statement_name(sql)
+        self._tracer._count(name)
+        started = time.perf_counter()
+        try:
+            method(sql, *params)
+        except Exception as e:
+            self._tracer.record(name, shape, (time.perf_counter() - started) * 1000.0, 0.0, 0,
+                                error=type(e).__name__)
+            raise
+        with self._lock:
+            self._open = [name, shape, (time.perf_counter() - started) * 1000.0, 0.0, 0]
+            self._thread = threading.get_ident()
+        return self
+
+    def execute(self, sql, *params):
+        return self._run(self._cur.execute, sql, params, param_shape(params))
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        shape = f'{len(seq_of_params)} x ' + (param_shape((seq_of_params[0],)) if seq_of_params else '()')
+        return self._run(self._cur.executemany, sql, (seq_of_params,), shape)
+
+    def _fetched(self, started, rows):
+        with self._lock:
+            if self._open is not None:
+                self._open[3] += (time.perf_counter() - started) * 1000.0
+                self._open[4] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cur.fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *size):
+        started = time.perf_counter()
+        rows = self._cur.fetchmany(*size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cur.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchval(self):
+        row = self.fetchone()
+        return None if row is None else row[0]
+
+    def nextset(self):
+        started = time.perf_counter()
+        more = self._cur.nextset()
+        self._fetched(started, 0)
+        if not more:
+            self._finish()
+        return more
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __del__(self):
+        # A cursor dropped without close() still counts its last statement
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def close(self):
+        self._finish()
+        with self._tracer._lock:
+            self._tracer._cursors.discard(self)
+        self._cur.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cur, name, value)